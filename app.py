@@ -1,12 +1,39 @@
 import os
+import base64
+import hmac
 import requests
 import json
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from flask import Flask, render_template, redirect, url_for, request, flash, jsonify, make_response
+from functools import wraps
+from flask import Flask, Response, render_template, redirect, url_for, request, flash, jsonify, make_response, stream_with_context, has_request_context
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager, UserMixin, login_user, login_required, logout_user, current_user
 from flask_bcrypt import Bcrypt
 from werkzeug.middleware.proxy_fix import ProxyFix
+from llm_client import DEFAULT_REFERER, UpstreamClient, iter_deltas
+from response_cache import cache_key, create_cache, normalize_text
+from sqlalchemy import event
+from sqlalchemy.exc import OperationalError
+from write_behind import WriteBehindQueue
+from db_profile import apply_profile, engine_options
+from conversation import create_conversation_store, valid_session_id
+from user_cache import create_user_cache
+from resilience import CircuitOpenError, ResiliencePolicy, call_with_resilience
+from model_router import ModelRouter
+from singleflight import SingleFlight, request_key
+from precheck import LEXICON_DIR, PreChecker
+from incremental import SentencePlan, distribute, split_sentences
+from metrics import CONTENT_TYPE, ENVIRON_KEY, AppMetrics, RequestStats
+from logs import configure_logging, get_logger
+from profiler import PROFILE_HEADER, PROFILE_KEY, Profiler
+from password_hashing import HashingBusy, PasswordHasher
+from spaced_repetition import MAX_GRADE, START_EASE, review_points, schedule
+from speculation import SpeculationStore
+from leaderboard import Leaderboard, week_start
+from data_transfer import ACTIVITY_EXPORT_FIELDS, CONTENT_TYPES, EXTENSIONS, VOCABULARY_EXPORT_FIELDS, encode, format_for, read_vocabulary
+from vocabulary_search import VocabularySearch, install_search_index
 
 TRANSLATIONS = {
     'en': {
@@ -369,9 +396,129 @@ def get_lang_dir(lang):
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'deutschai-secret-key-x7k2p9m4q1r8v5w3'
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///deutschai.db'
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///deutschai.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
+# Connection tuning (see db_profile.py): 'production' enables WAL and friends on SQLite, 'default' leaves it alone
+app.config['DB_PROFILE'] = os.environ.get('DB_PROFILE', 'production')
+app.config['DB_POOL_SIZE'] = int(os.environ.get('DB_POOL_SIZE', 10))
+app.config['DB_MAX_OVERFLOW'] = int(os.environ.get('DB_MAX_OVERFLOW', 10))
+app.config['DB_POOL_TIMEOUT'] = float(os.environ.get('DB_POOL_TIMEOUT', 30))
+app.config['SQLITE_MMAP_SIZE'] = int(os.environ.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024))
+app.config['SQLITE_CACHE_SIZE_KB'] = int(os.environ.get('SQLITE_CACHE_SIZE_KB', 64 * 1024))
+app.config['SQLITE_BUSY_TIMEOUT_MS'] = int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 5000))
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config)
+
+# Upstream LLM (OpenRouter) client settings, one connection pool per worker
+app.config['OPENROUTER_API_URL'] = os.environ.get('OPENROUTER_API_URL', 'https://openrouter.ai/api/v1/chat/completions')
+app.config['OPENROUTER_API_KEY'] = os.environ.get('OPENROUTER_API_KEY', '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')
+app.config['LLM_POOL_SIZE'] = int(os.environ.get('LLM_POOL_SIZE', 10))
+app.config['LLM_CONNECT_TIMEOUT'] = float(os.environ.get('LLM_CONNECT_TIMEOUT', 5))
+app.config['LLM_READ_TIMEOUT'] = float(os.environ.get('LLM_READ_TIMEOUT', 60))
+app.config['LLM_ASYNC_POOL_SIZE'] = int(os.environ.get('LLM_ASYNC_POOL_SIZE', 200))
+
+# Upstream resilience (see resilience.py): overall deadline per endpoint, retries, hedging and circuit breaking
+app.config['LLM_DEADLINES'] = {
+    'chat': float(os.environ.get('LLM_DEADLINE_CHAT', 30)),
+    'practice': float(os.environ.get('LLM_DEADLINE_PRACTICE', 45)),
+    'call': float(os.environ.get('LLM_DEADLINE_CALL', 20)),
+}
+app.config['LLM_MAX_ATTEMPTS'] = int(os.environ.get('LLM_MAX_ATTEMPTS', 3))
+app.config['LLM_RETRY_BASE_DELAY'] = float(os.environ.get('LLM_RETRY_BASE_DELAY', 0.25))
+app.config['LLM_RETRY_MAX_DELAY'] = float(os.environ.get('LLM_RETRY_MAX_DELAY', 4))
+app.config['LLM_HEDGE'] = os.environ.get('LLM_HEDGE', '0') == '1'
+app.config['LLM_HEDGE_QUANTILE'] = float(os.environ.get('LLM_HEDGE_QUANTILE', 0.95))
+app.config['LLM_BREAKER_FAILURES'] = int(os.environ.get('LLM_BREAKER_FAILURES', 5))
+app.config['LLM_BREAKER_RESET'] = float(os.environ.get('LLM_BREAKER_RESET', 30))
+
+# Model routing by endpoint, level and input length (see model_router.py); LLM_ROUTES_PATH overrides the table
+app.config['LLM_ROUTING'] = os.environ.get('LLM_ROUTING', '1') == '1'
+app.config['LLM_ROUTES_PATH'] = os.environ.get('LLM_ROUTES_PATH', '')
+app.config['LLM_DEMOTE_ERROR_RATE'] = float(os.environ.get('LLM_DEMOTE_ERROR_RATE', 0.3))
+app.config['LLM_DEMOTE_COOLDOWN'] = float(os.environ.get('LLM_DEMOTE_COOLDOWN', 60))
+# Share one upstream call between identical concurrent non-streaming requests (see singleflight.py)
+app.config['LLM_COALESCE'] = os.environ.get('LLM_COALESCE', '1') == '1'
+
+# Cache of practice_api grammar analyses: 'memory' (per worker), 'sqlite' (shared file) or 'none'
+app.config['PRACTICE_CACHE_BACKEND'] = os.environ.get('PRACTICE_CACHE_BACKEND', 'memory')
+app.config['PRACTICE_CACHE_TTL'] = int(os.environ.get('PRACTICE_CACHE_TTL', 7 * 24 * 3600))
+app.config['PRACTICE_CACHE_SIZE'] = int(os.environ.get('PRACTICE_CACHE_SIZE', 2048))
+app.config['PRACTICE_CACHE_PATH'] = os.environ.get('PRACTICE_CACHE_PATH', os.path.join(app.instance_path, 'practice_cache.db'))
+
+# Offline lexicon check that answers short practice_api inputs without the LLM (see precheck.py)
+app.config['PRECHECK'] = os.environ.get('PRECHECK', '1') == '1'
+app.config['PRECHECK_MAX_WORDS'] = int(os.environ.get('PRECHECK_MAX_WORDS', 6))
+app.config['PRECHECK_LEXICON_DIR'] = os.environ.get('PRECHECK_LEXICON_DIR', LEXICON_DIR)
+
+# Re-check only the changed sentences of a practice text (see incremental.py)
+app.config['PRACTICE_INCREMENTAL'] = os.environ.get('PRACTICE_INCREMENTAL', '1') == '1'
+app.config['PRACTICE_FANOUT_WORKERS'] = int(os.environ.get('PRACTICE_FANOUT_WORKERS', 8))
+
+# Snapshot cache behind load_user: 'memory' (per worker, stale for up to the TTL elsewhere), 'sqlite' (shared) or 'none'
+app.config['USER_CACHE_BACKEND'] = os.environ.get('USER_CACHE_BACKEND', 'memory')
+app.config['USER_CACHE_TTL'] = int(os.environ.get('USER_CACHE_TTL', 60))
+app.config['USER_CACHE_SIZE'] = int(os.environ.get('USER_CACHE_SIZE', 10000))
+app.config['USER_CACHE_PATH'] = os.environ.get('USER_CACHE_PATH', os.path.join(app.instance_path, 'user_cache.db'))
+
+# Server-side /call/api conversation history: 'memory' (per worker) or 'sqlite' (shared by all workers)
+app.config['CALL_SESSION_BACKEND'] = os.environ.get('CALL_SESSION_BACKEND', 'memory')
+app.config['CALL_SESSION_TTL'] = int(os.environ.get('CALL_SESSION_TTL', 2 * 3600))
+app.config['CALL_SESSION_SIZE'] = int(os.environ.get('CALL_SESSION_SIZE', 10000))
+app.config['CALL_SESSION_PATH'] = os.environ.get('CALL_SESSION_PATH', os.path.join(app.instance_path, 'call_sessions.db'))
+app.config['CALL_HISTORY_TOKENS'] = int(os.environ.get('CALL_HISTORY_TOKENS', 1200))
+app.config['CALL_SUMMARY_TOKENS'] = int(os.environ.get('CALL_SUMMARY_TOKENS', 300))
+# Speculative /call/api completions (see speculation.py): the call page posts an interim transcript once it has
+# been unchanged for CALL_SPECULATE_STABLE_MS, and the reply is reused if the final utterance matches it
+app.config['CALL_SPECULATE'] = os.environ.get('CALL_SPECULATE', '1') == '1'
+app.config['CALL_SPECULATE_STABLE_MS'] = int(os.environ.get('CALL_SPECULATE_STABLE_MS', 300))
+app.config['CALL_SPECULATE_MIN_WORDS'] = int(os.environ.get('CALL_SPECULATE_MIN_WORDS', 2))
+app.config['CALL_SPECULATE_MAX_PER_TURN'] = int(os.environ.get('CALL_SPECULATE_MAX_PER_TURN', 3))
+app.config['CALL_SPECULATE_TTL'] = int(os.environ.get('CALL_SPECULATE_TTL', 30))
+app.config['CALL_SPECULATE_WORKERS'] = int(os.environ.get('CALL_SPECULATE_WORKERS', 8))
+
+# Vocabulary search (see vocabulary_search.py): how alike a typo must be to a word or correction to match it
+app.config['VOCABULARY_SEARCH_MIN_SIMILARITY'] = float(os.environ.get('VOCABULARY_SEARCH_MIN_SIMILARITY', 0.3))
+
+# Export and import (see data_transfer.py): rows per exported page / per import transaction, largest upload accepted
+app.config['EXPORT_PAGE_SIZE'] = int(os.environ.get('EXPORT_PAGE_SIZE', 1000))
+app.config['IMPORT_BATCH_SIZE'] = int(os.environ.get('IMPORT_BATCH_SIZE', 1000))
+app.config['IMPORT_MAX_BYTES'] = int(os.environ.get('IMPORT_MAX_BYTES', 256 * 1024 * 1024))
+
+# XP leaderboards held in memory (see leaderboard.py): rebuilt from the database every LEADERBOARD_RECONCILE_SECONDS
+app.config['LEADERBOARD'] = os.environ.get('LEADERBOARD', '1') == '1'
+app.config['LEADERBOARD_RECONCILE_SECONDS'] = float(os.environ.get('LEADERBOARD_RECONCILE_SECONDS', 300))
+
+# Write-behind for log_activity: Activity rows and XP are journaled, then flushed in batches
+# every ACTIVITY_FLUSH_INTERVAL_MS or ACTIVITY_FLUSH_BATCH records. XP shows up after the next flush.
+app.config['ACTIVITY_WRITE_BEHIND'] = os.environ.get('ACTIVITY_WRITE_BEHIND', '0') == '1'
+app.config['ACTIVITY_FLUSH_INTERVAL_MS'] = int(os.environ.get('ACTIVITY_FLUSH_INTERVAL_MS', 50))
+app.config['ACTIVITY_FLUSH_BATCH'] = int(os.environ.get('ACTIVITY_FLUSH_BATCH', 200))
+app.config['ACTIVITY_JOURNAL_DIR'] = os.environ.get('ACTIVITY_JOURNAL_DIR', os.path.join(app.instance_path, 'activity_journal'))
+app.config['ACTIVITY_JOURNAL_FSYNC'] = os.environ.get('ACTIVITY_JOURNAL_FSYNC', '0') == '1'
+
+# Instrumentation: Prometheus-style /metrics, and JSON log lines on stderr (see metrics.py, logs.py).
+# LOG_SAMPLE_RATE is the fraction of DEBUG/INFO lines kept; warnings and errors are always logged.
+app.config['METRICS'] = os.environ.get('METRICS', '1') == '1'
+app.config['LOG_LEVEL'] = os.environ.get('LOG_LEVEL', 'WARNING')
+app.config['LOG_SAMPLE_RATE'] = float(os.environ.get('LOG_SAMPLE_RATE', 1.0))
+# Per-request profiling (see profiler.py), opt-in: requests sent with `X-Profile: <PROFILE_TOKEN>`, plus a
+# PROFILE_SAMPLE_RATE fraction of all requests, are profiled into PROFILE_DIR. Every /debug/* route needs the
+# token too, and answers 404 while none is set.
+app.config['PROFILE'] = os.environ.get('PROFILE', '0') == '1'
+app.config['PROFILE_TOKEN'] = os.environ.get('PROFILE_TOKEN', '')
+app.config['PROFILE_SAMPLE_RATE'] = float(os.environ.get('PROFILE_SAMPLE_RATE', 0.0))
+app.config['PROFILE_INTERVAL_MS'] = float(os.environ.get('PROFILE_INTERVAL_MS', 5))
+app.config['PROFILE_REPEAT_THRESHOLD'] = int(os.environ.get('PROFILE_REPEAT_THRESHOLD', 3))
+app.config['PROFILE_DIR'] = os.environ.get('PROFILE_DIR', os.path.join(app.instance_path, 'profiles'))
+
+# Password hashing (see password_hashing.py): bcrypt cost, and the pool that runs it off the request thread.
+# Logins re-hash stored passwords made at another cost. PASSWORD_HASH_WORKERS=0 hashes on the request thread.
+app.config['BCRYPT_LOG_ROUNDS'] = int(os.environ.get('BCRYPT_LOG_ROUNDS', 12))
+app.config['PASSWORD_HASH_WORKERS'] = int(os.environ.get('PASSWORD_HASH_WORKERS', os.cpu_count() or 1))
+app.config['PASSWORD_HASH_QUEUE'] = int(os.environ.get('PASSWORD_HASH_QUEUE', 32))
+app.config['PASSWORD_HASH_TIMEOUT'] = float(os.environ.get('PASSWORD_HASH_TIMEOUT', 5))
+app.config['PASSWORD_HASH_NICE'] = int(os.environ.get('PASSWORD_HASH_NICE', 5))
+
 # Trust proxy headers for HTTPS detection
 app.wsgi_app = ProxyFix(app.wsgi_app, x_proto=1, x_host=1)
 
@@ -386,10 +533,97 @@ app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(days=7)
 app.config['REMEMBER_COOKIE_HTTPONLY'] = True
 app.config['REMEMBER_COOKIE_DURATION'] = timedelta(days=30)
 
+configure_logging(app.config['LOG_LEVEL'])
+log = get_logger('deutschai.app', app.config['LOG_SAMPLE_RATE'])
+metrics = AppMetrics() if app.config['METRICS'] else None
+profiler = Profiler.from_config(app.config) if app.config['PROFILE'] else None
+
+def request_route():
+    return request.url_rule.rule if request.url_rule is not None else 'unmatched'
+
+def start_query_timer(conn, cursor, statement, parameters, context, executemany):
+    context._query_start = time.perf_counter()
+
+def record_query(conn, cursor, statement, parameters, context, executemany):
+    """Count a statement against the current request and its route ('background' outside a request)."""
+    seconds = time.perf_counter() - context._query_start
+    if not has_request_context():
+        if metrics is not None:
+            metrics.observe_query('background', seconds)
+        return
+    if metrics is not None:
+        metrics.observe_query(request_route(), seconds)
+    stats = request.environ.get(ENVIRON_KEY)
+    if stats is not None:
+        stats.query(seconds)
+    profile = request.environ.get(PROFILE_KEY)
+    if profile is not None:
+        profile.query(statement, parameters, seconds)
+
 db = SQLAlchemy(app)
+with app.app_context():
+    apply_profile(db.engine, app.config)
+    if metrics is not None or profiler is not None:
+        event.listen(db.engine, 'before_cursor_execute', start_query_timer)
+        event.listen(db.engine, 'after_cursor_execute', record_query)
 bcrypt = Bcrypt(app)
+password_hasher = PasswordHasher.from_config(bcrypt, app.config)
 login_manager = LoginManager(app)
 login_manager.login_view = 'login'
+llm = UpstreamClient.from_config(app.config)
+resilience = ResiliencePolicy.from_config(app.config)
+router = ModelRouter.from_config(app.config) if app.config['LLM_ROUTING'] else None
+coalescer = SingleFlight() if app.config['LLM_COALESCE'] else None
+if metrics is not None:
+    metrics.registry.callback(
+        'upstream_coalesced_total', "Requests that shared another request's in-flight upstream call.",
+        lambda: {(): coalescer.stats()['coalesced']} if coalescer is not None else {}, kind='counter')
+    metrics.registry.callback(
+        'upstream_circuit_open', 'Whether the circuit breaker of an AI endpoint is open (1) or not (0).',
+        lambda: {(endpoint,): int(state['circuit'] == 'open') for endpoint, state in resilience.stats().items()}, ('endpoint',))
+    metrics.registry.callback(
+        'password_hash_pending', 'Password hash jobs running or queued.', lambda: {(): password_hasher.stats()['pending']})
+    metrics.registry.callback(
+        'password_hash_rejected_total', 'Logins and signups turned away with 503 because password hashing was saturated.',
+        lambda: {('queue_full',): password_hasher.counts['rejected'], ('timeout',): password_hasher.counts['timeouts']},
+        ('reason',), kind='counter')
+if app.config['PRACTICE_CACHE_BACKEND'] == 'sqlite':
+    os.makedirs(os.path.dirname(app.config['PRACTICE_CACHE_PATH']), exist_ok=True)
+practice_cache = create_cache(
+    app.config['PRACTICE_CACHE_BACKEND'],
+    ttl=app.config['PRACTICE_CACHE_TTL'],
+    max_entries=app.config['PRACTICE_CACHE_SIZE'],
+    path=app.config['PRACTICE_CACHE_PATH'],
+)
+prechecker = PreChecker(app.config['PRECHECK_LEXICON_DIR'], app.config['PRECHECK_MAX_WORDS']) if app.config['PRECHECK'] else None
+sentence_pool = ThreadPoolExecutor(app.config['PRACTICE_FANOUT_WORKERS'], thread_name_prefix='practice-fanout')
+if app.config['USER_CACHE_BACKEND'] == 'sqlite':
+    os.makedirs(os.path.dirname(app.config['USER_CACHE_PATH']), exist_ok=True)
+user_cache = create_user_cache(
+    app.config['USER_CACHE_BACKEND'],
+    ttl=app.config['USER_CACHE_TTL'],
+    max_entries=app.config['USER_CACHE_SIZE'],
+    path=app.config['USER_CACHE_PATH'],
+)
+if app.config['CALL_SESSION_BACKEND'] == 'sqlite':
+    os.makedirs(os.path.dirname(app.config['CALL_SESSION_PATH']), exist_ok=True)
+call_sessions = create_conversation_store(
+    app.config['CALL_SESSION_BACKEND'],
+    ttl=app.config['CALL_SESSION_TTL'],
+    max_entries=app.config['CALL_SESSION_SIZE'],
+    path=app.config['CALL_SESSION_PATH'],
+    history_tokens=app.config['CALL_HISTORY_TOKENS'],
+    summary_tokens=app.config['CALL_SUMMARY_TOKENS'],
+)
+vocabulary_search = VocabularySearch(min_similarity=app.config['VOCABULARY_SEARCH_MIN_SIMILARITY'])
+speculations = None
+if app.config['CALL_SPECULATE']:
+    speculations = SpeculationStore(ttl=app.config['CALL_SPECULATE_TTL'], max_per_turn=app.config['CALL_SPECULATE_MAX_PER_TURN'])
+    speculation_pool = ThreadPoolExecutor(app.config['CALL_SPECULATE_WORKERS'], thread_name_prefix='call-speculation')
+    if metrics is not None:
+        metrics.registry.callback(
+            'call_speculations_total', 'Speculative /call/api completions by outcome; wasted ones had already gone upstream.',
+            lambda: {(outcome,): value for outcome, value in speculations.counts.items()}, ('outcome',), kind='counter')
 
 class User(db.Model, UserMixin):
     id = db.Column(db.Integer, primary_key=True)
@@ -400,20 +634,35 @@ class User(db.Model, UserMixin):
     native_language = db.Column(db.String(10), nullable=False, default='en')
     email = db.Column(db.String(120), unique=True, nullable=False)
     password = db.Column(db.String(60), nullable=False)
-    progress = db.Column(db.Integer, default=0)
-    xp = db.Column(db.Integer, default=0)
+    # xp and progress are read from UserStats, see below
     vocabularies = db.relationship('Vocabulary', backref='owner', lazy=True)
     activities = db.relationship('Activity', backref='owner', lazy=True)
 
 class Vocabulary(db.Model):
+    __table_args__ = (
+        db.Index('ix_vocabulary_user_timestamp', 'user_id', 'timestamp'),
+        db.Index('ix_vocabulary_user_due', 'user_id', 'due_at'),
+        db.UniqueConstraint('user_id', 'word', 'correction', name='uq_vocabulary_user_word_correction'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     word = db.Column(db.String(100), nullable=False)
     correction = db.Column(db.String(100), nullable=False)
     explanation = db.Column(db.Text, nullable=True)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+    # Spaced-repetition state, see spaced_repetition.py
+    ease = db.Column(db.Float, nullable=False, default=START_EASE)
+    interval_days = db.Column(db.Integer, nullable=False, default=0)
+    reps = db.Column(db.Integer, nullable=False, default=0)
+    due_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+# FTS5 tables and triggers behind /vocabulary/api/search, created along with the table
+install_search_index(Vocabulary.__table__)
 
 class Activity(db.Model):
+    __table_args__ = (
+        db.Index('ix_activity_user_timestamp', 'user_id', 'timestamp'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     type = db.Column(db.String(50), nullable=False) # 'chat', 'practice', 'vocab'
@@ -421,22 +670,357 @@ class Activity(db.Model):
     points = db.Column(db.Integer, default=0)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
 
-def log_activity(user, type, description, points):
-    activity = Activity(user_id=user.id, type=type, description=description, points=points)
-    user.xp += points
+class UserStats(db.Model):
+    """Per-user aggregate of Activity, maintained incrementally by log_activity."""
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    xp = db.Column(db.Integer, nullable=False, default=0)
+    level = db.Column(db.Integer, nullable=False, default=1)
+    activity_count = db.Column(db.Integer, nullable=False, default=0)
+    current_streak = db.Column(db.Integer, nullable=False, default=0)
+    longest_streak = db.Column(db.Integer, nullable=False, default=0)
+    last_active_date = db.Column(db.Date, nullable=True)
+
+    def streak_on(self, day):
+        """Current streak as of `day`: it lapses once a whole day passes without activity."""
+        if self.last_active_date is None or (day - self.last_active_date).days > 1:
+            return 0
+        return self.current_streak
+
+def level_progress(xp):
     # Simple logic: 1000 XP per level, progress is % of current 1000
-    user.progress = (user.xp % 1000) // 10
-    if user.progress > 100: user.progress = 100
-    db.session.add(activity)
+    return xp % 1000 // 10
+
+# XP lives in UserStats alone, so an activity never writes the user row. Older databases still
+# have user.xp and user.progress columns; they are no longer read or written.
+_user_xp = db.func.coalesce(db.select(UserStats.xp).where(UserStats.user_id == User.id).scalar_subquery(), 0)
+User.xp = db.column_property(_user_xp)
+User.progress = db.column_property(level_progress(_user_xp))
+
+class UserActivityTotal(db.Model):
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    type = db.Column(db.String(50), primary_key=True)
+    xp = db.Column(db.Integer, nullable=False, default=0)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+class UserDailyActivity(db.Model):
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    xp = db.Column(db.Integer, nullable=False, default=0)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+def dialect_insert(model):
+    """The INSERT construct of the configured database, which supports ON CONFLICT."""
+    if db.engine.dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert(model)
+
+def insert_ignoring_conflicts(model):
+    """INSERT ... ON CONFLICT DO NOTHING for the configured database."""
+    return dialect_insert(model).on_conflict_do_nothing()
+
+def update_user_stats(user_id, type, points, day):
+    """Fold one activity into the user's stats rows with atomic upserts; returns the user's new XP.
+
+    Returns None on databases without INSERT ... RETURNING.
+    """
+    greatest = db.func.greatest if db.engine.dialect.name == 'postgresql' else db.func.max
+    stats = dialect_insert(UserStats).values(
+        user_id=user_id, xp=points, level=points // 1000 + 1, activity_count=1,
+        current_streak=1, longest_streak=1, last_active_date=day
+    )
+    # An activity older than last_active_date (e.g. replayed from a write-behind journal) leaves the streak alone
+    late = UserStats.last_active_date > day
+    streak = db.case(
+        (late, UserStats.current_streak),
+        (UserStats.last_active_date == day, UserStats.current_streak),
+        (UserStats.last_active_date == day - timedelta(days=1), UserStats.current_streak + 1),
+        else_=1
+    )
+    stats = stats.on_conflict_do_update(index_elements=[UserStats.user_id], set_={
+        'xp': UserStats.xp + points,
+        'level': (UserStats.xp + points) // 1000 + 1,
+        'activity_count': UserStats.activity_count + 1,
+        'current_streak': streak,
+        'longest_streak': greatest(UserStats.longest_streak, streak),
+        'last_active_date': db.case((late, UserStats.last_active_date), else_=day),
+    })
+    if db.engine.dialect.insert_returning:
+        xp = db.session.execute(stats.returning(UserStats.xp)).scalar()
+    else:
+        db.session.execute(stats)
+        xp = None
+    totals = dialect_insert(UserActivityTotal).values(user_id=user_id, type=type, xp=points, count=1)
+    db.session.execute(totals.on_conflict_do_update(index_elements=[UserActivityTotal.user_id, UserActivityTotal.type], set_={
+        'xp': UserActivityTotal.xp + points,
+        'count': UserActivityTotal.count + 1,
+    }))
+    daily = dialect_insert(UserDailyActivity).values(user_id=user_id, day=day, xp=points, count=1)
+    db.session.execute(daily.on_conflict_do_update(index_elements=[UserDailyActivity.user_id, UserDailyActivity.day], set_={
+        'xp': UserDailyActivity.xp + points,
+        'count': UserDailyActivity.count + 1,
+    }))
+    return xp
+
+def rebuild_user_stats(conn):
+    """Recompute every user's stats rows from Activity in bulk, on an open connection."""
+    day = db.func.date(Activity.timestamp)
+    conn.execute(db.delete(UserActivityTotal))
+    conn.execute(db.insert(UserActivityTotal).from_select(
+        ['user_id', 'type', 'xp', 'count'],
+        db.select(Activity.user_id, Activity.type, db.func.coalesce(db.func.sum(Activity.points), 0), db.func.count())
+        .group_by(Activity.user_id, Activity.type)
+    ))
+    conn.execute(db.delete(UserDailyActivity))
+    conn.execute(db.insert(UserDailyActivity).from_select(
+        ['user_id', 'day', 'xp', 'count'],
+        db.select(Activity.user_id, day, db.func.coalesce(db.func.sum(Activity.points), 0), db.func.count())
+        .where(Activity.timestamp.isnot(None))
+        .group_by(Activity.user_id, day)
+    ))
+
+    totals = conn.execute(
+        db.select(UserActivityTotal.user_id, db.func.sum(UserActivityTotal.xp), db.func.sum(UserActivityTotal.count))
+        .group_by(UserActivityTotal.user_id)
+    ).all()
+    streaks = {}
+    rows = conn.execute(db.select(UserDailyActivity.user_id, UserDailyActivity.day).order_by(UserDailyActivity.user_id, UserDailyActivity.day))
+    for user_id, active_day in rows:
+        current, longest, last = streaks.get(user_id, (0, 0, None))
+        current = current + 1 if last is not None and (active_day - last).days == 1 else 1
+        streaks[user_id] = (current, max(longest, current), active_day)
+
+    conn.execute(db.delete(UserStats))
+    stats = []
+    for user_id, xp, count in totals:
+        current, longest, last = streaks.get(user_id, (0, 0, None))
+        stats.append({
+            'user_id': user_id, 'xp': xp, 'level': xp // 1000 + 1, 'activity_count': count,
+            'current_streak': current, 'longest_streak': longest, 'last_active_date': last,
+        })
+    if stats:
+        conn.execute(db.insert(UserStats), stats)
+    return len(stats)
+
+@app.cli.command('rebuild-stats')
+def rebuild_stats_command():
+    """Recompute the per-user stats tables from the Activity history."""
+    with db.engine.begin() as conn:
+        count = rebuild_user_stats(conn)
+    print(f"Rebuilt stats for {count} users.")
+
+def forget_user(user_id):
+    """Drop the user's cached snapshot once the current transaction commits."""
+    if user_cache is not None:
+        db.session.info.setdefault('user_updates', {})[user_id] = None
+
+def refresh_user(user_id, **values):
+    """Patch the user's cached snapshot with `values` once the current transaction commits."""
+    if user_cache is not None:
+        updates = db.session.info.setdefault('user_updates', {})
+        if updates.get(user_id, {}) is not None:
+            updates[user_id] = dict(updates.get(user_id, {}), **values)
+
+def user_xp_changed(user_id, xp, week_points, language, level):
+    """Patch the cached snapshot and queue the leaderboard update for a new XP total, once the transaction commits."""
+    if xp is None:
+        forget_user(user_id)
+        return
+    refresh_user(user_id, xp=xp, progress=level_progress(xp))
+    if leaderboard is not None:
+        db.session.info.setdefault('leaderboard_updates', []).append(
+            (user_id, xp, week_points, language, level, datetime.utcnow()))
+
+def log_activity(user, type, description, points, commit=True):
+    now = datetime.utcnow()
+    if activity_queue is not None:
+        # Queued once the surrounding transaction commits, so a rollback drops it too
+        db.session.info.setdefault('pending_activities', []).append({
+            'user_id': user.id, 'type': type, 'description': description, 'points': points,
+            'timestamp': now.isoformat(),
+        })
+    else:
+        activity = Activity(user_id=user.id, type=type, description=description, points=points, timestamp=now)
+        xp = update_user_stats(user.id, type, points, now.date())
+        user_xp_changed(user.id, xp, points, user.target_language, user.german_level)
+        db.session.add(activity)
+    if not commit:
+        # Caller commits as part of a larger transaction
+        return
     try:
         db.session.commit()
-    except Exception as e:
+    except Exception:
         db.session.rollback()
-        print(f"Error logging activity: {e}")
+        log.exception('log_activity_failed', user_id=user.id, type=type)
+
+def apply_activity_batch(records, replayed=False):
+    """Write a batch of queued activities, their stats and the users' XP in one transaction."""
+    with app.app_context():
+        rows = [dict(record, timestamp=datetime.fromisoformat(record['timestamp'])) for record in records]
+        if replayed:
+            # The journal may hold records that were committed just before a crash
+            rows = [row for row in rows if db.session.execute(db.select(Activity.id).where(
+                Activity.user_id == row['user_id'], Activity.type == row['type'],
+                Activity.timestamp == row['timestamp'], Activity.description == row['description']
+            ).limit(1)).first() is None]
+        if not rows:
+            return
+        try:
+            db.session.execute(db.insert(Activity), rows)
+            xp, week_xp = {}, {}
+            this_week = week_start(datetime.utcnow())
+            for row in rows:
+                xp[row['user_id']] = update_user_stats(row['user_id'], row['type'], row['points'], row['timestamp'].date())
+                if row['timestamp'] >= this_week:
+                    week_xp[row['user_id']] = week_xp.get(row['user_id'], 0) + row['points']
+            boards = dict.fromkeys(xp, (None, None))
+            if leaderboard is not None:
+                boards.update((row.id, (row.target_language, row.german_level)) for row in db.session.execute(
+                    db.select(User.id, User.target_language, User.german_level).where(User.id.in_(list(xp)))))
+            for user_id, total in xp.items():
+                user_xp_changed(user_id, total, week_xp.get(user_id, 0), *boards[user_id])
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+def load_leaderboard():
+    """Every user's XP, target language and level, and the XP each earned this week, for Leaderboard.reconcile."""
+    now = datetime.utcnow()
+    with app.app_context():
+        users = db.session.execute(
+            db.select(User.id, db.func.coalesce(UserStats.xp, 0), User.target_language, User.german_level)
+            .outerjoin(UserStats, UserStats.user_id == User.id)).all()
+        weekly = dict(db.session.execute(
+            db.select(UserDailyActivity.user_id, db.func.sum(UserDailyActivity.xp))
+            .where(UserDailyActivity.day >= week_start(now).date()).group_by(UserDailyActivity.user_id)).all())
+    return users, weekly, now
+
+leaderboard = None
+if app.config['LEADERBOARD']:
+    leaderboard = Leaderboard(load_leaderboard, interval=app.config['LEADERBOARD_RECONCILE_SECONDS'], logger=log)
+    if metrics is not None:
+        metrics.registry.callback(
+            'leaderboard_drift_total', "Learners whose leaderboard XP a reconcile had to correct (changes made by other workers).",
+            lambda: {(): leaderboard.counts['drift']}, kind='counter')
+        metrics.registry.callback(
+            'leaderboard_reconcile_seconds', 'Duration of the latest leaderboard rebuild.', lambda: {(): leaderboard.last_reconcile_seconds})
+
+activity_queue = None
+if app.config['ACTIVITY_WRITE_BEHIND']:
+    activity_queue = WriteBehindQueue(
+        apply_activity_batch,
+        app.config['ACTIVITY_JOURNAL_DIR'],
+        log.error,
+        interval=app.config['ACTIVITY_FLUSH_INTERVAL_MS'] / 1000,
+        max_batch=app.config['ACTIVITY_FLUSH_BATCH'],
+        fsync=app.config['ACTIVITY_JOURNAL_FSYNC'],
+    ).start()
+
+@event.listens_for(db.session, 'after_commit')
+def enqueue_pending_activities(session):
+    for record in session.info.pop('pending_activities', ()):
+        activity_queue.put(record)
+
+@event.listens_for(db.session, 'after_commit')
+def apply_user_cache_updates(session):
+    for user_id, values in session.info.pop('user_updates', {}).items():
+        if values is None:
+            user_cache.invalidate(user_id)
+        else:
+            user_cache.update(user_id, values)
+
+@event.listens_for(db.session, 'after_commit')
+def apply_leaderboard_updates(session):
+    for update in session.info.pop('leaderboard_updates', ()):
+        leaderboard.record(*update)
+
+@event.listens_for(db.session, 'after_soft_rollback')
+def discard_pending_activities(session, previous_transaction):
+    session.info.pop('pending_activities', None)
+    session.info.pop('user_updates', None)
+    session.info.pop('leaderboard_updates', None)
+
+def stream_completion(response, on_complete):
+    """Relay an upstream `stream: true` completion to the browser as SSE.
+
+    Each event carries `{"delta": text}`; the last one is `{"done": true, "content": full_text}`.
+    `on_complete(full_text)` runs once the upstream stream has finished.
+    """
+    def generate():
+        parts = []
+        try:
+            for delta in iter_deltas(response):
+                parts.append(delta)
+                yield f"data: {json.dumps({'delta': delta})}\n\n"
+        except requests.exceptions.RequestException:
+            yield f"data: {json.dumps({'error': 'AI stream interrupted'})}\n\n"
+            return
+        content = ''.join(parts)
+        on_complete(content)
+        yield f"data: {json.dumps({'done': True, 'content': content})}\n\n"
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',
+    })
+
+MAX_VOCABULARY_BATCH = 200
+
+def add_vocabulary_items(user, items):
+    """Insert a batch of corrections into the user's vocabulary in one transaction.
+
+    Duplicates are rejected by the (user_id, word, correction) unique
+    constraint rather than looked up first. Returns one status dict per input
+    item, in order.
+    """
+    results = [None] * len(items)
+    wanted = {}
+    for index, item in enumerate(items):
+        word = item.get('word') if isinstance(item, dict) else None
+        correction = item.get('correction') if isinstance(item, dict) else None
+        if not word or not correction:
+            results[index] = {"status": "invalid", "error": "Missing word or correction"}
+        elif (word, correction) in wanted:
+            results[index] = {"status": "duplicate"}
+        else:
+            wanted[(word, correction)] = index
+
+    added = set()
+    if wanted:
+        now = datetime.utcnow()
+        rows = [{
+            "user_id": user.id,
+            "word": word,
+            "correction": correction,
+            "explanation": items[index].get('explanation'),
+            "timestamp": now
+        } for (word, correction), index in wanted.items()]
+        statement = insert_ignoring_conflicts(Vocabulary).values(rows).returning(Vocabulary.word, Vocabulary.correction)
+        added = set(db.session.execute(statement).all())
+
+    for (word, correction), index in wanted.items():
+        if (word, correction) in added:
+            log_activity(user, 'vocab', f'Neues Wort gelernt: {correction}', 5, commit=False)
+            results[index] = {"status": "added"}
+        else:
+            results[index] = {"status": "duplicate"}
+    return results
 
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    if user_cache is None:
+        return User.query.get(int(user_id))
+    return user_cache.get(int(user_id), lambda id: db.session.get(User, id))
+
+@app.before_request
+def start_request_stats():
+    # Registered before handle_options, which ends the before_request chain for preflights
+    if metrics is not None or profiler is not None:
+        request.environ.setdefault(ENVIRON_KEY, RequestStats())
+    if profiler is not None and PROFILE_KEY not in request.environ and profiler.wants(request.headers.get(PROFILE_HEADER)):
+        request.environ[PROFILE_KEY] = profiler.start(request.method, request.path)
 
 @app.before_request
 def handle_options():
@@ -458,6 +1042,26 @@ def after_request(response):
         response.headers.add('Access-Control-Allow-Credentials', 'true')
     return response
 
+@app.after_request
+def record_request_metrics(response):
+    stats = request.environ.get(ENVIRON_KEY)
+    if metrics is not None:
+        metrics.observe_request(request_route(), request.method, response.status_code, stats)
+    if profiler is not None and stats is not None:
+        profiler.endpoints.observe(request_route(), time.perf_counter() - stats.start, stats.queries, stats.query_seconds)
+    profile = request.environ.get(PROFILE_KEY)
+    if profile is not None:
+        profile.status = response.status_code
+        response.headers['X-Profile-Id'] = profile.id
+    return response
+
+@app.teardown_request
+def finish_request_profile(error=None):
+    # Teardown also runs when a view raised; for a streamed response it runs before the body is sent
+    profile = request.environ.pop(PROFILE_KEY, None)
+    if profile is not None:
+        profiler.finish(profile, request_route())
+
 @app.context_processor
 def inject_user():
     lang = current_user.native_language if current_user.is_authenticated else 'en'
@@ -470,7 +1074,21 @@ def index():
         lang = 'en'
     return render_template('index.html', translations=get_translations(lang), native_lang=lang, lang_dir=get_lang_dir(lang))
 
+def debug_endpoint(view):
+    """Gate a /debug/* view behind `X-Profile: <PROFILE_TOKEN>`; 404 while no token is set."""
+    @wraps(view)
+    def gated(*args, **kwargs):
+        token = app.config['PROFILE_TOKEN']
+        if not token:
+            return jsonify({"error": "Debug endpoints are disabled"}), 404
+        header = request.headers.get(PROFILE_HEADER)
+        if not header or not hmac.compare_digest(header.encode(), token.encode()):
+            return jsonify({"error": "Unauthorized"}), 401
+        return view(*args, **kwargs)
+    return gated
+
 @app.route('/debug/session')
+@debug_endpoint
 def debug_session():
     """Debug endpoint to check session status"""
     from flask import session
@@ -485,6 +1103,66 @@ def debug_session():
         }
     })
 
+@app.route('/debug/cache')
+@debug_endpoint
+def debug_cache():
+    """Hit/miss counters of the practice_api response cache, its local pre-checker and the load_user cache"""
+    return jsonify({
+        'practice': practice_cache.stats() if practice_cache is not None else None,
+        'precheck': prechecker.stats() if prechecker is not None else None,
+        'user': user_cache.stats() if user_cache is not None else None,
+    })
+
+@app.route('/debug/upstream')
+@debug_endpoint
+def debug_upstream():
+    """Circuit breaker state of each AI endpoint, EWMA latency/error rate of each model, coalesced and speculative calls"""
+    return jsonify({
+        'endpoints': resilience.stats(),
+        'models': router.snapshot() if router is not None else None,
+        'coalescing': coalescer.stats() if coalescer is not None else None,
+        'speculation': speculations.stats() if speculations is not None else None,
+    })
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Prometheus scrape endpoint: request, upstream, token and database metrics of this worker"""
+    if metrics is None:
+        return jsonify({"error": "Metrics are disabled"}), 404
+    return Response(metrics.render(), content_type=CONTENT_TYPE)
+
+@app.route('/debug/profile')
+@debug_endpoint
+def debug_profile():
+    """Slowest endpoints of this worker and its latest request profiles"""
+    if profiler is None:
+        return jsonify({"error": "Profiling is disabled"}), 404
+    return jsonify(profiler.report(request.args.get('limit', 10, type=int)))
+
+@app.route('/debug/password_hashing')
+@debug_endpoint
+def debug_password_hashing():
+    """Cost, pool size, backlog and rejections of password hashing"""
+    return jsonify(password_hasher.stats())
+
+@app.route('/debug/activity_queue')
+@debug_endpoint
+def debug_activity_queue():
+    """Depth and flush latency of the log_activity write-behind queue"""
+    return jsonify(activity_queue.metrics() if activity_queue is not None else None)
+
+@app.route('/debug/leaderboard')
+@debug_endpoint
+def debug_leaderboard():
+    """Board sizes, update counts, drift and rebuild time of this worker's leaderboards"""
+    return jsonify(leaderboard.stats() if leaderboard is not None else None)
+
+def hashing_busy_response(template, lang, error):
+    """503 for a login or signup turned away because the password hashing pool is saturated."""
+    flash('Too many sign-ins right now. Please try again in a few seconds.', 'danger')
+    body = render_template(template, translations=get_translations(lang), native_lang=lang, lang_dir=get_lang_dir(lang))
+    return body, 503, {'Retry-After': str(error.retry_after)}
+
 @app.route('/signup', methods=['GET', 'POST'])
 def signup():
     if current_user.is_authenticated:
@@ -511,7 +1189,10 @@ def signup():
             flash('Email already registered!', 'danger')
             return redirect(url_for('signup'))
 
-        hashed_password = bcrypt.generate_password_hash(password).decode('utf-8')
+        try:
+            hashed_password = password_hasher.hash(password)
+        except HashingBusy as e:
+            return hashing_busy_response('signup.html', lang, e)
         new_user = User(first_name=first_name, last_name=last_name, target_language=target_language, german_level=german_level, native_language=native_language, email=email, password=hashed_password)
         db.session.add(new_user)
         db.session.commit()
@@ -530,7 +1211,16 @@ def login():
         email = request.form.get('email')
         password = request.form.get('password')
         user = User.query.filter_by(email=email).first()
-        if user and bcrypt.check_password_hash(user.password, password):
+        try:
+            matches, new_hash = password_hasher.check(user.password, password) if user else (False, None)
+        except HashingBusy as e:
+            return hashing_busy_response('login.html', lang, e)
+        if matches:
+            if new_hash is not None:
+                # Stored at another BCRYPT_LOG_ROUNDS cost: upgrade it now that we have the password
+                user.password = new_hash
+                forget_user(user.id)
+                db.session.commit()
             login_user(user, remember=True)
             # Make session permanent so it persists longer
             from flask import session
@@ -549,126 +1239,61 @@ def logout():
 @login_required
 def dashboard():
     activities = Activity.query.filter_by(user_id=current_user.id).order_by(Activity.timestamp.desc()).limit(5).all()
-    return render_template('dashboard.html', activities=activities)
+    today = datetime.utcnow().date()
+    stats = db.session.get(UserStats, current_user.id)
+    xp_by_type = {t.type: t.xp for t in UserActivityTotal.query.filter_by(user_id=current_user.id)}
+    daily = {d.day: d.count for d in UserDailyActivity.query.filter(
+        UserDailyActivity.user_id == current_user.id,
+        UserDailyActivity.day > today - timedelta(days=7)
+    )}
+    week = [(day, daily.get(day, 0)) for day in (today - timedelta(days=i) for i in range(6, -1, -1))]
+    rank = None
+    if leaderboard is not None:
+        # The first build of a large board takes seconds; the rank shows up once it is done
+        leaderboard.ensure_built(wait=False)
+        rank = leaderboard.rank(current_user.id)
+    return render_template('dashboard.html', activities=activities, stats=stats, xp_by_type=xp_by_type, week=week,
+                           streak=stats.streak_on(today) if stats else 0, rank=rank)
 
 @app.route('/chat')
 @login_required
 def chat():
     return render_template('chat.html')
 
-@app.route('/chat/api', methods=['POST', 'OPTIONS'])
-def chat_api():
-    if request.method == 'OPTIONS':
-        response = make_response('', 200)
-        response.headers['Access-Control-Allow-Methods'] = 'POST, OPTIONS'
-        response.headers['Access-Control-Allow-Headers'] = 'Content-Type'
-        return response
-    
-    # Debug: Print session info to console
-    print(f"\n=== /chat/api called ===")
-    print(f"Cookies: {list(request.cookies.keys())}")
-    print(f"Session cookie: {request.cookies.get('session', 'NOT SET')[:50] if request.cookies.get('session') else 'NOT SET'}")
-    print(f"User authenticated: {current_user.is_authenticated}")
-    print(f"Request method: {request.method}")
-    print(f"Is secure: {request.is_secure}")
-    print(f"========================\n")
-    
-    # Debug: Check session
-    if not current_user.is_authenticated:
-        print("DEBUG: User not authenticated, returning 401")
-        return jsonify({
-            "error": "Unauthorized",
-            "debug": {
-                "cookies": list(request.cookies.keys()),
-                "session_cookie": request.cookies.get('session', 'NOT SET'),
-                "user_agent": request.headers.get('User-Agent', 'Unknown')[:50]
-            }
-        }), 401
-    
-    print("DEBUG: User IS authenticated, continuing...")
-    
-    try:
-        data = request.json
-        user_message = data.get('message')
-        
-        if not user_message:
-            print("DEBUG: No message provided")
-            return jsonify({"error": "No message provided"}), 400
+def build_ai_payload(endpoint, user, data):
+    """Build the upstream completion request for an AI endpoint.
 
-        print(f"DEBUG: Calling AI with message: {user_message[:50]}...")
-        
-        api_key = "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"
-        
-        target_lang = current_user.target_language
-        target_lang_name = "German" if target_lang == "de" else "English"
-        
-        response = requests.post(
-            url="https://openrouter.ai/api/v1/chat/completions",
-            headers={
-                "Authorization": f"Bearer {api_key}",
-                "HTTP-Referer": "https://deutchai.tayba.blog",
-                "X-Title": "DeutschAI",
-            },
-            data=json.dumps({
-                "model": "openai/gpt-3.5-turbo",
-                "messages": [
-                    {
-                        "role": "system",
-                        "content": f"You are Ahmad, a helpful {target_lang_name} language tutor. The user's {target_lang_name} level is {current_user.german_level}. Please speak primarily in {target_lang_name} and encourage the user. Keep your responses concise and engaging."
-                    },
-                    {
-                        "role": "user",
-                        "content": user_message
-                    }
-                ]
-            })
-        )
-        
-        if response.status_code == 200:
-            log_activity(current_user, 'chat', f'Konversation mit Ahmad geführt ({target_lang_name})', 10)
-            return jsonify(response.json())
-        else:
-            return jsonify({"error": "Failed to get response from AI"}), response.status_code
-    except Exception as e:
-        print(f"DEBUG ERROR: {e}")
-        return jsonify({"error": str(e)}), 500
+    Returns None when `data` is missing the endpoint's input.
+    """
+    target_lang_name = "German" if user.target_language == "de" else "English"
 
-@app.route('/practice')
-@login_required
-def practice():
-    return render_template('practice.html')
+    if endpoint == 'chat':
+        user_message = data.get('message')
+        if not user_message:
+            return None
+        return {
+            "model": "openai/gpt-3.5-turbo",
+            "messages": [
+                {
+                    "role": "system",
+                    "content": f"You are Ahmad, a helpful {target_lang_name} language tutor. The user's {target_lang_name} level is {user.german_level}. Please speak primarily in {target_lang_name} and encourage the user. Keep your responses concise and engaging."
+                },
+                {
+                    "role": "user",
+                    "content": user_message
+                }
+            ]
+        }
 
-@app.route('/practice/api', methods=['POST', 'OPTIONS'])
-def practice_api():
-    if request.method == 'OPTIONS':
-        return '', 200
-    
-    # Debug: Check session
-    if not current_user.is_authenticated:
-        return jsonify({
-            "error": "Unauthorized",
-            "debug": {
-                "cookies": list(request.cookies.keys()),
-                "session_cookie": request.cookies.get('session', 'NOT SET'),
-                "user_agent": request.headers.get('User-Agent', 'Unknown')[:50]
-            }
-        }), 401
-    
-    data = request.json
-    user_text = data.get('text')
-    
-    if not user_text:
-        return jsonify({"error": "No text provided"}), 400
+    if endpoint == 'practice':
+        user_text = data.get('text')
+        if not user_text:
+            return None
+        native_lang = user.native_language
+        lang_instruction = "in English" if native_lang == "en" else "in Arabic"
 
-    api_key = "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"
-    
-    target_lang = current_user.target_language
-    target_lang_name = "German" if target_lang == "de" else "English"
-    native_lang = current_user.native_language
-    lang_instruction = "in English" if native_lang == "en" else "in Arabic"
-    
-    system_prompt = f"""
-    You are an expert {target_lang_name} grammar checker. The user's level is {current_user.german_level}.
+        system_prompt = f"""
+    You are an expert {target_lang_name} grammar checker. The user's level is {user.german_level}.
     The user's native language is: {"English" if native_lang == "en" else "Arabic"}.
     
     Analyze the following {target_lang_name} text for:
@@ -693,115 +1318,483 @@ def practice_api():
         ]
     }}
     """
-    
-    response = requests.post(
-        url="https://openrouter.ai/api/v1/chat/completions",
-        headers={
-            "Authorization": f"Bearer {api_key}",
-            "HTTP-Referer": "https://deutchai.tayba.blog",
-            "X-Title": "DeutschAI",
-        },
-        data=json.dumps({
+        return {
             "model": "openai/gpt-3.5-turbo",
             "messages": [
                 {"role": "system", "content": system_prompt},
                 {"role": "user", "content": user_text}
             ],
             "response_format": { "type": "json_object" }
-        })
-    )
-    
-    if response.status_code == 200:
-        result_data = response.json()
+        }
+
+    if endpoint == 'call':
+        system_message = {
+            "role": "system",
+            "content": f"You are Ahmad, a friendly and encouraging {target_lang_name} language teacher. The user's level is {user.german_level}. The user is practicing speaking {target_lang_name}. Always respond in {target_lang_name}, keep responses short and natural like a real conversation. If the message seems unclear or broken, try your best to understand the intent and respond helpfully. Gently correct any grammar mistakes."
+        }
+        if 'session_id' in data:
+            # Server-side history: the client sends only the new utterance
+            if not valid_session_id(data['session_id']) or not data.get('message'):
+                return None
+            conversation = call_sessions.load(user.id, data['session_id'])
+            if conversation.summary:
+                system_message["content"] += "\n\n" + conversation.summary_note()
+            messages = conversation.messages(data['message'])
+        else:
+            messages = data.get('messages', [])
+            if not messages:
+                return None
+        return {
+            "model": "openai/gpt-3.5-turbo",
+            "messages": [system_message] + messages
+        }
+
+    raise ValueError(f"Unknown AI endpoint: {endpoint}")
+
+AI_MISSING_INPUT = {
+    'chat': "No message provided",
+    'practice': "No text provided",
+    'call': "No messages provided",
+}
+AI_FAILURE = {
+    'chat': "Failed to get response from AI",
+    'practice': "Failed to get response from AI",
+    'call': "AI response failed",
+}
+AI_REFERER = {
+    'call': "http://localhost:5000",
+}
+
+def record_ai_activity(endpoint, user, data, result_data):
+    """Award XP for a successful AI completion.
+
+    For practice requests sent with `save_corrections`, the corrections are
+    added to the user's vocabulary in the same transaction.
+    """
+    target_lang_name = "German" if user.target_language == "de" else "English"
+    if endpoint == 'chat':
+        log_activity(user, 'chat', f'Konversation mit Ahmad geführt ({target_lang_name})', 10)
+    elif endpoint == 'call':
+        log_activity(user, 'chat', f'Sprachanruf mit Ahmad geführt ({target_lang_name})', 15)
+    elif endpoint == 'practice':
         try:
             content = json.loads(result_data['choices'][0]['message']['content'])
             score = content.get('score', 0)
-            log_activity(current_user, 'practice', f'Grammatik-Übung abgeschlossen ({score}%)', score // 5)
+            log_activity(user, 'practice', f'Grammatik-Übung abgeschlossen ({score}%)', score // 5, commit=False)
+            if data.get('save_corrections'):
+                corrections = content.get('corrections') or []
+                add_vocabulary_items(user, [{
+                    "word": c.get('original'),
+                    "correction": c.get('correction'),
+                    "explanation": c.get('explanation')
+                } for c in corrections[:MAX_VOCABULARY_BATCH] if isinstance(c, dict)])
+            db.session.commit()
         except:
-            pass
+            db.session.rollback()
+
+def practice_cache_key(user, data):
+    return cache_key('practice', user.target_language, user.german_level, user.native_language, normalize_text(data.get('text', '')))
+
+def analysis_completion(analysis, id, model):
+    """Wrap a practice analysis produced without a single upstream call in the chat completion schema."""
+    return {
+        "id": id,
+        "object": "chat.completion",
+        "model": model,
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": json.dumps(analysis, ensure_ascii=False)}, "finish_reason": "stop"}],
+    }
+
+def completion_analysis(result_data):
+    """The practice analysis inside a completion, or None if it is not a JSON object."""
+    try:
+        analysis = json.loads(result_data['choices'][0]['message']['content'])
+    except (KeyError, IndexError, TypeError, ValueError):
+        return None
+    return analysis if isinstance(analysis, dict) else None
+
+def cached_ai_result(endpoint, user, data):
+    """Return a completion for this request from the practice cache or the local pre-checker, or None."""
+    if endpoint != 'practice':
+        return None
+    if practice_cache is not None:
+        cached = practice_cache.get(practice_cache_key(user, data))
+        if cached is not None:
+            return cached
+    if prechecker is not None:
+        analysis = prechecker.check(data.get('text'), user.target_language, user.native_language)
+        if analysis is not None:
+            return analysis_completion(analysis, "precheck", "local/precheck")
+    return None
+
+def store_ai_result(endpoint, user, data, result_data):
+    """Keep what a successful completion leaves behind: a practice cache entry or a call session turn."""
+    if endpoint == 'call' and 'session_id' in data:
+        try:
+            reply = result_data['choices'][0]['message']['content']
+        except (KeyError, IndexError, TypeError):
+            return
+        if reply:
+            call_sessions.record(user.id, data['session_id'], data['message'], reply)
+        return
+    if endpoint != 'practice' or practice_cache is None:
+        return
+    analysis = completion_analysis(result_data)
+    if analysis is None:
+        return
+    practice_cache.set(practice_cache_key(user, data), result_data)
+    if app.config['PRACTICE_INCREMENTAL'] and 'incremental' not in result_data:
+        # Seed the sentence cache so the next edit of this text only re-checks what changed
+        sentences = split_sentences(data.get('text') or '')
+        analyses = distribute(sentences, analysis) if len(sentences) > 1 else None
+        for sentence, sentence_analysis in zip(sentences, analyses or []):
+            practice_cache.set(sentence_cache_key(user, sentence), sentence_analysis)
+
+def sentence_cache_key(user, sentence):
+    return cache_key('practice-sentence', user.target_language, user.german_level, user.native_language, normalize_text(sentence))
+
+def practice_sentence_plan(endpoint, user, data, payload):
+    """The sentences of a practice text with their cached analyses, or None to send the whole text upstream.
+
+    Sentences without a cached analysis are tried on the local pre-checker. The
+    plan is only used when sending the rest one by one costs fewer prompt tokens
+    than one request with the whole text.
+    """
+    if endpoint != 'practice' or not app.config['PRACTICE_INCREMENTAL'] or practice_cache is None:
+        return None
+    text = data.get('text') or ''
+    sentences = split_sentences(text)
+    if len(sentences) < 2:
+        return None
+    analyses = []
+    for sentence in sentences:
+        analysis = practice_cache.get(sentence_cache_key(user, sentence))
+        if analysis is None and prechecker is not None:
+            analysis = prechecker.check(sentence, user.target_language, user.native_language)
+        analyses.append(analysis)
+    plan = SentencePlan(sentences, analyses)
+    return plan if plan.worth_fanning_out(payload['messages'][0]['content'], text) else None
+
+def sentence_calls(plan, payload, user):
+    """(index, payload, model chain) of the upstream request for each pending sentence of a plan."""
+    return [
+        (i, dict(payload, messages=[payload['messages'][0], {"role": "user", "content": plan.sentences[i]}]),
+         model_chain('practice', user, {'text': plan.sentences[i]}))
+        for i in plan.pending
+    ]
+
+def sentence_outcome(status, result_data, circuit_error=None):
+    """(status, analysis, circuit_error) of one sentence's upstream completion."""
+    if status != 200:
+        return status, None, circuit_error
+    analysis = completion_analysis(result_data)
+    return (200, analysis, None) if analysis is not None else (502, None, None)
+
+def finish_sentence_plan(plan, user, outcomes):
+    """Cache the new sentence analyses and merge the plan into one completion.
+
+    `outcomes` holds (index, status, analysis, circuit_error) for each pending
+    sentence. Returns (status, result_data, circuit_error); a failed sentence
+    fails the request, but the sentences that succeeded stay cached for the retry.
+    """
+    failure = None
+    for i, status, analysis, circuit_error in outcomes:
+        if analysis is None:
+            failure = failure or (status, None, circuit_error)
+            continue
+        plan.analyses[i] = analysis
+        practice_cache.set(sentence_cache_key(user, plan.sentences[i]), analysis)
+    if failure is not None:
+        return failure
+    result_data = analysis_completion(plan.merged(), "incremental", "incremental")
+    result_data["incremental"] = {
+        "sentences": len(plan.sentences),
+        "reused": len(plan.sentences) - len(outcomes),
+        "analysed": len(outcomes),
+    }
+    return 200, result_data, None
+
+def analyse_sentences(calls):
+    """Send the pending sentences of a plan upstream concurrently; returns their outcomes."""
+    def analyse(call):
+        i, payload, chain = call
+        return (i,) + sentence_outcome(*upstream_result('practice', payload, chain))
+    return list(sentence_pool.map(analyse, calls))
+
+def ai_input_chars(endpoint, data):
+    """Length of the learner's input, which the model routing table keys on."""
+    if endpoint == 'practice':
+        return len(data.get('text') or '')
+    if endpoint == 'chat' or 'session_id' in data:
+        return len(data.get('message') or '')
+    messages = data.get('messages') or []
+    last = messages[-1] if messages else None
+    return len(last.get('content') or '') if isinstance(last, dict) else 0
+
+def model_chain(endpoint, user, data):
+    """The model fallback chain for this request, or None to keep the payload's own model."""
+    if router is None:
+        return None
+    route = router.route(endpoint, user.german_level, ai_input_chars(endpoint, data))
+    return router.fallback(route) if route is not None else None
+
+DEGRADED_REPLY = {
+    'de': "Entschuldigung, ich bin gerade nicht erreichbar. Versuch es bitte gleich noch einmal.",
+    'en': "Sorry, I can't answer right now. Please try again in a moment.",
+}
+
+def reply_events(content, **done):
+    """A complete reply as the SSE events of `stream_completion`: one delta, then the done event."""
+    return f"data: {json.dumps({'delta': content})}\n\ndata: {json.dumps(dict({'done': True, 'content': content}, **done))}\n\n"
+
+def degraded_response(endpoint, user, error, stream=False):
+    """Fail-fast reply while the upstream circuit is open; no XP is awarded."""
+    headers = {'Retry-After': str(max(1, round(error.retry_after)))}
+    if endpoint == 'practice':
+        return jsonify({"error": "AI service temporarily unavailable"}), 503, headers
+    content = DEGRADED_REPLY.get(user.target_language, DEGRADED_REPLY['en'])
+    if stream:
+        return Response(reply_events(content, degraded=True), mimetype='text/event-stream', headers=headers)
+    return jsonify({
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+        "degraded": True,
+    }), 200, headers
+
+def unauthorized_response():
+    return jsonify({"error": "Unauthorized"}), 401
+
+def upstream_call(endpoint, payload, chain, stream=False):
+    """Send a completion request through the resilience policy and the model fallback chain.
+
+    Returns (status, response, circuit_error); the response is only kept when the status is 200.
+    """
+    referer = AI_REFERER.get(endpoint, DEFAULT_REFERER)
+    send = llm.stream_chat_completion if stream else llm.chat_completion
+
+    def attempt(model, remaining):
+        start, status = time.perf_counter(), 'error'
+        try:
+            response = send(dict(payload, model=model), referer=referer, timeout=llm.timeout_for(remaining))
+            status = response.status_code
+            return response
+        finally:
+            if metrics is not None:
+                metrics.observe_upstream(endpoint, model, status, time.perf_counter() - start)
+
+    try:
+        response = call_with_resilience(
+            resilience, endpoint,
+            chain.wrap(attempt) if chain is not None else lambda remaining: attempt(payload['model'], remaining),
+            hedge=not stream,
+        )
+    except CircuitOpenError as e:
+        return 503, None, e
+    except requests.exceptions.Timeout:
+        return 504, None, None
+    except requests.exceptions.RequestException:
+        return 502, None, None
+    if response.status_code != 200:
+        response.close()
+        return response.status_code, None, None
+    return 200, response, None
+
+def upstream_result(endpoint, payload, chain):
+    """Non-streaming `upstream_call` returning (status, result_data, circuit_error).
+
+    Identical requests in flight at the same time share one call and its result.
+    """
+    def call():
+        status, response, circuit_error = upstream_call(endpoint, payload, chain)
+        if response is None:
+            return status, None, circuit_error
+        try:
+            result_data = response.json()
+        except ValueError:
+            return 502, None, None
+        if metrics is not None:
+            metrics.observe_usage(endpoint, result_data)
+        return status, result_data, None
+
+    if coalescer is None:
+        return call()
+    return coalescer.do(request_key(endpoint, payload, chain.models if chain is not None else None), call)
+
+def speculative_request(user, data):
+    """(key, payload, model chain) of a /call/api turn with server-side history, or (None, None, None).
+
+    Interim and final transcripts are matched on the key, which is built from
+    the utterance with its whitespace folded.
+    """
+    data = dict(data, message=normalize_text(data.get('message') or ''))
+    if 'session_id' not in data:
+        return None, None, None
+    payload = build_ai_payload('call', user, data)
+    if payload is None:
+        return None, None, None
+    chain = model_chain('call', user, data)
+    return request_key('call', payload, chain.models if chain is not None else None), payload, chain
+
+def claim_speculation(user, data):
+    """The completion speculated from the interim transcripts of this final utterance, or None."""
+    if speculations is None or 'session_id' not in data:
+        return None
+    key, _, _ = speculative_request(user, data)
+    future = speculations.claim((user.id, data['session_id']), key) if key is not None else None
+    if future is None:
+        return None
+    try:
+        status, result_data, _ = future.result()
+    except Exception:
+        log.exception('call_speculation_failed', user_id=user.id)
+        return None
+    return result_data if status == 200 else None
+
+def ai_result_response(endpoint, user, data, status, result_data, circuit_error=None, stream=False):
+    """Store and award XP for a successful completion, or build the error response for a failed one."""
+    if circuit_error is not None:
+        return degraded_response(endpoint, user, circuit_error, stream)
+    if status == 200:
+        store_ai_result(endpoint, user, data, result_data)
+        record_ai_activity(endpoint, user, data, result_data)
+        if stream:
+            content = result_data['choices'][0]['message']['content']
+            return Response(reply_events(content), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache'})
         return jsonify(result_data)
-    else:
-        return jsonify({"error": "Failed to get response from AI"}), response.status_code
+    if status == 504:
+        return jsonify({"error": "AI request timed out"}), 504
+    return jsonify({"error": AI_FAILURE[endpoint]}), status
+
+def ai_endpoint(endpoint):
+    """Shared request handling for /chat/api, /practice/api and /call/api."""
+    data = request.json
+    payload = build_ai_payload(endpoint, current_user, data)
+    if payload is None:
+        return jsonify({"error": AI_MISSING_INPUT[endpoint]}), 400
+
+    cached = cached_ai_result(endpoint, current_user, data)
+    if cached is not None:
+        record_ai_activity(endpoint, current_user, data, cached)
+        return jsonify(cached)
+
+    user = current_user._get_current_object()
+    speculated = claim_speculation(user, data) if endpoint == 'call' else None
+    if speculated is not None:
+        return ai_result_response(endpoint, user, data, 200, speculated, stream=bool(data.get('stream')))
+
+    plan = practice_sentence_plan(endpoint, user, data, payload)
+    if plan is not None:
+        outcomes = analyse_sentences(sentence_calls(plan, payload, user))
+        return ai_result_response(endpoint, user, data, *finish_sentence_plan(plan, user, outcomes))
+
+    chain = model_chain(endpoint, user, data)
+    if not data.get('stream') or endpoint == 'practice':
+        return ai_result_response(endpoint, user, data, *upstream_result(endpoint, payload, chain))
+
+    status, response, circuit_error = upstream_call(endpoint, payload, chain, stream=True)
+    if status != 200:
+        return ai_result_response(endpoint, user, data, status, None, circuit_error, stream=True)
+    def on_complete(content):
+        store_ai_result(endpoint, user, data, {"choices": [{"message": {"role": "assistant", "content": content}}]})
+        record_ai_activity(endpoint, user, data, None)
+    return stream_completion(response, on_complete)
+
+def log_ai_request():
+    """Sampled debug line with the session details of an AI API request (cookie names only, never values)."""
+    log.debug('ai_request', route=request.path, method=request.method, cookies=list(request.cookies.keys()),
+              authenticated=current_user.is_authenticated, secure=request.is_secure)
+
+@app.route('/chat/api', methods=['POST', 'OPTIONS'])
+def chat_api():
+    if request.method == 'OPTIONS':
+        response = make_response('', 200)
+        response.headers['Access-Control-Allow-Methods'] = 'POST, OPTIONS'
+        response.headers['Access-Control-Allow-Headers'] = 'Content-Type'
+        return response
+    
+    log_ai_request()
+    if not current_user.is_authenticated:
+        log.info('ai_request_unauthorized', route=request.path)
+        return unauthorized_response()
+    
+    try:
+        return ai_endpoint('chat')
+    except Exception as e:
+        log.exception('ai_request_failed', route=request.path)
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/practice')
+@login_required
+def practice():
+    return render_template('practice.html')
+
+@app.route('/practice/api', methods=['POST', 'OPTIONS'])
+def practice_api():
+    if request.method == 'OPTIONS':
+        return '', 200
+    
+    # Debug: Check session
+    if not current_user.is_authenticated:
+        return unauthorized_response()
+    
+    return ai_endpoint('practice')
 
 @app.route('/call')
 @login_required
 def call():
-    return render_template('call.html')
+    return render_template('call.html', speculate_ms=app.config['CALL_SPECULATE_STABLE_MS'] if speculations is not None else 0,
+                           speculate_min_words=app.config['CALL_SPECULATE_MIN_WORDS'])
 
 @app.route('/call/api', methods=['POST', 'OPTIONS'])
 def call_api():
     if request.method == 'OPTIONS':
         return '', 200
     
-    # Debug: Print session info to console
-    print(f"\n=== /call/api called ===")
-    print(f"Cookies: {list(request.cookies.keys())}")
-    print(f"Session cookie: {request.cookies.get('session', 'NOT SET')[:50] if request.cookies.get('session') else 'NOT SET'}")
-    print(f"User authenticated: {current_user.is_authenticated}")
-    print(f"========================\n")
-    
-    # Debug: Check session
+    log_ai_request()
     if not current_user.is_authenticated:
-        from flask import session
-        return jsonify({
-            "error": "Unauthorized",
-            "debug": {
-                "cookies": list(request.cookies.keys()),
-                "session_cookie": request.cookies.get('session', 'NOT SET'),
-                "session_data": dict(session),
-                "user_agent": request.headers.get('User-Agent', 'Unknown')[:50]
-            }
-        }), 401
+        log.info('ai_request_unauthorized', route=request.path)
+        return unauthorized_response()
     
-    data = request.json
-    messages = data.get('messages', [])
-
-    if not messages:
-        return jsonify({"error": "No messages provided"}), 400
-
-    api_key = "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"
-
-    target_lang = current_user.target_language
-    target_lang_name = "German" if target_lang == "de" else "English"
-
-    system_message = {
-        "role": "system",
-        "content": f"You are Ahmad, a friendly and encouraging {target_lang_name} language teacher. The user's level is {current_user.german_level}. The user is practicing speaking {target_lang_name}. Always respond in {target_lang_name}, keep responses short and natural like a real conversation. If the message seems unclear or broken, try your best to understand the intent and respond helpfully. Gently correct any grammar mistakes."
-    }
+    return ai_endpoint('call')
 
-    response = requests.post(
-        url="https://openrouter.ai/api/v1/chat/completions",
-        headers={
-            "Authorization": f"Bearer {api_key}",
-            "HTTP-Referer": "http://localhost:5000",
-            "X-Title": "DeutschAI",
-        },
-        data=json.dumps({
-            "model": "openai/gpt-3.5-turbo",
-            "messages": [system_message] + messages
-        })
-    )
+@app.route('/call/api/interim', methods=['POST', 'OPTIONS'])
+def call_api_interim():
+    """Start a speculative completion for a stable interim transcript of the current utterance"""
+    if request.method == 'OPTIONS':
+        return '', 200
 
-    if response.status_code == 200:
-        target_lang_name = "German" if current_user.target_language == "de" else "English"
-        log_activity(current_user, 'chat', f'Sprachanruf mit Ahmad geführt ({target_lang_name})', 15)
-        return jsonify(response.json())
-    else:
-        return jsonify({"error": "AI response failed"}), response.status_code
+    if not current_user.is_authenticated:
+        return unauthorized_response()
+    if speculations is None:
+        return jsonify({"error": "Speculation is disabled"}), 404
+    data = request.json or {}
+    if len(normalize_text(data.get('message') or '').split()) < app.config['CALL_SPECULATE_MIN_WORDS']:
+        return jsonify({"status": "too_short"})
+    user = current_user._get_current_object()
+    key, payload, chain = speculative_request(user, data)
+    if key is None:
+        return jsonify({"error": AI_MISSING_INPUT['call']}), 400
+    status = speculations.start((user.id, data['session_id']), key,
+                                lambda: speculation_pool.submit(upstream_result, 'call', payload, chain))
+    return jsonify({"status": status}), 202 if status == 'started' else 200
 
 @app.route('/setting', methods=['GET', 'POST'])
 @login_required
 def setting():
     if request.method == 'POST':
-        current_user.first_name = request.form.get('first_name')
-        current_user.last_name = request.form.get('last_name')
-        current_user.email = request.form.get('email')
-        current_user.german_level = request.form.get('cefr_level')
-        current_user.native_language = request.form.get('native_language', 'en')
-        current_user.target_language = request.form.get('target_language', 'de')
+        # current_user may be a read-only snapshot, so edit the row itself
+        user = db.session.get(User, current_user.id)
+        user.first_name = request.form.get('first_name')
+        user.last_name = request.form.get('last_name')
+        user.email = request.form.get('email')
+        user.german_level = request.form.get('cefr_level')
+        user.native_language = request.form.get('native_language', 'en')
+        user.target_language = request.form.get('target_language', 'de')
+        forget_user(user.id)
+        board = (user.id, user.target_language, user.german_level)
         
         try:
             db.session.commit()
+            if leaderboard is not None:
+                leaderboard.move(*board)
             flash('Profile updated successfully!', 'success')
         except Exception as e:
             db.session.rollback()
@@ -819,40 +1812,373 @@ def vocabulary():
 @login_required
 def add_vocabulary():
     data = request.json
-    word = data.get('word')
-    correction = data.get('correction')
-    explanation = data.get('explanation')
+    result = add_vocabulary_items(current_user, [data])[0]
 
-    if not word or not correction:
+    if result["status"] == "invalid":
         return jsonify({"error": "Missing word or correction"}), 400
-
-    # Avoid duplicates for the same user
-    existing = Vocabulary.query.filter_by(user_id=current_user.id, word=word, correction=correction).first()
-    if existing:
+    if result["status"] == "duplicate":
         return jsonify({"message": "Word already in vocabulary"}), 200
 
-    new_vocab = Vocabulary(
-        user_id=current_user.id,
-        word=word,
-        correction=correction,
-        explanation=explanation
-    )
-    db.session.add(new_vocab)
-    log_activity(current_user, 'vocab', f'Neues Wort gelernt: {correction}', 5)
     db.session.commit()
     return jsonify({"message": "Vocabulary added successfully"}), 201
 
+@app.route('/vocabulary/api/add_batch', methods=['POST', 'OPTIONS'])
+@login_required
+def add_vocabulary_batch():
+    data = request.json or {}
+    items = data.get('items')
+    if not isinstance(items, list) or not items:
+        return jsonify({"error": "No items provided"}), 400
+    if len(items) > MAX_VOCABULARY_BATCH:
+        return jsonify({"error": f"At most {MAX_VOCABULARY_BATCH} items per batch"}), 400
+
+    results = add_vocabulary_items(current_user, items)
+    added = sum(1 for r in results if r["status"] == "added")
+    try:
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"error": "Failed to save vocabulary"}), 500
+    return jsonify({"added": added, "results": results}), 201 if added else 200
+
+VOCABULARY_FIELDS = ('id', 'word', 'correction', 'explanation', 'timestamp')
+VOCABULARY_PAGE_SIZE = 50
+MAX_VOCABULARY_PAGE_SIZE = 200
+
+def encode_cursor(timestamp, id):
+    return base64.urlsafe_b64encode(f"{timestamp.isoformat()}|{id}".encode()).decode()
+
+def decode_cursor(cursor):
+    timestamp, id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+    return datetime.fromisoformat(timestamp), int(id)
+
+def vocabulary_page(user_id, fields=VOCABULARY_FIELDS, cursor=None, limit=VOCABULARY_PAGE_SIZE):
+    """One page of a user's vocabulary, newest first, keyset-paginated on (timestamp, id).
+
+    Selects only the requested columns (plus the cursor keys) instead of
+    loading ORM objects. Returns (items, next_cursor).
+    """
+    columns = [getattr(Vocabulary, f) for f in fields if f not in ('id', 'timestamp')]
+    query = db.select(Vocabulary.id, Vocabulary.timestamp, *columns).where(Vocabulary.user_id == user_id)
+    if cursor is not None:
+        timestamp, id = cursor
+        query = query.where(db.or_(
+            Vocabulary.timestamp < timestamp,
+            db.and_(Vocabulary.timestamp == timestamp, Vocabulary.id < id)
+        ))
+    query = query.order_by(Vocabulary.timestamp.desc(), Vocabulary.id.desc()).limit(limit + 1)
+    rows = db.session.execute(query).all()
+
+    next_cursor = encode_cursor(rows[limit - 1].timestamp, rows[limit - 1].id) if len(rows) > limit else None
+    items = []
+    for row in rows[:limit]:
+        item = {f: getattr(row, f) for f in fields}
+        if 'timestamp' in item:
+            item['timestamp'] = row.timestamp.isoformat()
+        items.append(item)
+    return items, next_cursor
+
 @app.route('/vocabulary/api/list', methods=['GET', 'OPTIONS'])
 @login_required
 def list_vocabulary():
-    vocabs = Vocabulary.query.filter_by(user_id=current_user.id).order_by(Vocabulary.timestamp.desc()).all()
-    return jsonify([{
-        "id": v.id,
-        "word": v.word,
-        "correction": v.correction,
-        "explanation": v.explanation,
-        "timestamp": v.timestamp.isoformat()
-    } for v in vocabs])
+    fields = request.args.get('fields')
+    fields = tuple(f for f in fields.split(',') if f) if fields else VOCABULARY_FIELDS
+    if not fields or any(f not in VOCABULARY_FIELDS for f in fields):
+        return jsonify({"error": f"fields must be a subset of {','.join(VOCABULARY_FIELDS)}"}), 400
+    try:
+        limit = min(max(int(request.args.get('limit', VOCABULARY_PAGE_SIZE)), 1), MAX_VOCABULARY_PAGE_SIZE)
+        cursor = decode_cursor(request.args['cursor']) if request.args.get('cursor') else None
+    except ValueError:
+        return jsonify({"error": "Invalid limit or cursor"}), 400
+
+    items, next_cursor = vocabulary_page(current_user.id, fields, cursor, limit)
+    response = jsonify({"items": items, "next_cursor": next_cursor})
+    response.headers['Cache-Control'] = 'private, no-cache'
+    response.add_etag()
+    return response.make_conditional(request)
+
+VOCABULARY_SEARCH_LIMIT = 20
+MAX_VOCABULARY_SEARCH_LIMIT = 100
+
+def like_search_ids(user_id, query, limit):
+    """Newest items containing `query` in any field, for databases without the FTS5 index."""
+    pattern = '%' + query.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+    fields = (Vocabulary.word, Vocabulary.correction, Vocabulary.explanation)
+    statement = (db.select(Vocabulary.id)
+                 .where(Vocabulary.user_id == user_id, db.or_(*(f.ilike(pattern, escape='\\') for f in fields)))
+                 .order_by(Vocabulary.timestamp.desc(), Vocabulary.id.desc()).limit(limit))
+    return [(id, 'like') for id in db.session.execute(statement).scalars()]
+
+def search_vocabulary(user_id, query, limit=VOCABULARY_SEARCH_LIMIT):
+    """The user's vocabulary items matching `query`, best first, each with how it matched.
+
+    'fts' is a word or prefix match, 'fuzzy' a typo-tolerant one and 'like' a
+    substring match where the database has no search index.
+    """
+    ranked = None
+    if db.engine.dialect.name == 'sqlite':
+        try:
+            ranked = vocabulary_search.search(db.session, user_id, query, limit)
+        except OperationalError:
+            db.session.rollback()
+            log.warning('vocabulary_search_index_missing', hint='run migrate_db.py')
+    if ranked is None:
+        ranked = like_search_ids(user_id, query, limit)
+    if not ranked:
+        return []
+    # By primary key only: with user_id in the WHERE clause SQLite scans the user's rows by index instead
+    rows = db.session.execute(
+        db.select(Vocabulary.user_id, *(getattr(Vocabulary, f) for f in VOCABULARY_FIELDS))
+        .where(Vocabulary.id.in_([id for id, _ in ranked]))
+    ).all()
+    by_id = {row.id: row for row in rows if row.user_id == user_id}
+    items = []
+    for id, match in ranked:
+        row = by_id.get(id)
+        if row is not None:
+            items.append(dict({f: getattr(row, f) for f in VOCABULARY_FIELDS}, timestamp=row.timestamp.isoformat(), match=match))
+    return items
+
+@app.route('/vocabulary/api/search', methods=['GET', 'OPTIONS'])
+@login_required
+def search_vocabulary_api():
+    query = (request.args.get('q') or '').strip()
+    if not query:
+        return jsonify({"error": "No query provided"}), 400
+    try:
+        limit = min(max(int(request.args.get('limit', VOCABULARY_SEARCH_LIMIT)), 1), MAX_VOCABULARY_SEARCH_LIMIT)
+    except ValueError:
+        return jsonify({"error": "Invalid limit"}), 400
+    return jsonify({"items": search_vocabulary(current_user.id, query, limit)})
+
+REVIEW_FIELDS = VOCABULARY_FIELDS + ('due_at', 'interval_days', 'reps')
+REVIEW_LIMIT = 20
+MAX_REVIEW_LIMIT = 100
+MAX_REVIEW_GRADES = 200
+
+def due_vocabulary(user_id, now, limit=REVIEW_LIMIT):
+    """The user's items due for review at `now`, most overdue first.
+
+    Reads `limit` entries off ix_vocabulary_user_due, however large the
+    vocabulary or the backlog of due items.
+    """
+    rows = db.session.execute(
+        db.select(*(getattr(Vocabulary, f) for f in REVIEW_FIELDS))
+        .where(Vocabulary.user_id == user_id, Vocabulary.due_at <= now)
+        .order_by(Vocabulary.due_at, Vocabulary.id).limit(limit)
+    ).all()
+    return [dict({f: getattr(row, f) for f in REVIEW_FIELDS},
+                 timestamp=row.timestamp.isoformat(), due_at=row.due_at.isoformat()) for row in rows]
+
+def grade_reviews(user, grades, now):
+    """Apply a batch of review grades in one transaction; returns one status dict per input grade, in order.
+
+    Only items that are due can be graded, so replaying a batch neither
+    reschedules nor awards anything twice.
+    """
+    results = [None] * len(grades)
+    wanted = {}
+    for index, item in enumerate(grades):
+        id = item.get('id') if isinstance(item, dict) else None
+        grade = item.get('grade') if isinstance(item, dict) else None
+        if type(id) is not int or type(grade) is not int or not 0 <= grade <= MAX_GRADE:
+            results[index] = {"status": "invalid", "error": f"Expected an item id and a grade from 0 to {MAX_GRADE}"}
+        elif id in wanted:
+            results[index] = {"status": "duplicate"}
+        else:
+            wanted[id] = index
+
+    rows = db.session.execute(
+        db.select(Vocabulary.id, Vocabulary.user_id, Vocabulary.ease, Vocabulary.interval_days, Vocabulary.reps, Vocabulary.due_at)
+        .where(Vocabulary.id.in_(list(wanted)))
+    ).all() if wanted else []
+    by_id = {row.id: row for row in rows if row.user_id == user.id}
+    updates, graded = [], []
+    for id, index in wanted.items():
+        row = by_id.get(id)
+        if row is None:
+            results[index] = {"status": "not_found"}
+        elif row.due_at > now:
+            results[index] = {"status": "not_due", "due_at": row.due_at.isoformat()}
+        else:
+            grade = grades[index]['grade']
+            ease, interval_days, reps, due_at = schedule(row.ease, row.interval_days, row.reps, grade, now)
+            updates.append({'id': id, 'ease': ease, 'interval_days': interval_days, 'reps': reps, 'due_at': due_at})
+            graded.append(grade)
+            results[index] = {"status": "graded", "interval_days": interval_days, "due_at": due_at.isoformat()}
+
+    points = review_points(graded)
+    if updates:
+        # Bulk UPDATE by primary key: one executemany for the whole batch
+        db.session.execute(db.update(Vocabulary), updates)
+        log_activity(user, 'vocab', f'{len(updates)} Wörter wiederholt', points, commit=False)
+    return results, points
+
+@app.route('/vocabulary/api/review', methods=['GET', 'OPTIONS'])
+@login_required
+def review_vocabulary():
+    try:
+        limit = min(max(int(request.args.get('limit', REVIEW_LIMIT)), 1), MAX_REVIEW_LIMIT)
+    except ValueError:
+        return jsonify({"error": "Invalid limit"}), 400
+    return jsonify({"items": due_vocabulary(current_user.id, datetime.utcnow(), limit)})
+
+@app.route('/vocabulary/api/review/grade', methods=['POST', 'OPTIONS'])
+@login_required
+def grade_vocabulary():
+    data = request.json or {}
+    grades = data.get('grades')
+    if not isinstance(grades, list) or not grades:
+        return jsonify({"error": "No grades provided"}), 400
+    if len(grades) > MAX_REVIEW_GRADES:
+        return jsonify({"error": f"At most {MAX_REVIEW_GRADES} grades per batch"}), 400
+
+    results, points = grade_reviews(current_user, grades, datetime.utcnow())
+    try:
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"error": "Failed to save reviews"}), 500
+    return jsonify({"xp": points, "results": results}), 200
+
+def export_pages(model, fields, user_id):
+    """A user's rows of `model` as tuples of `fields`, oldest first, in pages keyset-paginated on (timestamp, id)."""
+    size = app.config['EXPORT_PAGE_SIZE']
+    columns = [getattr(model, f) for f in fields] + [model.timestamp, model.id]
+    after = None
+    while True:
+        query = db.select(*columns).where(model.user_id == user_id)
+        if after is not None:
+            query = query.where(db.tuple_(model.timestamp, model.id) > after)
+        rows = db.session.execute(query.order_by(model.timestamp, model.id).limit(size)).all()
+        # Let go of the read snapshot between pages, so a slow download does not hold one open throughout
+        db.session.rollback()
+        if rows:
+            yield [row[:-2] for row in rows]
+        if len(rows) < size:
+            return
+        after = tuple(rows[-1][-2:])
+
+def export_response(name, model, fields):
+    format = format_for(request.args.get('format', 'ndjson'))
+    if format is None or (format == 'anki' and model is not Vocabulary):
+        return jsonify({"error": "Unsupported export format"}), 400
+    chunks = encode(format, fields, export_pages(model, fields, current_user.id))
+    filename = f"deutschai-{name}-{datetime.utcnow():%Y%m%d}.{EXTENSIONS[format]}"
+    return Response(stream_with_context(chunks), content_type=CONTENT_TYPES[format], headers={
+        'Content-Disposition': f'attachment; filename="{filename}"',
+        'Cache-Control': 'no-store',
+        'X-Accel-Buffering': 'no',
+    })
+
+@app.route('/vocabulary/api/export', methods=['GET', 'OPTIONS'])
+@login_required
+def export_vocabulary():
+    return export_response('vocabulary', Vocabulary, VOCABULARY_EXPORT_FIELDS)
+
+@app.route('/activity/api/export', methods=['GET', 'OPTIONS'])
+@login_required
+def export_activity():
+    return export_response('activity', Activity, ACTIVITY_EXPORT_FIELDS)
+
+LEADERBOARD_LIMIT = 20
+MAX_LEADERBOARD_LIMIT = 100
+
+@app.route('/leaderboard/api', methods=['GET', 'OPTIONS'])
+@login_required
+def leaderboard_api():
+    """A page of a leaderboard and the learner's own rank on it.
+
+    `window` is 'all' (all-time XP) or 'week' (since Monday, UTC); `scope` is
+    'global', 'language' (the learner's target language) or 'level' (their CEFR level).
+    """
+    if leaderboard is None:
+        return jsonify({"error": "Leaderboards are disabled"}), 404
+    window, scope = request.args.get('window', 'all'), request.args.get('scope', 'global')
+    if window not in ('all', 'week') or scope not in ('global', 'language', 'level'):
+        return jsonify({"error": "Unknown window or scope"}), 400
+    try:
+        offset = max(int(request.args.get('offset', 0)), 0)
+        limit = min(max(int(request.args.get('limit', LEADERBOARD_LIMIT)), 1), MAX_LEADERBOARD_LIMIT)
+    except ValueError:
+        return jsonify({"error": "Invalid offset or limit"}), 400
+    board = {'global': 'global', 'language': f'language:{current_user.target_language}',
+             'level': f'level:{current_user.german_level}'}[scope]
+
+    leaderboard.ensure_built()
+    entries, total = leaderboard.page(window, board, offset, limit)
+    names = {row.id: f"{row.first_name} {row.last_name[:1]}." for row in db.session.execute(
+        db.select(User.id, User.first_name, User.last_name).where(User.id.in_([user_id for _, user_id, _ in entries])))}
+    return jsonify({
+        "window": window, "scope": board, "total": total,
+        "me": leaderboard.rank(current_user.id, window, board),
+        "items": [{"rank": rank, "name": names.get(user_id, ''), "xp": xp, "me": user_id == current_user.id}
+                  for rank, user_id, xp in entries],
+    })
+
+MAX_IMPORT_ERRORS = 20
+
+def import_vocabulary_rows(user_id, rows):
+    """Insert one batch of imported rows in its own transaction; returns how many were new.
+
+    Rows already in the vocabulary are skipped by the unique constraint. No
+    XP is awarded: an import brings words over, it does not learn them.
+    """
+    now = datetime.utcnow()
+    values = [dict({'timestamp': now, 'due_at': now, 'ease': START_EASE, 'interval_days': 0, 'reps': 0}, **row, user_id=user_id)
+              for row in rows]
+    # An executemany of one cached statement: a multi-row VALUES clause would be compiled anew for every batch
+    added = db.session.execute(insert_ignoring_conflicts(Vocabulary.__table__).returning(Vocabulary.id), values).all()
+    db.session.commit()
+    return len(added)
+
+@app.route('/vocabulary/api/import', methods=['POST', 'OPTIONS'])
+@login_required
+def import_vocabulary():
+    """Import a vocabulary file (multipart `file`, or the raw request body) in NDJSON, CSV or Anki TSV.
+
+    The file is read line by line and written IMPORT_BATCH_SIZE rows per
+    transaction, so a failure part-way keeps the batches before it.
+    """
+    if request.content_length is not None and request.content_length > app.config['IMPORT_MAX_BYTES']:
+        return jsonify({"error": f"Files are limited to {app.config['IMPORT_MAX_BYTES'] // (1024 * 1024)} MB"}), 413
+    upload = request.files.get('file') if request.mimetype == 'multipart/form-data' else None
+    format = format_for(request.args.get('format'), upload.filename if upload is not None else None)
+    if format is None:
+        return jsonify({"error": "Unknown format: pass format=ndjson, csv or anki"}), 400
+    stream = upload.stream if upload is not None else request.stream
+
+    user_id = current_user.id
+    batch_size = app.config['IMPORT_BATCH_SIZE']
+    batch = {}
+    counts = {'imported': 0, 'duplicates': 0, 'invalid': 0}
+    errors = []
+    try:
+        for line, row in read_vocabulary(format, stream):
+            if isinstance(row, str):
+                counts['invalid'] += 1
+                if len(errors) < MAX_IMPORT_ERRORS:
+                    errors.append({'line': line, 'error': row})
+                continue
+            key = (row['word'], row['correction'])
+            if key in batch:
+                counts['duplicates'] += 1
+                continue
+            batch[key] = row
+            if len(batch) == batch_size:
+                added = import_vocabulary_rows(user_id, list(batch.values()))
+                counts['imported'] += added
+                counts['duplicates'] += len(batch) - added
+                batch = {}
+        if batch:
+            added = import_vocabulary_rows(user_id, list(batch.values()))
+            counts['imported'] += added
+            counts['duplicates'] += len(batch) - added
+    except Exception:
+        db.session.rollback()
+        log.exception('vocabulary_import_failed', user_id=user_id, **counts)
+        return jsonify(dict(counts, error="Import stopped part-way; the rows counted as imported were saved", errors=errors)), 500
+    return jsonify(dict(counts, errors=errors)), 200
 
 @app.route('/vocabulary/api/delete/<int:vocab_id>', methods=['DELETE', 'OPTIONS'])
 @login_required
@@ -866,6 +2192,8 @@ def delete_vocabulary(vocab_id):
     return jsonify({"message": "Vocabulary item deleted"}), 200
 
 if __name__ == '__main__':
+    from migrate_db import migrate
     with app.app_context():
         db.create_all()
+        migrate(db.engine.url.render_as_string(hide_password=False), db.metadata, rebuild_user_stats)
     app.run(debug=True)
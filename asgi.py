@@ -0,0 +1,276 @@
+"""ASGI entry point for the async serving mode.
+
+    uvicorn asgi:application --proxy-headers --workers 2
+
+POSTs to /chat/api, /practice/api and /call/api are handled in three phases:
+a short synchronous *prepare* step (session, user, upstream payload, cache
+lookup) and a short *finish* step (cache store, log_activity, JSON response)
+run on a worker thread inside a Flask request context, while the upstream
+completion itself is awaited on the event loop with httpx. A slow LLM call
+therefore holds a coroutine instead of a thread, and one process can keep
+hundreds of them in flight. An incremental practice re-check awaits its
+changed sentences concurrently. Streaming requests and every other route are delegated unchanged to
+the WSGI app.
+"""
+import asyncio
+import io
+import json
+import sys
+import time
+
+import httpx
+from asgiref.wsgi import WsgiToAsgi
+from flask import jsonify, request
+from flask_login import current_user
+
+from app import (
+    app, AI_MISSING_INPUT, AI_REFERER, ai_result_response, build_ai_payload, cached_ai_result, claim_speculation, finish_sentence_plan,
+    coalescer, metrics, model_chain, practice_sentence_plan, record_ai_activity, resilience, sentence_calls, sentence_outcome,
+    unauthorized_response,
+)
+from llm_client import DEFAULT_REFERER, AsyncUpstreamClient
+from metrics import ENVIRON_KEY, RequestStats
+from resilience import CircuitOpenError, acall_with_resilience
+from singleflight import request_key
+
+ASYNC_ROUTES = {
+    '/chat/api': 'chat',
+    '/practice/api': 'practice',
+    '/call/api': 'call',
+}
+
+
+def build_environ(scope, body):
+    """Translate an ASGI HTTP scope plus its body into a WSGI environ."""
+    server = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf8').decode('latin1'),
+        'PATH_INFO': scope['path'].encode('utf8').decode('latin1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('ascii'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1] or 80),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    if scope.get('client'):
+        environ['REMOTE_ADDR'] = scope['client'][0]
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin1')
+        value = value.decode('latin1')
+        if name == 'content-length':
+            key = 'CONTENT_LENGTH'
+        elif name == 'content-type':
+            key = 'CONTENT_TYPE'
+        else:
+            key = 'HTTP_' + name.upper().replace('-', '_')
+        environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+class AsyncAIApplication:
+    def __init__(self, flask_app):
+        self.app = flask_app
+        self.fallback = WsgiToAsgi(flask_app)
+        self.llm = None
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+        endpoint = None
+        if scope['type'] == 'http' and scope['method'] == 'POST':
+            endpoint = ASYNC_ROUTES.get(scope['path'])
+        if endpoint is None:
+            return await self.fallback(scope, receive, send)
+
+        body = await read_body(receive)
+        if endpoint != 'practice' and wants_stream(body):
+            return await self.fallback(scope, replay(body, receive), send)
+
+        # prepare() and finish() run in two request contexts but count as one request in /metrics
+        stats = RequestStats()
+        environ = build_environ(scope, body)
+        environ[ENVIRON_KEY] = stats
+        prepared, early = await asyncio.to_thread(self.prepare, endpoint, environ)
+        if early is not None:
+            return await send_response(send, *early)
+        payload, chain, plan, calls = prepared
+
+        if self.llm is None:
+            self.llm = AsyncUpstreamClient.from_config(self.app.config)
+        outcomes = None
+        if plan is not None:
+            # Only the changed sentences go upstream, all at once
+            results = await asyncio.gather(*(self.complete('practice', call_payload, call_chain) for _, call_payload, call_chain in calls))
+            outcomes = [(i,) + sentence_outcome(*result) for (i, _, _), result in zip(calls, results)]
+            status, result_data, circuit_error = None, None, None
+        else:
+            status, result_data, circuit_error = await self.complete(endpoint, payload, chain)
+        # prepare() consumed the first environ's wsgi.input, and finish() reads the JSON body again
+        environ = build_environ(scope, body)
+        environ[ENVIRON_KEY] = stats
+        await send_response(send, *await asyncio.to_thread(self.finish, endpoint, environ, status, result_data, circuit_error, plan, outcomes))
+
+    async def complete(self, endpoint, payload, chain):
+        """Await one upstream completion, shared with identical requests in flight; returns (status, result_data, circuit_error)."""
+        if coalescer is None:
+            return await self.upstream(endpoint, payload, chain)
+        key = request_key(endpoint, payload, chain.models if chain is not None else None)
+        return await coalescer.ado(key, lambda: self.upstream(endpoint, payload, chain))
+
+    async def upstream(self, endpoint, payload, chain):
+        """One upstream completion through the resilience policy and model fallback chain."""
+        referer = AI_REFERER.get(endpoint, DEFAULT_REFERER)
+
+        async def attempt(model, remaining):
+            start, status = time.perf_counter(), 'error'
+            try:
+                response = await self.llm.chat_completion(dict(payload, model=model), referer=referer, timeout=self.llm.timeout_for(remaining))
+                status = response.status_code
+                return response
+            except asyncio.CancelledError:
+                status = 'cancelled'  # a hedge that lost the race, or the deadline passed
+                raise
+            finally:
+                if metrics is not None:
+                    metrics.observe_upstream(endpoint, model, status, time.perf_counter() - start)
+
+        try:
+            response = await acall_with_resilience(
+                resilience, endpoint,
+                chain.awrap(attempt) if chain is not None else lambda remaining: attempt(payload['model'], remaining),
+            )
+            if response.status_code != 200:
+                return response.status_code, None, None
+            result_data = response.json()
+            if metrics is not None:
+                metrics.observe_usage(endpoint, result_data)
+            return 200, result_data, None
+        except ValueError:
+            return 502, None, None
+        except CircuitOpenError as e:
+            return 503, None, e
+        except httpx.TimeoutException:
+            return 504, None, None
+        except httpx.HTTPError:
+            return 502, None, None
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                if self.llm is not None:
+                    await self.llm.aclose()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    def prepare(self, endpoint, environ):
+        """Authenticate and build the upstream request.
+
+        Returns ((payload, model chain, sentence plan, sentence calls), None), where
+        the plan is None unless only some sentences of a practice text need the
+        upstream, or (None, response) when no upstream call is needed: a cached
+        result, or a call turn whose reply was speculated from its interim transcripts.
+        """
+        with self.app.request_context(environ):
+            try:
+                rv = self.app.preprocess_request()
+                if rv is None:
+                    if not current_user.is_authenticated:
+                        rv = unauthorized_response()
+                    else:
+                        data = request.json
+                        payload = build_ai_payload(endpoint, current_user, data)
+                        if payload is None:
+                            rv = jsonify({"error": AI_MISSING_INPUT[endpoint]}), 400
+                        else:
+                            cached = cached_ai_result(endpoint, current_user, data)
+                            user = current_user._get_current_object()
+                            speculated = claim_speculation(user, data) if cached is None and endpoint == 'call' else None
+                            if speculated is not None:
+                                rv = ai_result_response(endpoint, user, data, 200, speculated)
+                            elif cached is None:
+                                plan = practice_sentence_plan(endpoint, user, data, payload)
+                                if plan is None:
+                                    return (payload, model_chain(endpoint, user, data), None, None), None
+                                return (payload, None, plan, sentence_calls(plan, payload, user)), None
+                            else:
+                                record_ai_activity(endpoint, current_user, data, cached)
+                                rv = jsonify(cached)
+            except Exception as e:
+                rv = self.handle_exception(e)
+            return None, self.finalize(rv)
+
+    def finish(self, endpoint, environ, status, result_data, circuit_error=None, plan=None, outcomes=None):
+        """Award XP for a successful completion and build the final response.
+
+        With a sentence plan, the sentence outcomes are merged into the completion first.
+        """
+        with self.app.request_context(environ):
+            try:
+                user = current_user._get_current_object()
+                if plan is not None:
+                    status, result_data, circuit_error = finish_sentence_plan(plan, user, outcomes)
+                rv = ai_result_response(endpoint, user, request.json, status, result_data, circuit_error)
+            except Exception as e:
+                rv = self.handle_exception(e)
+            return self.finalize(rv)
+
+    def handle_exception(self, e):
+        """The error path of Flask's wsgi_app: error handlers first, then handle_exception's 500."""
+        try:
+            return self.app.handle_user_exception(e)
+        except Exception as error:
+            return self.app.handle_exception(error)
+
+    def finalize(self, rv):
+        response = self.app.process_response(self.app.make_response(rv))
+        return response.status_code, response.headers.to_wsgi_list(), response.get_data()
+
+
+async def read_body(receive):
+    body = b''
+    while True:
+        message = await receive()
+        body += message.get('body', b'')
+        if not message.get('more_body'):
+            return body
+
+
+def replay(body, receive):
+    """Return a `receive` callable that yields the already-read body first."""
+    pending = [{'type': 'http.request', 'body': body, 'more_body': False}]
+
+    async def wrapped():
+        if pending:
+            return pending.pop()
+        return await receive()
+    return wrapped
+
+
+def wants_stream(body):
+    try:
+        data = json.loads(body or b'{}')
+    except ValueError:
+        return False
+    return isinstance(data, dict) and bool(data.get('stream'))
+
+
+async def send_response(send, status, headers, body):
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(name.lower().encode('latin1'), value.encode('latin1')) for name, value in headers],
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+application = AsyncAIApplication(app)
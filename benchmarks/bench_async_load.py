@@ -0,0 +1,123 @@
+"""Load test of the AI endpoints: sync WSGI workers vs the async ASGI app.
+
+Both servers talk to a local stub upstream with a fixed completion delay.
+Reports p50/p99 latency, throughput and the maximum number of upstream calls
+that were in flight at once.
+
+    python -m benchmarks.bench_async_load [concurrency] [requests] [upstream_delay_s] [sync_threads]
+"""
+import asyncio
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+
+import httpx
+
+from benchmarks.harness import create_user, load_app, login_cookie
+from benchmarks.stub_upstream import start_stub
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+class PooledWSGIServer(WSGIServer):
+    """wsgiref server with a fixed number of worker threads, like a gthread worker."""
+    request_queue_size = 1024
+    threads = 8
+
+    def process_request(self, request, client_address):
+        self.pool.submit(self.process_request_thread, request, client_address)
+
+    def process_request_thread(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+
+def serve_sync(wsgi_app, threads):
+    PooledWSGIServer.threads = threads
+    server = make_server('127.0.0.1', 0, wsgi_app, server_class=PooledWSGIServer, handler_class=QuietHandler)
+    server.pool = ThreadPoolExecutor(threads)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}", server.shutdown
+
+
+def serve_async(asgi_app):
+    import socket
+    import uvicorn
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    server = uvicorn.Server(uvicorn.Config(asgi_app, log_level='warning', backlog=2048, limit_concurrency=None))
+    threading.Thread(target=server.run, kwargs={'sockets': [sock]}, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+
+    def stop():
+        server.should_exit = True
+    return server, f"http://127.0.0.1:{sock.getsockname()[1]}", stop
+
+
+async def drive(base_url, cookie, concurrency, total):
+    latencies, statuses = [], {}
+    queue = asyncio.Queue()
+    for i in range(total):
+        queue.put_nowait(i)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, headers={'Cookie': cookie}, limits=limits, timeout=120) as client:
+        async def worker():
+            while not queue.empty():
+                queue.get_nowait()
+                start = time.perf_counter()
+                response = await client.post('/chat/api', json={'message': 'Hallo, wie geht es dir?'})
+                latencies.append(time.perf_counter() - start)
+                statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        'p50': latencies[len(latencies) // 2],
+        'p99': latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))],
+        'rps': total / elapsed,
+        'statuses': statuses,
+    }
+
+
+def main():
+    concurrency = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    total = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    delay = float(sys.argv[3]) if len(sys.argv) > 3 else 0.5
+    threads = int(sys.argv[4]) if len(sys.argv) > 4 else 8
+
+    stub, upstream_url = start_stub(delay=delay)
+    app_module = load_app(upstream_url)
+    create_user(app_module)
+    cookie = login_cookie(app_module)
+    # The debug prints in the sync views would dominate at this volume
+    import builtins
+    builtins.print, real_print = (lambda *a, **k: None), builtins.print
+
+    from asgi import application
+    results = {}
+    for mode, serve in (('sync', lambda: serve_sync(app_module.app, threads)), ('async', lambda: serve_async(application))):
+        _, base_url, stop = serve()
+        stub.max_in_flight = 0
+        results[mode] = asyncio.run(drive(base_url, cookie, concurrency, total))
+        results[mode]['max_in_flight'] = stub.max_in_flight
+        stop()
+
+    builtins.print = real_print
+    print(f"{concurrency} concurrent clients, {total} requests, upstream delay {delay}s, {threads} sync worker threads")
+    for mode, r in results.items():
+        print(f"{mode:>6}: p50 {r['p50'] * 1000:7.1f} ms  p99 {r['p99'] * 1000:7.1f} ms  "
+              f"{r['rps']:7.1f} req/s  max in-flight upstream {r['max_in_flight']:4d}  statuses {r['statuses']}")
+    stub.shutdown()
+
+
+if __name__ == '__main__':
+    main()
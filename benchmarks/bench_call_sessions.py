@@ -0,0 +1,83 @@
+"""Per-turn cost of a long voice call: full client-side history vs server-side sessions.
+
+Plays one call of `turns` utterances against a local stub upstream in two ways.
+In the legacy mode the browser resends `messages`; in the session mode it sends
+`session_id` plus `message`. Reports latency, request body size and the
+estimated prompt tokens sent upstream at a few turn numbers.
+
+    python -m benchmarks.bench_call_sessions [turns]
+"""
+import json
+import statistics
+import sys
+import time
+
+from benchmarks.harness import create_user, load_app
+from benchmarks.stub_upstream import StubHandler, completion_body, start_stub
+from conversation import estimate_tokens
+
+REPORT_AT = (5, 50, 200)
+REPLY = ("Das klingt wirklich interessant! Erzähl mir mehr darüber, was du am Wochenende gemacht hast. "
+         "Übrigens sagt man 'ich bin gegangen', nicht 'ich habe gegangen'.")
+
+
+class RecordingHandler(StubHandler):
+    """Stub that remembers the size of the last prompt and answers with a tutor-length reply."""
+
+    def respond(self, payload):
+        self.server.last_prompt_tokens = sum(estimate_tokens(m['content']) for m in payload['messages'])
+        body = json.dumps(completion_body(REPLY)).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def utterance(turn):
+    return f"Am Wochenende war ich mit meinen Freunden im Park und wir haben Fußball gespielt, Runde {turn}."
+
+
+def play(client, server, turns, use_session):
+    history, rows = [], {}
+    for turn in range(1, turns + 1):
+        message = utterance(turn)
+        if use_session:
+            body = {'session_id': 'bench-call', 'message': message}
+        else:
+            history.append({'role': 'user', 'content': message})
+            body = {'messages': history}
+        raw = json.dumps(body)
+        start = time.perf_counter()
+        response = client.post('/call/api', data=raw, content_type='application/json')
+        elapsed = time.perf_counter() - start
+        reply = response.get_json()['choices'][0]['message']['content']
+        if not use_session:
+            history.append({'role': 'assistant', 'content': reply})
+        rows[turn] = (elapsed, len(raw), server.last_prompt_tokens)
+    return rows
+
+
+def main():
+    turns = int(sys.argv[1]) if len(sys.argv) > 1 else max(REPORT_AT)
+    server, url = start_stub(handler=RecordingHandler)
+    app_module = load_app(upstream_url=url)
+    create_user(app_module)
+    client = app_module.app.test_client()
+    client.post('/login', data={'email': 'bench@example.com', 'password': 'bench-password'})
+    try:
+        results = {mode: play(client, server, turns, mode == 'session') for mode in ('legacy', 'session')}
+    finally:
+        server.shutdown()
+
+    print(f"{'turn':>5} {'mode':>8} {'latency ms':>11} {'request bytes':>14} {'upstream tokens':>16}")
+    for turn in (t for t in REPORT_AT if t <= turns):
+        for mode, rows in results.items():
+            # Median latency over the three turns ending at `turn` to smooth out noise
+            latency = statistics.median(rows[t][0] for t in range(max(1, turn - 2), turn + 1))
+            _, size, tokens = rows[turn]
+            print(f"{turn:>5} {mode:>8} {latency * 1000:>11.2f} {size:>14} {tokens:>16}")
+
+
+if __name__ == '__main__':
+    main()
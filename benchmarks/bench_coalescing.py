@@ -0,0 +1,109 @@
+"""Upstream calls and latency for a classroom burst, with and without coalescing.
+
+A class of learners submits the same exercise sentence to /practice/api at
+the same moment, for several sentences in a row, against a stub upstream that
+takes 500 ms per call. The practice cache is off, because it only helps once
+the first call has returned. Each run checks that every learner was still
+awarded XP. The sync run drives the Flask app from one thread per learner;
+the async run sends the same bursts through the ASGI app.
+
+    python -m benchmarks.bench_coalescing [learners] [bursts]
+"""
+import asyncio
+import sys
+import threading
+import time
+
+import httpx
+
+from benchmarks.harness import create_user, load_app, login_cookie
+from benchmarks.stub_upstream import start_stub
+from singleflight import SingleFlight
+
+EXERCISES = [
+    "Gestern bin ich mit meinem Freund ins Kino gegangen.",
+    "Wenn ich Zeit hätte, würde ich mehr Bücher lesen.",
+    "Der Mann, dem ich geholfen habe, wohnt neben uns.",
+    "Obwohl es regnet, gehen wir heute spazieren.",
+    "Ich freue mich schon auf die Sommerferien.",
+]
+
+
+def total_xp(app_module):
+    with app_module.app.app_context():
+        return sum(user.xp or 0 for user in app_module.User.query.all())
+
+
+def sync_burst(clients, text):
+    latencies = []
+    barrier = threading.Barrier(len(clients))
+
+    def learner(client):
+        barrier.wait()
+        start = time.perf_counter()
+        response = client.post('/practice/api', json={'text': text})
+        latencies.append(time.perf_counter() - start)
+        assert response.status_code == 200, response.status_code
+
+    threads = [threading.Thread(target=learner, args=(client,)) for client in clients]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies
+
+
+async def async_burst(application, cookies, text):
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=application), base_url='http://bench', timeout=60) as client:
+        async def learner(cookie):
+            start = time.perf_counter()
+            response = await client.post('/practice/api', json={'text': text}, headers={'Cookie': cookie})
+            assert response.status_code == 200, response.status_code
+            return time.perf_counter() - start
+        return await asyncio.gather(*(learner(cookie) for cookie in cookies))
+
+
+def run(label, app_module, server, burst, learners, bursts):
+    calls, xp = server.requests_seen, total_xp(app_module)
+    latencies = []
+    for i in range(bursts):
+        latencies += burst(EXERCISES[i % len(EXERCISES)])
+    latencies.sort()
+    awarded = total_xp(app_module) - xp
+    stats = app_module.coalescer.stats() if app_module.coalescer is not None else None
+    coalesced = f", coalesced {stats['coalesced_rate']:.0%}" if stats else ''
+    print(f"{label:<22} upstream calls {server.requests_seen - calls:4d} for {learners * bursts} requests{coalesced}  "
+          f"p50 {latencies[len(latencies) // 2] * 1000:5.0f} ms  max {latencies[-1] * 1000:5.0f} ms  XP awarded {awarded}")
+
+
+def main():
+    learners = int(sys.argv[1]) if len(sys.argv) > 1 else 30
+    bursts = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    server, url = start_stub(delay=0.5)
+    app_module = load_app(upstream_url=url)
+    app_module.practice_cache = None
+    app_module.prechecker = None
+    emails = [f'learner{i}@example.com' for i in range(learners)]
+    for email in emails:
+        create_user(app_module, email=email)
+    clients = []
+    for email in emails:
+        client = app_module.app.test_client()
+        client.post('/login', data={'email': email, 'password': 'bench-password'})
+        clients.append(client)
+    cookies = [login_cookie(app_module, email=email) for email in emails]
+    import asgi
+    loop = asyncio.new_event_loop()  # the ASGI app's upstream client stays bound to the loop it was first used on
+    try:
+        for coalescing in (False, True):
+            mode = 'coalescing' if coalescing else 'no coalescing'
+            app_module.coalescer = asgi.coalescer = SingleFlight() if coalescing else None
+            run(f"sync  {mode}", app_module, server, lambda text: sync_burst(clients, text), learners, bursts)
+            run(f"async {mode}", app_module, server, lambda text: loop.run_until_complete(async_burst(asgi.application, cookies, text)),
+                learners, bursts)
+    finally:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
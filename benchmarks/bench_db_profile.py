@@ -0,0 +1,88 @@
+"""Mixed dashboard reads and vocabulary writes under each DB_PROFILE.
+
+Every reader and writer is its own process, like gunicorn workers sharing one
+SQLite file. That cross-process file locking is what WAL changes. Each profile
+gets a fresh database, and the profile is picked through the environment
+because it is read when `app` is imported.
+
+    python -m benchmarks.bench_db_profile [readers] [writers] [seconds]
+"""
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from db_profile import PROFILES
+
+STARTUP_GRACE = 5
+
+
+def worker(role, start_at, seconds):
+    from benchmarks.harness import load_app
+    app_module = load_app(database_url=os.environ['DATABASE_URL'])
+    client = app_module.app.test_client()
+    client.post('/login', data={'email': 'bench@example.com', 'password': 'bench-password'})
+    counts = {'ok': 0, 'errors': 0}
+    latencies = []
+    time.sleep(max(0, start_at - time.time()))
+    deadline = time.time() + seconds
+    i = 0
+    while time.time() < deadline:
+        start = time.perf_counter()
+        if role == 'read':
+            response = client.get('/dashboard')
+        else:
+            word = f'{os.getpid()}-{i}'
+            response = client.post('/vocabulary/api/add', json={'word': word, 'correction': word.upper(), 'explanation': 'bench'})
+        latencies.append(time.perf_counter() - start)
+        counts['ok' if response.status_code in (200, 201) else 'errors'] += 1
+        i += 1
+    latencies.sort()
+    counts['p99'] = latencies[int(len(latencies) * 0.99)] if latencies else 0
+    print(json.dumps(counts))
+
+
+def run_profile(profile, readers, writers, seconds):
+    env = dict(os.environ, DB_PROFILE=profile,
+               DATABASE_URL=f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='deutschai-bench-'), 'bench.db')}")
+    setup = (
+        "from benchmarks.harness import create_user, load_app\n"
+        "import os\n"
+        "create_user(load_app(database_url=os.environ['DATABASE_URL']))\n"
+    )
+    subprocess.run([sys.executable, '-c', setup], env=env, capture_output=True, check=True)
+    start_at = time.time() + STARTUP_GRACE
+    roles = ['read'] * readers + ['write'] * writers
+    procs = [subprocess.Popen(
+        [sys.executable, '-m', 'benchmarks.bench_db_profile', '--worker', role, str(start_at), str(seconds)],
+        env=env, stdout=subprocess.PIPE, text=True,
+    ) for role in roles]
+    results = {'read': [], 'write': []}
+    for role, proc in zip(roles, procs):
+        results[role].append(json.loads(proc.communicate()[0].strip().splitlines()[-1]))
+    return {role: {
+        'rate': sum(r['ok'] for r in rs) / seconds,
+        'errors': sum(r['errors'] for r in rs),
+        'p99': max((r['p99'] for r in rs), default=0),
+    } for role, rs in results.items()}
+
+
+def main():
+    readers = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    writers = int(sys.argv[2]) if len(sys.argv) > 2 else 2
+    seconds = float(sys.argv[3]) if len(sys.argv) > 3 else 10
+    print(f"{readers} reader and {writers} writer processes, {seconds:g}s per profile")
+    for profile in PROFILES:
+        stats = run_profile(profile, readers, writers, seconds)
+        read, write = stats['read'], stats['write']
+        print(f"{profile:>10}: reads {read['rate']:7.1f}/s (p99 {read['p99'] * 1000:6.1f} ms, {read['errors']} errors)  "
+              f"writes {write['rate']:7.1f}/s (p99 {write['p99'] * 1000:6.1f} ms, {write['errors']} errors)")
+
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['--worker']:
+        worker(sys.argv[2], float(sys.argv[3]), float(sys.argv[4]))
+    else:
+        main()
@@ -0,0 +1,153 @@
+"""Export and import of a million-row history: time and peak memory.
+
+Fills one learner with `rows` vocabulary items and `rows` activities, then
+streams each export format to a temporary file through the test client
+(unbuffered, as a browser download would read it). For comparison it also
+builds the whole vocabulary as one JSON array in memory, as list_vocabulary's
+response did before it was paginated. The NDJSON and CSV files are then
+imported into a second learner as raw request bodies, in IMPORT_BATCH_SIZE
+row transactions, with the search triggers in place. Importing the NDJSON
+file again shows the duplicate path.
+
+Memory is the peak anonymous resident set size above the level before each
+phase, sampled every 5 ms from /proc/self/statm, so it only works on Linux.
+File-backed pages are left out: SQLite maps the database file (up to
+SQLITE_MMAP_SIZE), and the pages a scan touches would otherwise show up as
+growth although the kernel can drop them at any time.
+
+    python -m benchmarks.bench_export_import [rows]
+"""
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import text
+
+from benchmarks.harness import create_user, load_app
+from vocabulary_search import INDEX_DDL
+
+PAGE = os.sysconf('SC_PAGE_SIZE')
+
+
+def rss():
+    with open('/proc/self/statm') as statm:
+        resident, shared = statm.read().split()[1:3]
+    return (int(resident) - int(shared)) * PAGE
+
+
+class PeakRss:
+    """Peak anonymous RSS above the starting level while the block runs, in bytes."""
+
+    def __enter__(self):
+        self.base = self.peak = rss()
+        self.done = threading.Event()
+        self.thread = threading.Thread(target=self.sample, daemon=True)
+        self.thread.start()
+        self.start = time.perf_counter()
+        return self
+
+    def sample(self):
+        while not self.done.wait(0.005):
+            self.peak = max(self.peak, rss())
+
+    def __exit__(self, *exc):
+        self.seconds = time.perf_counter() - self.start
+        self.done.set()
+        self.thread.join()
+        self.grown = max(self.peak, rss()) - self.base
+
+
+def fill(app_module, user_id, rows):
+    db = app_module.db
+    now = datetime.utcnow() - timedelta(days=365)
+    with app_module.app.app_context():
+        for name in ('insert', 'delete', 'update'):
+            db.session.execute(text(f"DROP TRIGGER IF EXISTS vocabulary_search_{name}"))
+        for start in range(0, rows, 20000):
+            db.session.execute(db.insert(app_module.Vocabulary), [
+                {'user_id': user_id, 'word': f'Wort{n}', 'correction': f'Wörter{n}', 'explanation': f'Plural von Wort {n}.',
+                 'timestamp': now + timedelta(seconds=n), 'due_at': now} for n in range(start, min(rows, start + 20000))])
+            db.session.execute(db.insert(app_module.Activity), [
+                {'user_id': user_id, 'type': 'vocab', 'description': f'Neues Wort gelernt: Wörter{n}', 'points': 5,
+                 'timestamp': now + timedelta(seconds=n)} for n in range(start, min(rows, start + 20000))])
+        db.session.commit()
+        # Back in place for the imports, without indexing the filler rows
+        for statement in INDEX_DDL:
+            db.session.execute(text(statement))
+        db.session.commit()
+
+
+def export(client, path, target):
+    response = client.get(path, buffered=False)
+    assert response.status_code == 200, response.status_code
+    size = 0
+    with open(target, 'wb') as out:
+        for chunk in response.response:
+            chunk = chunk.encode('utf-8') if isinstance(chunk, str) else chunk
+            size += len(chunk)
+            out.write(chunk)
+    response.close()
+    return size
+
+
+def whole_array(app_module, user_id):
+    with app_module.app.app_context():
+        rows = app_module.db.session.execute(app_module.db.select(app_module.Vocabulary).where(app_module.Vocabulary.user_id == user_id)).scalars().all()
+        return len(json.dumps([{'word': v.word, 'correction': v.correction, 'explanation': v.explanation,
+                                'timestamp': v.timestamp.isoformat()} for v in rows]))
+
+
+def import_file(client, path, format):
+    with open(path, 'rb') as body:
+        response = client.post(f'/vocabulary/api/import?format={format}', input_stream=body,
+                               content_length=os.path.getsize(path), content_type='application/octet-stream')
+    assert response.status_code == 200, response.get_json()
+    return response.get_json()
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    app_module = load_app()
+    exporter = create_user(app_module, email='export@example.com')
+    start = time.perf_counter()
+    fill(app_module, exporter, rows)
+    print(f"{rows} vocabulary rows and {rows} activities filled in {time.perf_counter() - start:.1f} s, "
+          f"export page {app_module.app.config['EXPORT_PAGE_SIZE']}, import batch {app_module.app.config['IMPORT_BATCH_SIZE']}")
+
+    client = app_module.app.test_client()
+    client.post('/login', data={'email': 'export@example.com', 'password': 'bench-password'})
+    directory = tempfile.mkdtemp(prefix='deutschai-export-')
+    files = {}
+    for label, path, format in (('vocabulary', '/vocabulary/api/export', 'ndjson'), ('vocabulary', '/vocabulary/api/export', 'csv'),
+                                ('vocabulary', '/vocabulary/api/export', 'anki'), ('activity', '/activity/api/export', 'ndjson'),
+                                ('activity', '/activity/api/export', 'csv')):
+        target = os.path.join(directory, f'{label}.{format}')
+        with PeakRss() as measured:
+            size = export(client, f'{path}?format={format}', target)
+        files[(label, format)] = target
+        print(f"  export {label:<10} {format:<6} {measured.seconds:6.1f} s  {rows / measured.seconds:9.0f} rows/s"
+              f"  {size / 1e6:6.1f} MB  peak RSS +{measured.grown / 1e6:6.1f} MB")
+    with PeakRss() as measured:
+        size = whole_array(app_module, exporter)
+    print(f"  whole JSON array in memory  {measured.seconds:6.1f} s  {size / 1e6:6.1f} MB  peak RSS +{measured.grown / 1e6:6.1f} MB")
+
+    for format in ('ndjson', 'csv'):
+        create_user(app_module, email=f'import-{format}@example.com')
+        client = app_module.app.test_client()
+        client.post('/login', data={'email': f'import-{format}@example.com', 'password': 'bench-password'})
+        with PeakRss() as measured:
+            result = import_file(client, files[('vocabulary', format)], format)
+        print(f"  import {format:<6} {measured.seconds:6.1f} s  {rows / measured.seconds:7.0f} rows/s  peak RSS +{measured.grown / 1e6:6.1f} MB"
+              f"  {result['imported']} imported, {result['duplicates']} duplicates, {result['invalid']} invalid")
+    with PeakRss() as measured:
+        result = import_file(client, files[('vocabulary', 'ndjson')], 'ndjson')
+    print(f"  import again   {measured.seconds:6.1f} s  {rows / measured.seconds:7.0f} rows/s  peak RSS +{measured.grown / 1e6:6.1f} MB"
+          f"  {result['imported']} imported, {result['duplicates']} duplicates")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+"""/practice/api latency and upstream tokens for re-checks of an edited essay.
+
+A learner checks a 16-sentence essay, then changes one sentence at a time and
+checks it again. The stub upstream takes longer for longer prompts and longer
+answers, roughly like a real model. It also counts the prompt and completion
+tokens it is sent and answers. The run is repeated with incremental
+re-analysis off and on; the first check costs the same in both.
+
+    python -m benchmarks.bench_incremental [edits]
+"""
+import json
+import random
+import sys
+import time
+
+from benchmarks.harness import create_user, load_app
+from benchmarks.stub_upstream import StubHandler, start_stub
+from conversation import estimate_tokens
+from response_cache import create_cache
+
+ESSAY = [
+    "Ich heiße Anna und ich wohne seit drei Jahren in Berlin.",
+    "Vorher habe ich mit meiner Familie in einer kleinen Stadt in Syrien gelebt.",
+    "Mein Bruda wohnt noch dort und arbeitet als Lehrer an einer Schule.",
+    "In Berlin lerne ich jeden Tag Deutsch, weil ich hier studieren möchte.",
+    "Am Anfang war die Sprache sehr schwer für mich.",
+    "Besonders die Artikel und die Fälle habe ich oft verwechselt.",
+    "Jetzt verstehe ich schon viel mehr, aber ich mache noch Fehler.",
+    "Am Wochenende gehe ich gern mit Freunden in den Park.",
+    "Wir spielen Fußball oder sitzen einfach in der Sonne.",
+    "Manchmal kochen wir zusammen Essen aus unseren Ländern.",
+    "Ich libe diese Abende, weil wir viel lachen und erzählen.",
+    "Im Sommer möchte ich eine Reise nach Hamburg machen.",
+    "Dort wohnt eine Freundin, die ich aus dem Deutschkurs kenne.",
+    "Sie hat mir viel geholfen, als ich neu in Deutschland war.",
+    "Nächstes Jahr will ich die Prüfung für das Niveau B2 schreiben.",
+    "Ich hoffe, dass ich dann an der Universität Medizin studieren kann.",
+]
+EDITS = [
+    ("sehr schwer", "wirklich schwer"), ("gern", "sehr gern"), ("oft", "manchmal"), ("viel", "sehr viel"),
+    ("zusammen", "gemeinsam"), ("eine Reise", "einen Ausflug"), ("Nächstes Jahr", "Im nächsten Jahr"),
+    ("kleinen Stadt", "kleinen Stadt im Norden"), ("in den Park", "an den See"), ("Medizin", "Informatik"),
+]
+
+
+class TokenCountingHandler(StubHandler):
+    """Answers after 150 ms plus 0.3 ms per prompt token and 15 ms per completion token."""
+
+    def respond(self, payload):
+        text = payload['messages'][-1]['content']
+        prompt = sum(estimate_tokens(m.get('content') or '') for m in payload.get('messages', []))
+        completion = 30 + 25 * sum(text.count(word) for word in ('Bruda', 'libe'))
+        with self.server.lock:
+            self.server.prompt_tokens += prompt
+            self.server.completion_tokens += completion
+        time.sleep(0.15 + 0.0003 * prompt + 0.015 * completion)
+        super().respond(payload)
+
+
+def check(client, sentences):
+    start = time.perf_counter()
+    response = client.post('/practice/api', json={'text': ' '.join(sentences)})
+    assert response.status_code == 200, response.status_code
+    content = json.loads(response.get_json()['choices'][0]['message']['content'])
+    return time.perf_counter() - start, content
+
+
+def run(app_module, server, client, incremental, edits):
+    app_module.app.config['PRACTICE_INCREMENTAL'] = incremental
+    app_module.practice_cache = create_cache('memory', ttl=3600, max_entries=4096)
+    rng = random.Random(3)
+    sentences = list(ESSAY)
+    first, _ = check(client, sentences)
+    server.prompt_tokens = server.completion_tokens = 0
+    latencies = []
+    for k in range(edits):
+        old, new = EDITS[k % len(EDITS)]
+        candidates = [i for i, sentence in enumerate(sentences) if old in sentence]
+        if candidates:
+            i = rng.choice(candidates)
+            sentences[i] = sentences[i].replace(old, new, 1)
+        else:
+            i = rng.randrange(len(sentences))
+            sentences[i] = sentences[i][:-1] + f", sagt Anna ({k})."
+        latency, content = check(client, sentences)
+        latencies.append(latency)
+    latencies.sort()
+    label = 'incremental on ' if incremental else 'incremental off'
+    print(f"{label}  first check {first * 1000:6.0f} ms  re-check p50 {latencies[len(latencies) // 2] * 1000:6.0f} ms  "
+          f"max {latencies[-1] * 1000:6.0f} ms  upstream tokens per re-check "
+          f"{server.prompt_tokens / edits:6.0f} prompt {server.completion_tokens / edits:5.0f} completion  "
+          f"(last score {content['score']}, {len(content['corrections'])} corrections)")
+
+
+def main():
+    edits = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    server, url = start_stub(handler=TokenCountingHandler)
+    server.prompt_tokens = server.completion_tokens = 0
+    app_module = load_app(upstream_url=url)
+    create_user(app_module)
+    app_module.prechecker = None
+    client = app_module.app.test_client()
+    client.post('/login', data={'email': 'bench@example.com', 'password': 'bench-password'})
+    try:
+        for incremental in (False, True):
+            run(app_module, server, client, incremental, edits)
+    finally:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,174 @@
+"""XP leaderboards over a million learners: the materialized boards against ORDER BY user_stats.xp.
+
+Fills `users` learners with long-tailed XP, spread over two target languages
+and six CEFR levels, and gives a third of them XP this week in
+user_daily_activity. Then it reports:
+
+  - the cold build (the database read, then the boards) and the anonymous RSS it adds
+  - a learner's rank and a top-20 page, from the boards and from SQL, once
+    without and once with an index on user.xp
+  - Leaderboard.record throughput, and the cost of log_activity with it
+  - a reconcile after `drifted` XP changes written straight to the database
+    (as another worker would), and the drift it finds
+
+The periodic reconcile thread is off (LEADERBOARD_RECONCILE_SECONDS=0); the
+benchmark calls reconcile itself.
+
+    python -m benchmarks.bench_leaderboard [users] [drifted]
+"""
+import os
+import random
+import sys
+import time
+from datetime import datetime
+
+from sqlalchemy import text
+
+from benchmarks.bench_export_import import PeakRss
+from benchmarks.harness import create_user, load_app
+from leaderboard import week_start
+
+LANGUAGES = ('de', 'en')
+LEVELS = ('A1', 'A2', 'B1', 'B2', 'C1', 'C2')
+
+
+def fill(app_module, users, now):
+    rng = random.Random(1)
+    db = app_module.db
+    password = app_module.bcrypt.generate_password_hash('bench-password').decode('utf-8')
+    day = week_start(now).date()
+    with app_module.app.app_context():
+        for start in range(1, users + 1, 50000):
+            ids = range(start, min(users, start + 49999) + 1)
+            db.session.execute(db.insert(app_module.User), [
+                dict(id=i, email=f'learner{i}@example.com', password=password, first_name=f'Learner{i}', last_name='Bench',
+                     german_level=rng.choice(LEVELS), target_language=rng.choice(LANGUAGES), native_language='en')
+                for i in ids])
+            xp = {i: int(rng.paretovariate(1.2) * 40) - 40 for i in ids}
+            db.session.execute(db.insert(app_module.UserStats), [
+                dict(user_id=i, xp=xp[i], level=xp[i] // 1000 + 1, activity_count=1) for i in ids])
+            db.session.execute(db.insert(app_module.UserDailyActivity), [
+                dict(user_id=i, day=day, xp=rng.randint(5, 500), count=1) for i in ids if rng.random() < 1 / 3])
+        db.session.commit()
+        db.session.execute(text("ANALYZE"))
+
+
+def timed(function, repeats):
+    start = time.perf_counter()
+    for _ in range(repeats):
+        function()
+    return (time.perf_counter() - start) / repeats * 1000
+
+
+def compare_reads(app_module, leaderboard, user_ids):
+    db = app_module.db
+    rank_sql = text('SELECT count(*) FROM user_stats WHERE xp > :xp OR (xp = :xp AND user_id < :id)')
+    top_sql = text('SELECT user_id, xp FROM user_stats ORDER BY xp DESC, user_id LIMIT 20')
+    deep_sql = text('SELECT user_id, xp FROM user_stats ORDER BY xp DESC, user_id LIMIT 20 OFFSET 500000')
+    level_sql = text('SELECT user_id, xp FROM user_stats JOIN "user" ON "user".id = user_id '
+                     'WHERE german_level = \'B1\' ORDER BY xp DESC, user_id LIMIT 20')
+    week_sql = text("SELECT user_id, sum(xp) AS points FROM user_daily_activity WHERE day >= :start "
+                    "GROUP BY user_id ORDER BY points DESC, user_id LIMIT 20")
+    rng = random.Random(2)
+    with app_module.app.app_context():
+        members = {user_id: xp for user_id, xp in db.session.execute(text('SELECT user_id, xp FROM user_stats WHERE user_id IN (%s)'
+                                                                              % ','.join(map(str, user_ids))))}
+
+        def board_rank():
+            user_id = rng.choice(user_ids)
+            return leaderboard.rank(user_id)
+
+        def sql_rank():
+            user_id = rng.choice(user_ids)
+            return db.session.execute(rank_sql, {'xp': members[user_id], 'id': user_id}).scalar()
+
+        start = {'start': week_start(datetime.utcnow()).date()}
+        for label in ('no index on xp', 'index on xp'):
+            if label == 'index on xp':
+                db.session.execute(text('CREATE INDEX ix_bench_user_xp ON user_stats (xp DESC, user_id)'))
+                db.session.commit()
+            print(f"  SQL, {label}: rank {timed(sql_rank, 5):8.2f} ms, top 20 {timed(lambda: db.session.execute(top_sql).all(), 5):8.2f} ms,"
+                  f" page at 500k {timed(lambda: db.session.execute(deep_sql).all(), 5):8.2f} ms,"
+                  f" B1 top 20 {timed(lambda: db.session.execute(level_sql).all(), 5):8.2f} ms,"
+                  f" weekly top 20 {timed(lambda: db.session.execute(week_sql, start).all(), 3):8.2f} ms")
+        db.session.execute(text('DROP INDEX ix_bench_user_xp'))
+        db.session.commit()
+    print(f"  boards:              rank {timed(board_rank, 20000):8.4f} ms, top 20 {timed(lambda: leaderboard.page(), 20000):8.4f} ms,"
+          f" page at 500k {timed(lambda: leaderboard.page(offset=500000), 20000):8.4f} ms,"
+          f" B1 top 20 {timed(lambda: leaderboard.page(scope='level:B1'), 20000):8.4f} ms,"
+          f" weekly top 20 {timed(lambda: leaderboard.page('week'), 20000):8.4f} ms")
+
+
+def incremental(app_module, leaderboard, users):
+    rng = random.Random(3)
+    now = datetime.utcnow()
+    updates = [(rng.randint(1, users), rng.randint(1, 50)) for _ in range(100000)]
+    xp = {}
+    start = time.perf_counter()
+    for user_id, points in updates:
+        xp[user_id] = xp.get(user_id, leaderboard.members[user_id][0]) + points
+        member = leaderboard.members[user_id]
+        leaderboard.record(user_id, xp[user_id], points, member[2], member[3], now)
+    seconds = time.perf_counter() - start
+    print(f"  record: {len(updates) / seconds:8.0f} updates/s ({seconds / len(updates) * 1e6:.1f} us each, 6 boards per update)")
+
+    with app_module.app.app_context():
+        learners = [app_module.db.session.get(app_module.User, rng.randint(1, users)) for _ in range(2000)]
+        for enabled in (False, True):
+            saved, app_module.leaderboard = app_module.leaderboard, leaderboard if enabled else None
+            start = time.perf_counter()
+            for user in learners:
+                app_module.log_activity(user, 'practice', 'Bench', 10)
+            print(f"  log_activity {'with' if enabled else 'without'} the leaderboard: {(time.perf_counter() - start) / len(learners) * 1000:.3f} ms each")
+            app_module.leaderboard = saved
+
+
+def drift(app_module, leaderboard, users, drifted):
+    rng = random.Random(4)
+    db = app_module.db
+    # The bare record calls above never reached the database; line the boards up with it again first
+    leaderboard.reconcile()
+    with app_module.app.app_context():
+        db.session.execute(text('UPDATE user_stats SET xp = xp + 7 WHERE user_id = :id'),
+                           [{'id': user_id} for user_id in rng.sample(range(1, users + 1), drifted)])
+        db.session.commit()
+    with PeakRss() as measured:
+        found = leaderboard.reconcile()
+    print(f"  reconcile after {drifted} writes behind the worker's back: {measured.seconds:.1f} s, drift {found},"
+          f" peak RSS +{measured.grown / 1e6:.0f} MB while both generations are alive")
+
+
+def main():
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    drifted = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    os.environ['BCRYPT_LOG_ROUNDS'] = '4'
+    os.environ['LEADERBOARD_RECONCILE_SECONDS'] = '0'
+    app_module = load_app()
+    now = datetime.utcnow()
+    start = time.perf_counter()
+    fill(app_module, users, now)
+    print(f"{users} learners filled in {time.perf_counter() - start:.1f} s")
+
+    leaderboard = app_module.leaderboard
+    start = time.perf_counter()
+    loaded = leaderboard.load()
+    load_seconds = time.perf_counter() - start
+    leaderboard.load = lambda: loaded
+    with PeakRss() as measured:
+        leaderboard.ensure_built()
+    leaderboard.load = app_module.load_leaderboard
+    del loaded
+    print(f"  cold build: database read {load_seconds:.1f} s, boards {measured.seconds:.1f} s, anonymous RSS +{measured.grown / 1e6:.0f} MB"
+          f" for {leaderboard.stats()['boards']['all:global']} all-time and {leaderboard.stats()['boards']['week:global']} weekly entries")
+
+    compare_reads(app_module, leaderboard, random.Random(5).sample(range(1, users + 1), 1000))
+    incremental(app_module, leaderboard, users)
+    drift(app_module, leaderboard, users, drifted)
+    create_user(app_module, email='bench@example.com')
+    client = app_module.app.test_client()
+    client.post('/login', data={'email': 'bench@example.com', 'password': 'bench-password'})
+    print(f"  GET /leaderboard/api?scope=level&offset=1000: {timed(lambda: client.get('/leaderboard/api?scope=level&offset=1000'), 200):.2f} ms")
+
+
+if __name__ == '__main__':
+    main()
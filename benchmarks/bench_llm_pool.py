@@ -0,0 +1,41 @@
+"""Requests per second against a local stub upstream, with and without pooling.
+
+    python -m benchmarks.bench_llm_pool [threads] [requests_per_thread]
+"""
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from llm_client import UpstreamClient
+from benchmarks.stub_upstream import start_stub
+
+PAYLOAD = {"model": "openai/gpt-3.5-turbo", "messages": [{"role": "user", "content": "Hallo"}]}
+
+
+def run(client, threads, per_thread):
+    def worker(_):
+        for _ in range(per_thread):
+            client.chat_completion(PAYLOAD).json()
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(threads) as pool:
+        list(pool.map(worker, range(threads)))
+    return threads * per_thread / (time.perf_counter() - start)
+
+
+def main():
+    threads = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    per_thread = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    server, url = start_stub()
+    try:
+        for pooled in (False, True):
+            client = UpstreamClient(url, 'stub-key', pool_size=threads, pooled=pooled)
+            rps = run(client, threads, per_thread)
+            client.close()
+            print(f"{'pooled' if pooled else 'unpooled':>9}: {rps:8.1f} req/s ({threads} threads x {per_thread})")
+    finally:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
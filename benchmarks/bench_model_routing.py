@@ -0,0 +1,93 @@
+"""/call/api latency and estimated cost with and without model routing.
+
+The stub upstream answers each model at its own speed, so sending short A1/A2
+call turns to the small model shows up as lower latency. Prices are rough
+per-million-token list prices and only serve to compare the two runs. The last
+scenario makes the small model slow mid-run and checks that the router demotes
+it to the end of the chain.
+
+    python -m benchmarks.bench_model_routing [requests]
+"""
+import sys
+import time
+
+from benchmarks.harness import create_user, load_app
+from benchmarks.stub_upstream import StubHandler, start_stub
+from conversation import estimate_tokens
+from model_router import DEFAULT_ROUTES, ModelRouter
+
+MODEL_LATENCY = {
+    'meta-llama/llama-3.1-8b-instruct': 0.12,
+    'openai/gpt-4o-mini': 0.30,
+    'openai/gpt-3.5-turbo': 0.45,
+}
+# USD per million (input, output) tokens
+MODEL_PRICE = {
+    'meta-llama/llama-3.1-8b-instruct': (0.05, 0.08),
+    'openai/gpt-4o-mini': (0.15, 0.60),
+    'openai/gpt-3.5-turbo': (0.50, 1.50),
+}
+
+
+class ModelLatencyHandler(StubHandler):
+    def respond(self, payload):
+        model = payload.get('model', 'openai/gpt-3.5-turbo')
+        time.sleep(self.server.model_latency.get(model, 0.3))
+        tokens = sum(estimate_tokens(m.get('content') or '') for m in payload.get('messages', []))
+        with self.server.lock:
+            self.server.models_seen[model] = self.server.models_seen.get(model, 0) + 1
+            self.server.cost += (tokens * MODEL_PRICE[model][0] + 20 * MODEL_PRICE[model][1]) / 1e6
+        super().respond(payload)
+
+
+def run(client, server, requests):
+    server.models_seen, server.cost = {}, 0.0
+    latencies = []
+    for i in range(requests):
+        start = time.perf_counter()
+        response = client.post('/call/api', json={'session_id': f'bench-{i % 10}', 'message': f'Ich heiße Anna {i}.'})
+        latencies.append(time.perf_counter() - start)
+        assert response.status_code == 200, response.status_code
+    latencies.sort()
+    return {
+        'p50': latencies[len(latencies) // 2],
+        'p95': latencies[int(len(latencies) * 0.95)],
+        'cost_per_1k': server.cost / requests * 1000,
+        'models': dict(server.models_seen),
+    }
+
+
+def report(label, stats):
+    models = ', '.join(f"{model.split('/')[1]} {count}" for model, count in sorted(stats['models'].items()))
+    print(f"{label:<26} p50 {stats['p50'] * 1000:6.1f} ms  p95 {stats['p95'] * 1000:6.1f} ms  "
+          f"${stats['cost_per_1k']:.4f} / 1k turns  [{models}]")
+
+
+def main():
+    requests = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    server, url = start_stub(handler=ModelLatencyHandler)
+    server.model_latency = dict(MODEL_LATENCY)
+    app_module = load_app(upstream_url=url)
+    create_user(app_module)
+    client = app_module.app.test_client()
+    client.post('/login', data={'email': 'bench@example.com', 'password': 'bench-password'})
+
+    try:
+        app_module.router = None
+        report('routing off', run(client, server, requests))
+
+        app_module.router = ModelRouter(DEFAULT_ROUTES)
+        report('routing on', run(client, server, requests))
+
+        # The small model degrades past the 1.5s call SLO; after min_samples slow
+        # answers the router moves it behind gpt-4o-mini
+        server.model_latency['meta-llama/llama-3.1-8b-instruct'] = 1.8
+        stats = run(client, server, requests // 4)
+        report('routing on, llama slow', stats)
+        print(f"models: {app_module.router.snapshot()}")
+    finally:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
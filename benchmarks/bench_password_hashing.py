@@ -0,0 +1,118 @@
+"""Login throughput under a burst of logins, and what it costs unrelated endpoints.
+
+Serves the app from a pooled threaded WSGI server. `logins` threads post to
+/login in a loop, waiting out Retry-After on a 503, while one logged-in probe
+times GET /dashboard. Runs once with hashing on the request threads
+(PASSWORD_HASH_WORKERS=0, as before), once per pool size given, and once with
+a queue of one to show admission control turning logins away. Then it checks
+the rehash on login: a user whose hash was made at a lower cost gets it
+upgraded to BCRYPT_LOG_ROUNDS on the next login.
+
+    python -m benchmarks.bench_password_hashing [logins] [seconds] [rounds] [pool sizes, comma-separated]
+"""
+import os
+import sys
+import threading
+import time
+
+import httpx
+
+from benchmarks.bench_async_load import serve_sync
+from benchmarks.harness import create_user, load_app
+from benchmarks.stub_upstream import start_stub
+from password_hashing import PasswordHasher, hash_cost
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))] * 1000 if values else float('nan')
+
+
+def run_phase(base_url, logins, seconds):
+    stop = threading.Event()
+    login_latencies, statuses, probe_latencies = [], {}, []
+    lock = threading.Lock()
+
+    def login_loop(i):
+        with httpx.Client(base_url=base_url, timeout=60) as client:
+            while not stop.is_set():
+                start = time.perf_counter()
+                response = client.post('/login', data={'email': f'load{i}@example.com', 'password': 'bench-password'})
+                with lock:
+                    statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+                    if response.status_code == 302:
+                        login_latencies.append(time.perf_counter() - start)
+                if response.status_code == 503:
+                    stop.wait(float(response.headers['Retry-After']))
+                client.cookies.clear()
+
+    with httpx.Client(base_url=base_url, timeout=60) as probe:
+        assert probe.post('/login', data={'email': 'bench@example.com', 'password': 'bench-password'}).status_code == 302
+        threads = [threading.Thread(target=login_loop, args=(i,)) for i in range(logins)]
+        for thread in threads:
+            thread.start()
+        deadline = time.perf_counter() + seconds
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            assert probe.get('/dashboard').status_code == 200
+            probe_latencies.append(time.perf_counter() - start)
+            time.sleep(0.02)
+        stop.set()
+        for thread in threads:
+            thread.join()
+    return login_latencies, statuses, probe_latencies
+
+
+def check_rehash(app_module, rounds):
+    old = app_module.bcrypt.generate_password_hash('bench-password', rounds - 2).decode('utf-8')
+    user_id = create_user(app_module, email='legacy@example.com')
+    with app_module.app.app_context():
+        app_module.db.session.get(app_module.User, user_id).password = old
+        app_module.db.session.commit()
+    client = app_module.app.test_client()
+    assert client.post('/login', data={'email': 'legacy@example.com', 'password': 'bench-password'}).status_code == 302
+    with app_module.app.app_context():
+        stored = app_module.db.session.get(app_module.User, user_id).password
+    assert hash_cost(stored) == rounds and app_module.bcrypt.check_password_hash(stored, 'bench-password'), stored
+    print(f"rehash on login: cost {hash_cost(old)} -> {hash_cost(stored)}")
+
+
+def main():
+    logins = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 8
+    rounds = int(sys.argv[3]) if len(sys.argv) > 3 else 10
+    pools = [int(size) for size in sys.argv[4].split(',')] if len(sys.argv) > 4 else [1]
+    os.environ['BCRYPT_LOG_ROUNDS'] = str(rounds)
+    upstream, url = start_stub()
+    app_module = load_app(upstream_url=url)
+    for i in range(logins):
+        create_user(app_module, email=f'load{i}@example.com')
+    create_user(app_module)
+    server, base_url, stop = serve_sync(app_module.app, logins + 4)
+    try:
+        with httpx.Client(base_url=base_url) as probe:
+            probe.post('/login', data={'email': 'bench@example.com', 'password': 'bench-password'})
+            for _ in range(20):
+                probe.get('/dashboard')
+            idle = []
+            for _ in range(100):
+                start = time.perf_counter()
+                probe.get('/dashboard')
+                idle.append(time.perf_counter() - start)
+        print(f"bcrypt cost {rounds}, {logins} concurrent logins for {seconds:g}s; idle /dashboard p50 {percentile(idle, 0.5):.1f} ms")
+        phases = [('request thread', 0, logins)] + [(f'pool of {size}', size, logins) for size in pools] + [('queue of 1', 1, 1)]
+        for label, workers, max_queue in phases:
+            app_module.password_hasher = PasswordHasher(app_module.bcrypt, rounds=rounds, workers=workers, max_queue=max_queue)
+            login_latencies, statuses, probe_latencies = run_phase(base_url, logins, seconds)
+            print(f"  {label:<15} logins {len(login_latencies) / seconds:5.1f}/s  login p50 {percentile(login_latencies, 0.5):7.1f} ms"
+                  f"  /dashboard p50 {percentile(probe_latencies, 0.5):6.1f} ms  p99 {percentile(probe_latencies, 0.99):6.1f} ms"
+                  f"  statuses {dict(sorted(statuses.items()))}")
+        app_module.password_hasher = PasswordHasher(app_module.bcrypt, rounds=rounds, workers=1)
+        check_rehash(app_module, rounds)
+    finally:
+        stop()
+        upstream.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+"""Lexicon size, lookup throughput and /practice/api latency of the local pre-checker.
+
+Lookups are timed for words in the lexicon, for single-typo misspellings of
+them, and for strings far from any word. Memory is what tracemalloc sees while
+the lexicon and its deletion index are built. The end-to-end run sends short
+practice inputs to a stub upstream that takes 800 ms per analysis. Before
+timing anything it checks that inputs the rules cannot settle escalate.
+
+    python -m benchmarks.bench_precheck [lookups]
+"""
+import random
+import sys
+import time
+import tracemalloc
+
+from benchmarks.harness import create_user, load_app
+from benchmarks.stub_upstream import start_stub
+from precheck import LEXICON_DIR, Lexicon, PreChecker
+
+SENTENCES = [
+    'Ich bin müde.', 'Die Tisch ist groß.', 'ich esse brot.', 'Du bin nett.', 'Das Maedchen ist nett.',
+    'Ich wohne in Berlin.', 'Ich machst Hausaufgaben.', 'Mein Bruder heißt Paul.', 'Ich libe dich.',
+    'Wir gehen heute ins Kino, weil wir Filme mögen.',
+]
+
+# Wrong case or word order that no rule flags: these must go to the LLM, not score 100
+ESCALATE = ['Ich habe ein Hund.', 'Ich sehe der Mann.', 'Ich fahre mit der Bus.', 'Gestern ich bin gegangen.']
+# One mistake each, reported once even where two rules touch the same words
+ANSWER = {('de', 'Die Tisch ist groß.'): ['Der Tisch'], ('de', 'Du bin nett.'): ['Du bist'],
+          ('en', 'I study at an universty.'): ['a university']}
+
+
+def check_answers(checker):
+    for text in ESCALATE:
+        assert checker.check(text, 'de') is None, text
+    for (language, text), expected in ANSWER.items():
+        result = checker.check(text, language)
+        assert result is not None and [c['correction'] for c in result['corrections']] == expected, (text, result)
+    print(f"check(): {len(ESCALATE)} inputs escalate, {len(ANSWER)} answered with the expected corrections")
+
+
+def typo(word, rng):
+    i = rng.randrange(len(word))
+    edit = rng.choice(('delete', 'replace', 'swap'))
+    if edit == 'delete':
+        return word[:i] + word[i + 1:]
+    if edit == 'swap' and i + 1 < len(word):
+        return word[:i] + word[i + 1] + word[i] + word[i + 2:]
+    return word[:i] + rng.choice('abcdefghijklmnopqrstuvwxyz') + word[i + 1:]
+
+
+def rate(function, inputs):
+    start = time.perf_counter()
+    for value in inputs:
+        function(value)
+    return len(inputs) / (time.perf_counter() - start)
+
+
+def bench_lexicon(language, lookups):
+    tracemalloc.start()
+    start = time.perf_counter()
+    lexicon = Lexicon.load(f'{LEXICON_DIR}/{language}.txt', language)
+    build = time.perf_counter() - start
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    rng = random.Random(7)
+    known = [rng.choice(lexicon.ids) for _ in range(lookups)]
+    long_words = [word for word in lexicon.ids if len(word) >= 6]
+    typos = [typo(rng.choice(long_words), rng) for _ in range(lookups)]
+    noise = [''.join(rng.choice('qxzvkjw') for _ in range(8)) for _ in range(lookups)]
+    print(f"{language}: {len(lexicon.words)} forms, {len(lexicon.index)} index keys, "
+          f"built in {build * 1000:.0f} ms, {memory / 2 ** 20:.1f} MiB")
+    for label, inputs in (('known', known), ('typo', typos), ('no match', noise)):
+        print(f"  lookup {label:<9} {rate(lexicon.lookup, inputs):>10,.0f} /s  "
+              f"closest only {rate(lambda word: lexicon.lookup(word, closest=True), inputs):>10,.0f} /s")
+
+
+def bench_endpoint(requests):
+    server, url = start_stub(delay=0.8)
+    app_module = load_app(upstream_url=url)
+    create_user(app_module)
+    app_module.practice_cache = None
+    client = app_module.app.test_client()
+    client.post('/login', data={'email': 'bench@example.com', 'password': 'bench-password'})
+    try:
+        for label, prechecker in (('precheck off', None), ('precheck on', PreChecker(max_words=6))):
+            app_module.prechecker = prechecker
+            latencies = []
+            for i in range(requests):
+                start = time.perf_counter()
+                response = client.post('/practice/api', json={'text': SENTENCES[i % len(SENTENCES)]})
+                latencies.append(time.perf_counter() - start)
+                assert response.status_code == 200, response.status_code
+            latencies.sort()
+            answered = f", answered locally {prechecker.stats()['answer_rate']:.0%}" if prechecker else ''
+            print(f"/practice/api {label:<13} p50 {latencies[len(latencies) // 2] * 1000:7.1f} ms  "
+                  f"p90 {latencies[int(len(latencies) * 0.9)] * 1000:7.1f} ms{answered}")
+    finally:
+        server.shutdown()
+
+
+def main():
+    lookups = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    for language in ('de', 'en'):
+        bench_lexicon(language, lookups)
+    checker = PreChecker()
+    check_answers(checker)
+    print(f"check() on {len(SENTENCES)} sample inputs: {rate(lambda text: checker.check(text, 'de'), SENTENCES * 500):,.0f} /s")
+    bench_endpoint(len(SENTENCES) * 2)
+
+
+if __name__ == '__main__':
+    main()
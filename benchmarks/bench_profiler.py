@@ -0,0 +1,85 @@
+"""Cost of the profiling hooks, and what a profile of an N+1 view looks like.
+
+Times /dashboard with profiling disabled, enabled but not triggered (every
+request then only feeds the slowest-endpoints report) and triggered with the
+X-Profile header. Then it profiles a deliberately naive view that loads each
+vocabulary item and its owner one query at a time. It prints the repeated
+statements that the SQL trace flags.
+
+    python -m benchmarks.bench_profiler [requests]
+"""
+import os
+import sys
+import tempfile
+import time
+
+from benchmarks.harness import create_user, load_app
+from benchmarks.stub_upstream import start_stub
+from profiler import Profiler
+
+TOKEN = 'bench-profile-token'
+
+
+def time_get(client, path, requests, headers=None):
+    client.get(path, headers=headers)
+    start = time.perf_counter()
+    for _ in range(requests):
+        assert client.get(path, headers=headers).status_code == 200
+    return (time.perf_counter() - start) / requests * 1000
+
+
+def add_naive_view(app_module):
+    """Register a view with an N+1 loop and a repeated identical query; must run before the first request."""
+    from flask import jsonify
+    from flask_login import current_user
+
+    def naive_vocabulary():
+        items = []
+        for row in app_module.Vocabulary.query.with_entities(app_module.Vocabulary.id).filter_by(user_id=current_user.id):
+            item = app_module.Vocabulary.query.filter_by(id=row.id).first()
+            owner = app_module.User.query.filter_by(id=item.user_id).first()
+            items.append({'word': item.word, 'owner': owner.first_name})
+        return jsonify(items)
+    app_module.app.add_url_rule('/bench/naive-vocabulary', 'naive_vocabulary', naive_vocabulary)
+
+
+def main():
+    requests = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    server, url = start_stub()
+    app_module = load_app(upstream_url=url)
+    add_naive_view(app_module)
+    user_id = create_user(app_module)
+    with app_module.app.app_context():
+        app_module.db.session.add_all([app_module.Vocabulary(user_id=user_id, word=f'Wort{i}', correction=f'Wort {i}')
+                                       for i in range(12)])
+        app_module.db.session.commit()
+    directory = tempfile.mkdtemp(prefix='deutschai-profiles-')
+    client = app_module.app.test_client()
+    client.post('/login', data={'email': 'bench@example.com', 'password': 'bench-password'})
+    try:
+        app_module.profiler = None
+        off = time_get(client, '/dashboard', requests)
+        app_module.profiler = Profiler(directory, token=TOKEN)
+        app_module.app.config['PROFILE_TOKEN'] = TOKEN  # /debug/* checks the config, not the profiler
+        idle = time_get(client, '/dashboard', requests)
+        profiled = time_get(client, '/dashboard', max(10, requests // 10), headers={'X-Profile': TOKEN})
+        print(f"/dashboard  profiler off {off:6.2f} ms  on, not triggered {idle:6.2f} ms  profiled {profiled:6.2f} ms per request")
+
+        response = client.get('/bench/naive-vocabulary', headers={'X-Profile': TOKEN})
+        profile = next(p for p in app_module.profiler.recent if p['id'] == response.headers['X-Profile-Id'])
+        print(f"/bench/naive-vocabulary: {profile['queries']} queries, {profile['query_ms']} ms in the database")
+        for entry in profile['repeated_queries']:
+            print(f"  {entry['kind']:<9} x{entry['count']:<3} ({entry['distinct_parameters']} parameter sets) "
+                  f"{entry['total_ms']:6.2f} ms  {' '.join(entry['statement'].split())[:90]}")
+        report = client.get('/debug/profile', headers={'X-Profile': TOKEN}).get_json()
+        print("slowest endpoints (p95):")
+        for entry in report['slowest_endpoints'][:5]:
+            print(f"  {entry['route']:<26} {entry['requests']:5d} requests  p50 {entry['p50_ms']:7.2f} ms  "
+                  f"p95 {entry['p95_ms']:7.2f} ms  {entry['queries_per_request']:5.1f} queries/request")
+        print(f"profiles written to {directory}: {len(os.listdir(directory))} files")
+    finally:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
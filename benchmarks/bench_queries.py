@@ -0,0 +1,106 @@
+"""Time the hot per-user queries on a large synthetic database, before and after migrate_db.
+
+The database is seeded with the original un-indexed schema, timed, migrated
+with migrate_db.migrate and timed again.
+
+    python -m benchmarks.bench_queries [users] [activities] [vocabulary_rows]
+"""
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from benchmarks.harness import load_app
+from migrate_db import migrate
+
+ORIGINAL_SCHEMA = """
+CREATE TABLE user (
+    id INTEGER NOT NULL PRIMARY KEY, first_name VARCHAR(50) NOT NULL, last_name VARCHAR(50) NOT NULL,
+    german_level VARCHAR(20) NOT NULL, email VARCHAR(120) NOT NULL UNIQUE, password VARCHAR(60) NOT NULL,
+    progress INTEGER, xp INTEGER DEFAULT 0, native_language VARCHAR(10) DEFAULT 'en',
+    target_language VARCHAR(10) NOT NULL DEFAULT 'de'
+);
+CREATE TABLE vocabulary (
+    id INTEGER NOT NULL PRIMARY KEY, user_id INTEGER NOT NULL REFERENCES user (id), word VARCHAR(100) NOT NULL,
+    correction VARCHAR(100) NOT NULL, explanation TEXT, timestamp DATETIME
+);
+CREATE TABLE activity (
+    id INTEGER NOT NULL PRIMARY KEY, user_id INTEGER NOT NULL REFERENCES user (id), type VARCHAR(50) NOT NULL,
+    description VARCHAR(200) NOT NULL, points INTEGER, timestamp DATETIME
+);
+"""
+
+# The SQL the routes' ORM queries compile to
+QUERIES = {
+    'dashboard (recent activities)': (
+        "SELECT * FROM activity WHERE user_id = ? ORDER BY timestamp DESC LIMIT 5", lambda u: (u,)),
+    'list_vocabulary (all, sorted)': (
+        "SELECT * FROM vocabulary WHERE user_id = ? ORDER BY timestamp DESC", lambda u: (u,)),
+    'add_vocabulary (duplicate check)': (
+        "SELECT * FROM vocabulary WHERE user_id = ? AND word = ? AND correction = ? LIMIT 1", lambda u: (u, 'wort1', 'Wort1')),
+}
+
+
+def seed(path, users, activities, vocabulary):
+    rng = random.Random(42)
+    start = datetime(2025, 1, 1)
+    conn = sqlite3.connect(path)
+    conn.executescript(ORIGINAL_SCHEMA)
+    conn.executemany(
+        "INSERT INTO user (id, first_name, last_name, german_level, email, password, progress, xp) "
+        "VALUES (?, 'Bench', 'User', 'A2', ?, 'x', 0, 0)",
+        ((i, f"user{i}@example.com") for i in range(1, users + 1))
+    )
+    conn.executemany(
+        "INSERT INTO activity (user_id, type, description, points, timestamp) VALUES (?, 'chat', 'Konversation', 10, ?)",
+        ((rng.randint(1, users), str(start + timedelta(seconds=rng.randint(0, 3e7)))) for _ in range(activities))
+    )
+    conn.executemany(
+        "INSERT INTO vocabulary (user_id, word, correction, explanation, timestamp) VALUES (?, ?, ?, 'x', ?)",
+        ((rng.randint(1, users), f"wort{i}", f"Wort{i}", str(start + timedelta(seconds=rng.randint(0, 3e7)))) for i in range(vocabulary))
+    )
+    conn.commit()
+    conn.close()
+
+
+def time_queries(path, user_id, repeat=50):
+    conn = sqlite3.connect(path)
+    timings = {}
+    for name, (sql, params) in QUERIES.items():
+        conn.execute(sql, params(user_id)).fetchall()
+        start = time.perf_counter()
+        for _ in range(repeat):
+            conn.execute(sql, params(user_id)).fetchall()
+        timings[name] = (time.perf_counter() - start) / repeat
+    conn.close()
+    return timings
+
+
+def main():
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    activities = int(sys.argv[2]) if len(sys.argv) > 2 else 2_000_000
+    vocabulary = int(sys.argv[3]) if len(sys.argv) > 3 else 500_000
+
+    path = os.path.join(tempfile.mkdtemp(prefix='deutschai-bench-'), 'bench.db')
+    print(f"Seeding {users} users, {activities} activities, {vocabulary} vocabulary rows...")
+    start = time.perf_counter()
+    seed(path, users, activities, vocabulary)
+    print(f"Seeded in {time.perf_counter() - start:.1f}s")
+    user_id = users // 2
+
+    before = time_queries(path, user_id)
+    app_module = load_app()
+    start = time.perf_counter()
+    migrate(f"sqlite:///{path}", app_module.db.metadata, app_module.rebuild_user_stats)
+    print(f"Migrated in {time.perf_counter() - start:.1f}s")
+    after = time_queries(path, user_id)
+
+    for name in QUERIES:
+        print(f"{name:<34} {before[name] * 1000:9.2f} ms -> {after[name] * 1000:7.2f} ms  ({before[name] / after[name]:7.1f}x)")
+
+
+if __name__ == '__main__':
+    main()
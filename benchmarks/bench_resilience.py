@@ -0,0 +1,83 @@
+"""/chat/api behaviour against a fault-injecting stub upstream, with and without the resilience layer.
+
+Scenarios:
+  flaky        30% of upstream calls return 503
+  rate-limited every other call returns 429 with Retry-After: 0.2
+  slow tail    2% of upstream calls stall for 1s (hedging on vs off)
+  outage       every upstream call returns 503 (circuit breaker)
+
+    python -m benchmarks.bench_resilience [requests_per_scenario]
+"""
+import sys
+import time
+
+from benchmarks.harness import create_user, load_app
+from benchmarks.stub_upstream import start_stub
+from resilience import ResiliencePolicy
+
+DEADLINES = {'chat': 5.0, 'practice': 5.0, 'call': 5.0}
+
+
+def run(client, server, requests):
+    latencies, ok, degraded = [], 0, 0
+    seen = server.requests_seen
+    for i in range(requests):
+        start = time.perf_counter()
+        response = client.post('/chat/api', json={'message': f'Hallo {i}'})
+        latencies.append(time.perf_counter() - start)
+        body = response.get_json() or {}
+        ok += response.status_code == 200 and not body.get('degraded')
+        degraded += bool(body.get('degraded'))
+    latencies.sort()
+    return {
+        'success': ok / requests,
+        'degraded': degraded,
+        'p50': latencies[len(latencies) // 2],
+        'p99': latencies[int(len(latencies) * 0.99)],
+        'upstream_calls': server.requests_seen - seen,
+    }
+
+
+def report(scenario, label, stats):
+    print(f"{scenario:<13} {label:<22} success {stats['success']:6.1%}  degraded {stats['degraded']:4}  "
+          f"p50 {stats['p50'] * 1000:7.1f} ms  p99 {stats['p99'] * 1000:7.1f} ms  upstream calls {stats['upstream_calls']:5}")
+
+
+def main():
+    requests = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    server, url = start_stub(delay=0.01)
+    app_module = load_app(upstream_url=url)
+    create_user(app_module)
+    client = app_module.app.test_client()
+    client.post('/login', data={'email': 'bench@example.com', 'password': 'bench-password'})
+
+    def use(**policy):
+        app_module.resilience = ResiliencePolicy(DEADLINES, **policy)
+
+    try:
+        server.fault_rate, server.fault_status = 0.3, 503
+        for label, attempts in (('no retries', 1), ('3 attempts + jitter', 3)):
+            use(max_attempts=attempts, base_delay=0.02, breaker_failures=10 ** 6)
+            report('flaky', label, run(client, server, requests))
+
+        server.fault_rate, server.fault_every, server.fault_status, server.retry_after = 0.0, 2, 429, '0.2'
+        for label, attempts in (('no retries', 1), ('honour Retry-After', 3)):
+            use(max_attempts=attempts, base_delay=0.02, breaker_failures=10 ** 6)
+            report('rate-limited', label, run(client, server, requests // 4))
+
+        server.fault_every, server.retry_after = 0, None
+        server.slow_rate, server.slow_delay = 0.02, 1.0
+        for label, hedge in (('no hedging', False), ('hedge after p95', True)):
+            use(max_attempts=1, hedge=hedge, hedge_min_samples=20, breaker_failures=10 ** 6)
+            report('slow tail', label, run(client, server, requests))
+
+        server.slow_rate, server.fault_rate, server.fault_status = 0.0, 1.0, 503
+        for label, failures in (('no breaker', 10 ** 6), ('breaker after 5', 5)):
+            use(max_attempts=3, base_delay=0.02, breaker_failures=failures, breaker_reset=30)
+            report('outage', label, run(client, server, requests))
+    finally:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,152 @@
+"""Review queue latency over a million vocabulary items, and a month of simulated reviews.
+
+Fills `users` ordinary learners with `items` items between them, plus one
+heavy learner with 100k items. Their due dates are spread from a month ago to
+a month ahead. Then it times GET /vocabulary/api/review, which reads the next
+k due items off ix_vocabulary_user_due, against the scan-and-sort over all of a
+user's rows that the same query costs without that index.
+
+The simulation then replays `days` days. Each day a sample of learners
+fetches what is due (up to 50), recalls each item with a probability that
+grows with its interval, and posts the grades in one batch. It reports the
+reviews per day, the latency of the fetch and of the grading batch, and the
+intervals the simulated grades scheduled.
+
+The search index triggers are dropped while filling, which would otherwise
+dominate the insert time; search is not exercised here.
+
+    python -m benchmarks.bench_review_queue [items] [users] [days]
+"""
+import os
+import random
+import sys
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+
+from sqlalchemy import text
+
+from benchmarks.harness import load_app
+from spaced_repetition import MAX_GRADE
+
+HEAVY_ITEMS = 100000
+SESSION_SIZE = 50
+LEARNERS_PER_DAY = 200
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))] * 1000 if values else float('nan')
+
+
+def fill(app_module, items, users, now):
+    """Create the learners and their items; returns the user ids, the heavy learner's first."""
+    rng = random.Random(1)
+    db, Vocabulary = app_module.db, app_module.Vocabulary
+    password = app_module.bcrypt.generate_password_hash('bench-password').decode('utf-8')
+    with app_module.app.app_context():
+        for name in ('insert', 'delete', 'update'):
+            db.session.execute(text(f"DROP TRIGGER IF EXISTS vocabulary_search_{name}"))
+        db.session.execute(db.insert(app_module.User), [
+            dict(email=f'review{i}@example.com', password=password, first_name='Bench', last_name='User',
+                 german_level='A2', target_language='de', native_language='en') for i in range(users + 1)])
+        ids = db.session.execute(db.select(app_module.User.id).where(app_module.User.email.like('review%'))
+                                 .order_by(app_module.User.id)).scalars().all()
+        counts = [HEAVY_ITEMS] + [items // users] * users
+        rows = []
+        for user_id, count in zip(ids, counts):
+            for n in range(count):
+                interval = rng.choice([0, 1, 6, 15, 38])
+                rows.append({'user_id': user_id, 'word': f'w{n}', 'correction': f'c{n}', 'explanation': None,
+                             'timestamp': now - timedelta(days=60), 'interval_days': interval, 'reps': min(interval, 3),
+                             'ease': 2.5, 'due_at': now + timedelta(minutes=rng.randint(-30 * 1440, 30 * 1440))})
+                if len(rows) == 20000:
+                    db.session.execute(db.insert(Vocabulary), rows)
+                    rows = []
+        if rows:
+            db.session.execute(db.insert(Vocabulary), rows)
+        db.session.commit()
+        db.session.execute(text("ANALYZE"))
+    return ids
+
+
+def timed(function, repeats=20):
+    function()
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        samples.append(time.perf_counter() - start)
+    return percentile(samples, 0.5)
+
+
+def compare_queue(app_module, ids, now):
+    scan = text("SELECT id FROM vocabulary INDEXED BY ix_vocabulary_user_timestamp "
+                "WHERE user_id = :user_id AND due_at <= :now ORDER BY due_at, id LIMIT 20")
+    for label, user_id, email in (('heavy learner', ids[0], 'review0@example.com'), ('typical learner', ids[1], 'review1@example.com')):
+        client = app_module.app.test_client()
+        client.post('/login', data={'email': email, 'password': 'bench-password'})
+        endpoint = timed(lambda: client.get('/vocabulary/api/review', query_string={'limit': 20}))
+        with app_module.app.app_context():
+            total = app_module.db.session.execute(text("SELECT count(*) FROM vocabulary WHERE user_id = :u"), {'u': user_id}).scalar()
+            indexed = timed(lambda: app_module.due_vocabulary(user_id, now, 20))
+            scanned = timed(lambda: app_module.db.session.execute(scan, {'user_id': user_id, 'now': now}).all())
+        print(f"  {label:<16} {total:7d} items: GET /review {endpoint:6.2f} ms, due query {indexed:6.2f} ms"
+              f" on the (user_id, due_at) index vs {scanned:7.2f} ms scanning the user's rows")
+
+
+def recalled(rng, interval_days):
+    # Longer intervals were earned by remembering the item before
+    return rng.random() < min(0.95, 0.6 + 0.05 * interval_days)
+
+
+def simulate(app_module, ids, days, now):
+    rng = random.Random(2)
+    users, intervals = {}, Counter()
+    with app_module.app.app_context():
+        for user_id in ids:
+            users[user_id] = app_module.db.session.get(app_module.User, user_id)
+        app_module.db.session.expunge_all()
+    print(f"  day  reviews  recalled  fetch p50/p95 ms  grade p50/p95 ms")
+    for day in range(days):
+        today = now + timedelta(days=day)
+        fetches, grades, reviews, good = [], [], 0, 0
+        for user_id in rng.sample(ids, min(LEARNERS_PER_DAY, len(ids))):
+            with app_module.app.app_context():
+                start = time.perf_counter()
+                due = app_module.due_vocabulary(user_id, today, SESSION_SIZE)
+                fetches.append(time.perf_counter() - start)
+                if not due:
+                    continue
+                batch = [{'id': item['id'], 'grade': rng.randint(3, MAX_GRADE) if recalled(rng, item['interval_days'])
+                          else rng.randint(0, 2)} for item in due]
+                start = time.perf_counter()
+                user = app_module.db.session.merge(users[user_id], load=False)
+                results, _ = app_module.grade_reviews(user, batch, today)
+                app_module.db.session.commit()
+                grades.append(time.perf_counter() - start)
+            intervals.update(r['interval_days'] for r in results if r['status'] == 'graded')
+            reviews += sum(1 for r in results if r['status'] == 'graded')
+            good += sum(1 for g in batch if g['grade'] >= 3)
+        if day % max(1, days // 10) == 0 or day == days - 1:
+            print(f"  {day + 1:3d}  {reviews:7d}  {good / max(reviews, 1):7.0%}   {percentile(fetches, 0.5):6.2f} /{percentile(fetches, 0.95):6.2f}"
+                  f"    {percentile(grades, 0.5):6.2f} /{percentile(grades, 0.95):6.2f}")
+    print("  scheduled intervals (days: reviews) " + ', '.join(f"{interval}: {count}" for interval, count in intervals.most_common(8)))
+
+
+def main():
+    items = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    users = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    days = int(sys.argv[3]) if len(sys.argv) > 3 else 30
+    os.environ['BCRYPT_LOG_ROUNDS'] = '4'
+    app_module = load_app()
+    now = datetime.utcnow()
+    start = time.perf_counter()
+    ids = fill(app_module, items, users, now)
+    print(f"{items + HEAVY_ITEMS} items for {users + 1} learners, filled in {time.perf_counter() - start:.1f} s")
+    compare_queue(app_module, ids, now)
+    simulate(app_module, ids, days, now)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+"""Perceived turn latency of a voice call vs wasted upstream calls, with speculation on interim transcripts.
+
+Replays simulated SpeechRecognition sessions against the app and a stub
+upstream. The learner speaks one word every WORD_GAP seconds and sometimes
+pauses mid-sentence. The recogniser delivers its final result FINALIZE
+seconds after the last word, and for some turns the final text differs from
+the last interim one (a corrected word). The client runs the logic of
+call.html: an interim transcript unchanged for the stability threshold is
+posted to /call/api/interim, and the final one to /call/api.
+
+Perceived latency is the time from the final result to the reply. Each
+threshold is compared with no speculation; wasted calls are speculative
+upstream calls whose reply was thrown away.
+
+    python -m benchmarks.bench_speculation [turns] [upstream_delay_s] [thresholds_ms, comma-separated]
+"""
+import random
+import sys
+import threading
+import time
+import uuid
+
+from benchmarks.harness import create_user, load_app
+from benchmarks.stub_upstream import start_stub
+
+WORD_GAP = 0.25
+PAUSE = 0.6        # a mid-sentence pause, long enough to look stable
+PAUSE_RATE = 0.3   # share of turns with one such pause
+FINALIZE = 0.7     # silence before the recogniser reports the final result
+REVISE_RATE = 0.2  # share of turns whose final text differs from the last interim text
+UTTERANCES = [
+    "Ich heiße Lena und ich komme aus Hamburg",
+    "Am Wochenende gehe ich gern ins Kino",
+    "Mein Bruder arbeitet als Lehrer in Berlin",
+    "Kannst du mir bitte den Weg zum Bahnhof erklären",
+    "Gestern habe ich mit meiner Freundin Pizza gegessen",
+    "Ich lerne Deutsch seit zwei Jahren",
+]
+REVISIONS = {'Hamburg': 'Hamburg.', 'Kino': 'Kino.', 'Berlin': 'Berlin.', 'erklären': 'erklären?',
+             'gegessen': 'gegessen.', 'Jahren': 'Jahren.'}
+
+
+def simulated_turn(rng):
+    """([(seconds, interim text), ...], seconds of the final result, final text)."""
+    words = rng.choice(UTTERANCES).split()
+    pause_at = rng.randrange(2, len(words)) if rng.random() < PAUSE_RATE else None
+    events, t = [], 0.0
+    for k in range(1, len(words) + 1):
+        t += PAUSE if k == pause_at else WORD_GAP
+        events.append((t, ' '.join(words[:k])))
+    final = ' '.join(words)
+    if rng.random() < REVISE_RATE:
+        final = ' '.join(words[:-1] + [REVISIONS[words[-1]]])
+    return events, t + FINALIZE, final
+
+
+def login(app_module):
+    client = app_module.app.test_client()
+    client.post('/login', data={'email': 'bench@example.com', 'password': 'bench-password'})
+    return client
+
+
+def run(app_module, server, turns, threshold, upstream_delay):
+    """Perceived latencies and upstream calls for `turns` simulated turns; threshold None disables speculation."""
+    rng = random.Random(7)
+    final_client, interim_client = login(app_module), login(app_module)
+    session_id = uuid.uuid4().hex
+    lock = threading.Lock()
+    latencies = []
+    before = server.requests_seen
+    stats_before = app_module.speculations.stats()
+
+    def post_interim(text):
+        with lock:
+            interim_client.post('/call/api/interim', json={'session_id': session_id, 'message': text})
+
+    for _ in range(turns):
+        events, final_at, final = simulated_turn(rng)
+        start, timer, speculated = time.perf_counter(), None, None
+        for at, text in events:
+            time.sleep(max(0.0, start + at - time.perf_counter()))
+            if timer is not None:
+                timer.cancel()
+            if threshold is not None and text != speculated:
+                speculated = text
+                timer = threading.Timer(threshold, post_interim, (text,))
+                timer.start()
+        time.sleep(max(0.0, start + final_at - time.perf_counter()))
+        if timer is not None:
+            timer.cancel()
+        heard = time.perf_counter()
+        response = final_client.post('/call/api', json={'session_id': session_id, 'message': final})
+        assert response.status_code == 200, response.status_code
+        latencies.append(time.perf_counter() - heard)
+        time.sleep(upstream_delay)  # the reply is spoken; speculative calls still in flight finish meanwhile
+
+    stats = app_module.speculations.stats()
+    moved = {key: stats[key] - stats_before[key] for key in ('started', 'hits', 'wasted')}
+    return sorted(latencies), server.requests_seen - before, moved
+
+
+def main():
+    turns = int(sys.argv[1]) if len(sys.argv) > 1 else 15
+    upstream_delay = float(sys.argv[2]) if len(sys.argv) > 2 else 0.8
+    thresholds = [int(ms) for ms in sys.argv[3].split(',')] if len(sys.argv) > 3 else [150, 300, 500]
+    server, url = start_stub(delay=upstream_delay)
+    app_module = load_app(upstream_url=url)
+    create_user(app_module)
+    try:
+        print(f"{turns} turns, upstream {upstream_delay * 1000:.0f} ms, final result {FINALIZE * 1000:.0f} ms after the last word, "
+              f"{REVISE_RATE:.0%} of finals revised, {PAUSE_RATE:.0%} of turns with a {PAUSE * 1000:.0f} ms pause")
+        for threshold in [None] + thresholds:
+            latencies, calls, moved = run(app_module, server, turns, threshold / 1000 if threshold is not None else None, upstream_delay)
+            label = 'no speculation' if threshold is None else f'stable {threshold} ms'
+            print(f"  {label:<15} turn latency p50 {latencies[len(latencies) // 2] * 1000:6.0f} ms"
+                  f"  p95 {latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] * 1000:6.0f} ms"
+                  f"  upstream calls/turn {calls / turns:4.2f}  speculations {moved['started']:3d}"
+                  f"  hits {moved['hits']:3d}  wasted {moved['wasted']:3d}")
+    finally:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+"""SQL statements and latency per request, with and without the load_user snapshot cache.
+
+    python -m benchmarks.bench_user_cache [requests_per_route]
+"""
+import sys
+import time
+
+from sqlalchemy import event
+
+from benchmarks.harness import create_user, load_app
+from benchmarks.stub_upstream import start_stub
+from user_cache import create_user_cache
+
+ROUTES = [
+    ('GET', '/dashboard', None),
+    ('GET', '/practice', None),
+    ('GET', '/vocabulary/api/list', None),
+    ('POST', '/chat/api', {'message': 'Hallo, wie geht es dir?'}),
+    ('POST', '/practice/api', {'text': 'Ich habe gestern einen Apfel gegessen.'}),  # served from the practice cache
+]
+
+
+def measure(app_module, client, counter, repeat):
+    rows = {}
+    for method, path, body in ROUTES:
+        client.open(path, method=method, json=body)  # warm-up, fills the caches
+        counter[0] = 0
+        start = time.perf_counter()
+        for _ in range(repeat):
+            client.open(path, method=method, json=body)
+        rows[path] = (counter[0] / repeat, (time.perf_counter() - start) / repeat)
+    return rows
+
+
+def main():
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    server, url = start_stub()
+    app_module = load_app(upstream_url=url)
+    create_user(app_module)
+    client = app_module.app.test_client()
+    client.post('/login', data={'email': 'bench@example.com', 'password': 'bench-password'})
+
+    counter = [0]
+    with app_module.app.app_context():
+        @event.listens_for(app_module.db.engine, 'before_cursor_execute')
+        def count(conn, cursor, statement, parameters, context, executemany):
+            counter[0] += 1
+
+    config = app_module.app.config
+    try:
+        app_module.user_cache = None
+        uncached = measure(app_module, client, counter, repeat)
+        app_module.user_cache = create_user_cache('memory', config['USER_CACHE_TTL'], config['USER_CACHE_SIZE'])
+        cached = measure(app_module, client, counter, repeat)
+    finally:
+        server.shutdown()
+
+    print(f"{'route':<22} {'queries (no cache)':>19} {'queries (cache)':>16} {'ms (no cache)':>14} {'ms (cache)':>11}")
+    for path in uncached:
+        (q0, t0), (q1, t1) = uncached[path], cached[path]
+        print(f"{path:<22} {q0:>19.2f} {q1:>16.2f} {t0 * 1000:>14.2f} {t1 * 1000:>11.2f}")
+    print(f"user cache: {app_module.user_cache.stats()}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+"""Vocabulary search latency at 10k and 100k items per user, FTS5 index vs a LIKE scan.
+
+Fills two users with generated German-like words, corrections and
+explanations (the second user only checks that searches stay within one
+user's rows), then times /vocabulary/api/search for prefix, multi-word,
+umlaut-folded and misspelled queries. The same queries are also timed as the
+LIKE scan used where there is no index. Bulk insert time is reported with
+and without the triggers that keep the index in sync.
+
+    python -m benchmarks.bench_vocabulary_search [sizes, comma-separated] [repeats]
+"""
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import text
+
+from benchmarks.harness import create_user, load_app
+from vocabulary_search import create_search_index
+
+SYLLABLES = ['ge', 'ver', 'be', 'stra', 'ße', 'mäd', 'chen', 'bru', 'der', 'lie', 'be', 'haus', 'tür', 'kü', 'che',
+             'schön', 'ar', 'beit', 'zei', 'tung', 'frü', 'her', 'wo', 'chen', 'en', 'de', 'spiel', 'platz', 'grö', 'ße']
+EXPLANATIONS = ['Spelling: {w} is written with an umlaut.', 'The plural of {w} ends in -en.', 'Use the dative after mit.',
+                'Capitalise nouns such as {w}.', 'Verb goes in second position.', 'ß after a long vowel.']
+QUERIES = {
+    'prefix': lambda words: words[0][:4],
+    'whole word': lambda words: words[1],
+    'two words': lambda words: f"{words[2]} {words[3][:3]}",
+    'no umlaut': lambda words: words[4].replace('ä', 'a').replace('ö', 'o').replace('ü', 'u').replace('ß', 'ss'),
+    'typo': lambda words: words[5][:-2] + words[5][-1] + words[5][-2],
+    'explanation': lambda words: 'plural',
+}
+
+
+def generate(rng, count):
+    seen, items = set(), []
+    while len(items) < count:
+        word = ''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))).capitalize()
+        if word in seen:
+            continue
+        seen.add(word)
+        wrong = word.replace('ä', 'a').replace('ß', 's') if rng.random() < 0.5 else word[:-1]
+        items.append((wrong, word, rng.choice(EXPLANATIONS).format(w=word)))
+    return items
+
+
+def fill(app_module, user_id, items):
+    now = datetime.utcnow()
+    rows = [{'user_id': user_id, 'word': wrong, 'correction': word, 'explanation': explanation,
+             'timestamp': now - timedelta(seconds=i)} for i, (wrong, word, explanation) in enumerate(items)]
+    start = time.perf_counter()
+    with app_module.app.app_context():
+        for i in range(0, len(rows), 5000):
+            app_module.db.session.execute(app_module.db.insert(app_module.Vocabulary), rows[i:i + 5000])
+        app_module.db.session.commit()
+    return time.perf_counter() - start
+
+
+def timed(function, repeats):
+    function()
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = function()
+        samples.append(time.perf_counter() - start)
+    samples.sort()
+    return samples[len(samples) // 2] * 1000, result
+
+
+def insert_without_index(app_module, items):
+    """Seconds to insert `items` for a scratch user with the index triggers dropped, then restore them."""
+    user_id = create_user(app_module, email=f'plain{len(items)}@example.com')
+    with app_module.app.app_context():
+        for name in ('insert', 'delete', 'update'):
+            app_module.db.session.execute(text(f"DROP TRIGGER vocabulary_search_{name}"))
+        app_module.db.session.commit()
+    seconds = fill(app_module, user_id, items)
+    with app_module.app.app_context():
+        app_module.db.session.execute(app_module.db.delete(app_module.Vocabulary).where(app_module.Vocabulary.user_id == user_id))
+        create_search_index(app_module.db.session)
+        app_module.db.session.commit()
+    return seconds
+
+
+def run(app_module, size, repeats):
+    rng = random.Random(size)
+    items = generate(rng, size)
+    plain = insert_without_index(app_module, items)
+    user_id = create_user(app_module, email=f'search{size}@example.com')
+    indexed = fill(app_module, user_id, items)
+    fill(app_module, create_user(app_module, email=f'other{size}@example.com'), generate(rng, size // 10))
+    print(f"{size} items per user: bulk insert {plain:.2f} s without the index, {indexed:.2f} s with its triggers")
+
+    words = [word for _, word, _ in rng.sample(items, 6)]
+    client = app_module.app.test_client()
+    client.post('/login', data={'email': f'search{size}@example.com', 'password': 'bench-password'})
+    for label, make in QUERIES.items():
+        query = make(words)
+        fts_ms, response = timed(lambda: client.get('/vocabulary/api/search', query_string={'q': query}), repeats)
+        found = response.get_json()['items']
+        with app_module.app.test_request_context():
+            like_ms, like = timed(lambda: app_module.like_search_ids(user_id, query, 20), repeats)
+        matches = ','.join(sorted({item['match'] for item in found})) or '-'
+        print(f"    {label:<12} {query!r:<24} index {fts_ms:7.2f} ms ({len(found):2d} hits, {matches:<9})"
+              f"  LIKE scan {like_ms:7.2f} ms ({len(like):2d} hits)")
+
+
+def main():
+    sizes = [int(size) for size in sys.argv[1].split(',')] if len(sys.argv) > 1 else [10000, 100000]
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    app_module = load_app()
+    for size in sizes:
+        run(app_module, size, repeats)
+
+
+if __name__ == '__main__':
+    main()
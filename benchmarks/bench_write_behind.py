@@ -0,0 +1,59 @@
+"""log_activity latency and throughput, committing inline vs through the write-behind queue.
+
+    python -m benchmarks.bench_write_behind [threads] [activities_per_thread]
+"""
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.harness import create_user, load_app
+from write_behind import WriteBehindQueue
+
+
+def run(app_module, user_ids, per_thread):
+    def worker(user_id):
+        latencies = []
+        with app_module.app.app_context():
+            user = app_module.db.session.get(app_module.User, user_id)
+            for i in range(per_thread):
+                start = time.perf_counter()
+                app_module.log_activity(user, 'chat', f'Konversation {i}', 10)
+                latencies.append(time.perf_counter() - start)
+        return latencies
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(len(user_ids)) as pool:
+        latencies = sorted(sum(pool.map(worker, user_ids), []))
+    if app_module.activity_queue is not None:
+        app_module.activity_queue.close()
+    elapsed = time.perf_counter() - start
+    return len(latencies) / elapsed, latencies[len(latencies) // 2], latencies[int(len(latencies) * 0.99)]
+
+
+def main():
+    threads = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    per_thread = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    app_module = load_app()
+    user_ids = [create_user(app_module, email=f'bench{i}@example.com') for i in range(threads)]
+
+    for mode in ('inline', 'write-behind'):
+        if mode == 'write-behind':
+            app_module.activity_queue = WriteBehindQueue(
+                app_module.apply_activity_batch, tempfile.mkdtemp(prefix='deutschai-journal-'), app_module.log.error,
+                interval=0.05, max_batch=200
+            ).start()
+        rate, p50, p99 = run(app_module, user_ids, per_thread)
+        print(f"{mode:>12}: {rate:8.1f} activities/s  p50 {p50 * 1000:6.3f} ms  p99 {p99 * 1000:6.3f} ms")
+        if app_module.activity_queue is not None:
+            print(f"{'':>12}  {app_module.activity_queue.metrics()}")
+
+    with app_module.app.app_context():
+        stats = app_module.db.session.execute(app_module.db.select(
+            app_module.db.func.sum(app_module.UserStats.activity_count), app_module.db.func.sum(app_module.UserStats.xp)
+        ).where(app_module.UserStats.user_id == app_module.User.id)).one()
+        print(f"activities recorded: {stats[0]} (expected {2 * threads * per_thread}), total xp: {stats[1]}")
+
+
+if __name__ == '__main__':
+    main()
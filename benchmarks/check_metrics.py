@@ -0,0 +1,110 @@
+"""Check that the /metrics counters move, against the stub upstream.
+
+Sends one request to each AI endpoint through the WSGI app and one through
+the ASGI app, plus an unauthenticated one, and asserts on the difference
+between two scrapes. Then times /chat/api with instrumentation on and off.
+
+    python -m benchmarks.check_metrics [requests]
+"""
+import asyncio
+import re
+import sys
+import time
+
+import httpx
+
+from benchmarks.harness import create_user, load_app, login_cookie
+from benchmarks.stub_upstream import start_stub
+
+SAMPLE = re.compile(r'^(\w+)(\{.*\})? (\S+)$')
+ESSAY = "Ich wohne seit drei Jahren in Berlin. Mein Bruda arbeitet in Hamburg als Lehrer an einer Schule."
+
+
+def scrape(client):
+    response = client.get('/metrics')
+    assert response.status_code == 200, response.status_code
+    assert response.headers['Content-Type'].startswith('text/plain; version=0.0.4')
+    samples = {}
+    for line in response.get_data(as_text=True).splitlines():
+        match = SAMPLE.match(line)
+        if match:
+            samples[match.group(1) + (match.group(2) or '')] = float(match.group(3))
+    return samples
+
+
+def total(samples, name, **labels):
+    """Sum of the samples of `name` whose labels include `labels`."""
+    wanted = [f'{key}="{value}"' for key, value in labels.items()]
+    return sum(value for sample, value in samples.items()
+               if sample.split('{')[0] == name and all(pair in sample for pair in wanted))
+
+
+def moved(before, after, name, **labels):
+    return total(after, name, **labels) - total(before, name, **labels)
+
+
+def check_counters(app_module, client):
+    import asgi
+    before = scrape(client)
+    assert client.post('/chat/api', json={'message': 'Hallo!'}).status_code == 200
+    assert client.post('/practice/api', json={'text': ESSAY}).status_code == 200
+    assert client.post('/call/api', json={'messages': [{'role': 'user', 'content': 'Guten Tag'}]}).status_code == 200
+    assert app_module.app.test_client().post('/chat/api', json={'message': 'Hallo!'}).status_code == 401
+
+    async def through_asgi():
+        transport = httpx.ASGITransport(app=asgi.application)
+        async with httpx.AsyncClient(transport=transport, base_url='http://check') as async_client:
+            response = await async_client.post('/chat/api', json={'message': 'Wie geht es dir?'},
+                                               headers={'Cookie': login_cookie(app_module)})
+            assert response.status_code == 200, response.status_code
+    asyncio.run(through_asgi())
+    after = scrape(client)
+
+    checks = {
+        'chat requests (WSGI + ASGI)': (moved(before, after, 'deutschai_http_requests_total', route='/chat/api', status='200'), 2),
+        'unauthorized chat requests': (moved(before, after, 'deutschai_http_requests_total', route='/chat/api', status='401'), 1),
+        'practice requests': (moved(before, after, 'deutschai_http_requests_total', route='/practice/api', status='200'), 1),
+        'chat latency observations': (moved(before, after, 'deutschai_http_request_duration_seconds_count', route='/chat/api'), 3),
+        'upstream 200s': (moved(before, after, 'deutschai_upstream_requests_total', status='200'), 4),
+        'upstream latency observations': (moved(before, after, 'deutschai_upstream_request_duration_seconds_count'), 4),
+        'prompt tokens': (moved(before, after, 'deutschai_upstream_tokens_total', kind='prompt'), 1),
+        'completion tokens': (moved(before, after, 'deutschai_upstream_tokens_total', kind='completion'), 1),
+        'practice DB queries': (moved(before, after, 'deutschai_db_queries_total', route='/practice/api'), 1),
+        'queries-per-request observations': (moved(before, after, 'deutschai_db_queries_per_request_count', route='/chat/api'), 3),
+    }
+    for label, (value, minimum) in checks.items():
+        print(f"  {label:<34} +{value:g}")
+        assert value >= minimum, f"{label}: expected at least +{minimum}, got +{value:g}"
+    # The ASGI request runs in two request contexts and must still count once
+    assert moved(before, after, 'deutschai_http_requests_total', route='/chat/api') == 3
+    print("metrics counters move as expected")
+
+
+def time_chat(client, requests):
+    start = time.perf_counter()
+    for i in range(requests):
+        client.post('/chat/api', json={'message': f'Hallo {i}'})
+    return (time.perf_counter() - start) / requests
+
+
+def main():
+    requests = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    server, url = start_stub()
+    app_module = load_app(upstream_url=url)
+    create_user(app_module)
+    client = app_module.app.test_client()
+    client.post('/login', data={'email': 'bench@example.com', 'password': 'bench-password'})
+    try:
+        check_counters(app_module, client)
+        metrics = app_module.metrics
+        for label, value in (('instrumented', metrics), ('metrics off', None)):
+            app_module.metrics = value
+            time_chat(client, 20)
+            print(f"/chat/api {label:<13} {time_chat(client, requests) * 1000:.2f} ms per request")
+        app_module.metrics = metrics
+    finally:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,41 @@
+"""Shared setup for benchmarks that drive the Flask app.
+
+`load_app` must run before anything else imports `app`, because the database
+URL and upstream URL are read from the environment at import time.
+"""
+import os
+import tempfile
+
+
+def load_app(upstream_url=None, database_url=None):
+    if database_url is None:
+        database_url = f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='deutschai-bench-'), 'bench.db')}"
+    os.environ['DATABASE_URL'] = database_url
+    if upstream_url:
+        os.environ['OPENROUTER_API_URL'] = upstream_url
+    import app as app_module
+    app_module.app.config['SESSION_COOKIE_SECURE'] = False
+    app_module.app.config['REMEMBER_COOKIE_SECURE'] = False
+    with app_module.app.app_context():
+        app_module.db.create_all()
+    return app_module
+
+
+def create_user(app_module, email='bench@example.com', password='bench-password', **fields):
+    with app_module.app.app_context():
+        user = app_module.User.query.filter_by(email=email).first()
+        if user is None:
+            values = dict(first_name='Bench', last_name='User', german_level='A2', target_language='de', native_language='en')
+            values.update(fields)
+            user = app_module.User(email=email, password=app_module.bcrypt.generate_password_hash(password).decode('utf-8'), **values)
+            app_module.db.session.add(user)
+            app_module.db.session.commit()
+        return user.id
+
+
+def login_cookie(app_module, email='bench@example.com', password='bench-password'):
+    """Log in through the test client and return a `Cookie` header value."""
+    client = app_module.app.test_client()
+    client.post('/login', data={'email': email, 'password': password})
+    cookies = [client.get_cookie(name) for name in ('session', 'remember_token')]
+    return '; '.join(f"{cookie.key}={cookie.value}" for cookie in cookies if cookie is not None)
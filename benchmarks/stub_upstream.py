@@ -0,0 +1,176 @@
+"""Local stand-in for the OpenRouter chat completions endpoint.
+
+Used by the benchmark scripts so they never touch the real upstream:
+
+    server, url = start_stub(delay=0.05)
+    ...
+    server.shutdown()
+
+Faults can be injected to exercise the resilience layer, either at start or
+by setting the attributes on a running server:
+
+    server, url = start_stub(fault_rate=0.3, fault_status=503)    # 30% 503s
+    server, url = start_stub(fault_every=2, fault_status=429, retry_after=2)  # every 2nd call
+    server, url = start_stub(slow_rate=0.05, slow_delay=2.0)      # 5% of calls stall 2s
+"""
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def completion_body(content, model="openai/gpt-3.5-turbo", prompt_tokens=None):
+    body = {
+        "id": "stub-completion",
+        "object": "chat.completion",
+        "model": model,
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+    }
+    if prompt_tokens is not None:
+        # OpenRouter reports usage on every non-streaming completion; ~4 characters per token here
+        completion_tokens = len(content) // 4 + 1
+        body["usage"] = {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens, "total_tokens": prompt_tokens + completion_tokens}
+    return body
+
+
+# A few learner misspellings the stub "detects", so corrections are not always empty
+MISSPELLINGS = {'libe': 'liebe', 'Disch': 'Tisch', 'Bruda': 'Bruder'}
+
+
+def grammar_analysis(text):
+    corrections = [
+        {"original": word, "correction": MISSPELLINGS[word], "explanation": "Spelling.", "type": "spelling"}
+        for word in text.replace('.', ' ').split() if word in MISSPELLINGS
+    ]
+    return {"score": max(0, 100 - 10 * len(corrections)), "vocab_level": "A2", "analysis_summary": "Good.", "corrections": corrections}
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        payload = json.loads(self.rfile.read(length) or b'{}')
+        with self.server.lock:
+            self.server.requests_seen += 1
+            self.server.in_flight += 1
+            self.server.max_in_flight = max(self.server.max_in_flight, self.server.in_flight)
+        try:
+            self.respond(payload)
+        finally:
+            with self.server.lock:
+                self.server.in_flight -= 1
+
+    def respond(self, payload):
+        if self.server.delay:
+            time.sleep(self.server.delay)
+        if self.inject_fault():
+            return
+        if payload.get('response_format', {}).get('type') == 'json_object':
+            content = json.dumps(grammar_analysis(payload['messages'][-1]['content']))
+        else:
+            content = "Hallo! Wie geht es dir?"
+        if payload.get('stream'):
+            return self.send_stream(content)
+        prompt_tokens = sum(len(m.get('content') or '') for m in payload.get('messages', [])) // 4 + 1
+        body = json.dumps(completion_body(content, payload.get('model', 'openai/gpt-3.5-turbo'), prompt_tokens)).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def inject_fault(self):
+        """Apply the server's configured faults; returns True if an error response was sent instead."""
+        server = self.server
+        if server.slow_rate and random.random() < server.slow_rate:
+            time.sleep(server.slow_delay)
+        with server.lock:
+            nth = server.requests_seen
+        periodic = server.fault_every and nth % server.fault_every == 0
+        if not (periodic or server.fault_rate and random.random() < server.fault_rate):
+            return False
+        with server.lock:
+            server.faults_sent += 1
+        body = json.dumps({"error": {"code": server.fault_status, "message": "injected fault"}}).encode()
+        self.send_response(server.fault_status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        if server.retry_after is not None:
+            self.send_header('Retry-After', str(server.retry_after))
+        self.end_headers()
+        self.wfile.write(body)
+        return True
+
+    def send_stream(self, content):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        words = content.split(' ')
+        for i, word in enumerate(words):
+            delta = word if i == 0 else ' ' + word
+            chunk = {"choices": [{"index": 0, "delta": {"content": delta}}]}
+            self.write_chunk(f"data: {json.dumps(chunk)}\n\n".encode())
+            if self.server.delay:
+                time.sleep(self.server.delay / len(words))
+        self.write_chunk(b"data: [DONE]\n\n")
+        self.write_chunk(b"")
+
+    def write_chunk(self, data):
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+
+def start_stub(delay=0.0, port=0, handler=StubHandler, fault_rate=0.0, fault_every=0, fault_status=503,
+               retry_after=None, slow_rate=0.0, slow_delay=0.0):
+    server = StubServer(('127.0.0.1', port), handler)
+    server.delay = delay
+    server.fault_rate = fault_rate
+    server.fault_every = fault_every
+    server.fault_status = fault_status
+    server.retry_after = retry_after
+    server.slow_rate = slow_rate
+    server.slow_delay = slow_delay
+    server.lock = threading.Lock()
+    server.requests_seen = 0
+    server.faults_sent = 0
+    server.in_flight = 0
+    server.max_in_flight = 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/api/v1/chat/completions"
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description="Run the stub upstream; point OPENROUTER_API_URL at it.")
+    parser.add_argument('--port', type=int, default=8999)
+    parser.add_argument('--delay', type=float, default=0.0)
+    parser.add_argument('--fault-rate', type=float, default=0.0)
+    parser.add_argument('--fault-every', type=int, default=0)
+    parser.add_argument('--fault-status', type=int, default=503)
+    parser.add_argument('--retry-after')
+    parser.add_argument('--slow-rate', type=float, default=0.0)
+    parser.add_argument('--slow-delay', type=float, default=0.0)
+    args = parser.parse_args()
+    server, url = start_stub(
+        delay=args.delay, port=args.port, fault_rate=args.fault_rate, fault_every=args.fault_every,
+        fault_status=args.fault_status,
+        retry_after=args.retry_after, slow_rate=args.slow_rate, slow_delay=args.slow_delay,
+    )
+    print(f"Stub upstream listening on {url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
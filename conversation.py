@@ -0,0 +1,107 @@
+"""Server-side history for /call/api voice conversations.
+
+The browser sends only the new utterance and a `session_id`; the server keeps
+the recent turns that fit in a token budget. Turns that fall out of the budget
+are folded into a rolling extractive summary. That summary holds the first
+sentence of each dropped turn and is capped by its own budget, so what goes
+upstream stays the same size however long the call runs.
+"""
+import re
+
+from response_cache import cache_key, create_backend
+
+# Rough English/German average for GPT-style tokenizers, plus the per-message framing
+CHARS_PER_TOKEN = 4
+MESSAGE_OVERHEAD = 4
+MAX_SESSION_ID_LENGTH = 64
+
+
+def estimate_tokens(text):
+    return len(text) // CHARS_PER_TOKEN + MESSAGE_OVERHEAD
+
+
+def summary_line(turn, max_chars=160):
+    """One summary line for a turn: its speaker and first sentence, clipped to `max_chars`."""
+    text = ' '.join(turn['content'].split())
+    match = re.match(r'.+?[.!?…](\s|$)', text)
+    sentence = match.group(0).strip() if match else text
+    if len(sentence) > max_chars:
+        sentence = sentence[:max_chars - 1].rstrip() + '…'
+    return f"{'User' if turn['role'] == 'user' else 'Ahmad'}: {sentence}"
+
+
+class Conversation:
+    def __init__(self, turns=(), summary=(), turn_count=0):
+        self.turns = list(turns)
+        self.summary = list(summary)
+        self.turn_count = turn_count
+
+    @classmethod
+    def from_dict(cls, data):
+        if not data:
+            return cls()
+        return cls(data['turns'], data['summary'], data['turn_count'])
+
+    def to_dict(self):
+        return {'turns': self.turns, 'summary': self.summary, 'turn_count': self.turn_count}
+
+    def summary_note(self):
+        """Text appended to the system prompt, or '' while nothing has been folded yet."""
+        if not self.summary:
+            return ''
+        return "Summary of the earlier part of this call:\n" + '\n'.join(self.summary)
+
+    def messages(self, message):
+        """The recent turns followed by the new user message, ready to send upstream."""
+        return self.turns + [{'role': 'user', 'content': message}]
+
+    def add_exchange(self, message, reply, history_tokens, summary_tokens):
+        self.turns.append({'role': 'user', 'content': message})
+        self.turns.append({'role': 'assistant', 'content': reply})
+        self.turn_count += 1
+        used = sum(estimate_tokens(turn['content']) for turn in self.turns)
+        # Fold whole exchanges so the window never starts with an assistant reply
+        while used > history_tokens and len(self.turns) > 2:
+            for turn in self.turns[:2]:
+                used -= estimate_tokens(turn['content'])
+                self.summary.append(summary_line(turn))
+            del self.turns[:2]
+        used = sum(estimate_tokens(line) for line in self.summary)
+        while used > summary_tokens and self.summary:
+            used -= estimate_tokens(self.summary.pop(0))
+
+
+class ConversationStore:
+    """Conversations keyed by (user, session id) in a response_cache backend."""
+
+    def __init__(self, backend, ttl=7200, history_tokens=1200, summary_tokens=300):
+        self.backend = backend
+        self.ttl = ttl
+        self.history_tokens = history_tokens
+        self.summary_tokens = summary_tokens
+
+    def key(self, user_id, session_id):
+        return cache_key('call-session', user_id, session_id)
+
+    def load(self, user_id, session_id):
+        return Conversation.from_dict(self.backend.get(self.key(user_id, session_id)))
+
+    def record(self, user_id, session_id, message, reply):
+        """Append one user/assistant exchange to a session, trimming it to budget."""
+        conversation = self.load(user_id, session_id)
+        conversation.add_exchange(message, reply, self.history_tokens, self.summary_tokens)
+        self.backend.set(self.key(user_id, session_id), conversation.to_dict(), self.ttl)
+        return conversation
+
+    def __len__(self):
+        return len(self.backend)
+
+
+def valid_session_id(session_id):
+    return isinstance(session_id, str) and 0 < len(session_id) <= MAX_SESSION_ID_LENGTH
+
+
+def create_conversation_store(backend, ttl, max_entries, path=None, history_tokens=1200, summary_tokens=300):
+    """Build a `ConversationStore` from config values: 'memory' (per worker) or 'sqlite' (shared file)."""
+    storage = create_backend(backend, max_entries, path, 'conversation store')
+    return ConversationStore(storage, ttl, history_tokens, summary_tokens)
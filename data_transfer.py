@@ -0,0 +1,129 @@
+"""Streaming export and import of a learner's vocabulary and activity history.
+
+Exports are generators: app.py feeds them one page of rows at a time and
+each page becomes one chunk of the response, so memory stays flat however
+long the history is. The formats are:
+
+    ndjson  one JSON object per line, every field; imports back losslessly
+    csv     a header row, then every field
+    anki    tab-separated Front/Back/Mistake notes with Anki's file headers
+            (vocabulary only), for File > Import in Anki 2.1.55+
+
+Imports read an uploaded file line by line in any of these formats. A row
+needs a word and a correction. Review state and timestamps are kept when the
+file has them, so an NDJSON or CSV export restores exactly. `read_vocabulary`
+yields (line number, row or error message) and leaves batching and
+deduplication to the caller.
+"""
+import csv
+import io
+import json
+from datetime import datetime
+
+FORMATS = ('ndjson', 'csv', 'anki')
+CONTENT_TYPES = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv; charset=utf-8',
+    'anki': 'text/tab-separated-values; charset=utf-8',
+}
+EXTENSIONS = {'ndjson': 'ndjson', 'csv': 'csv', 'anki': 'txt'}
+FORMAT_BY_EXTENSION = {'ndjson': 'ndjson', 'jsonl': 'ndjson', 'json': 'ndjson', 'csv': 'csv', 'txt': 'anki', 'tsv': 'anki'}
+
+VOCABULARY_EXPORT_FIELDS = ('word', 'correction', 'explanation', 'timestamp', 'ease', 'interval_days', 'reps', 'due_at')
+ACTIVITY_EXPORT_FIELDS = ('type', 'description', 'points', 'timestamp')
+ANKI_HEADER = "#separator:tab\n#html:false\n#columns:Front\tBack\tMistake\n"
+MAX_TERM_LENGTH = 100  # Vocabulary.word and .correction are String(100)
+
+
+def format_for(name, filename=None):
+    """The format named `name`, else the one implied by `filename`'s extension; None if neither is known."""
+    if name:
+        return name if name in FORMATS else None
+    extension = filename.rsplit('.', 1)[-1].lower() if filename and '.' in filename else ''
+    return FORMAT_BY_EXTENSION.get(extension)
+
+
+def plain(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def tsv_field(value):
+    return ' '.join(str(value or '').split())
+
+
+def encode(format, fields, pages):
+    """Text chunks of the export of `pages`, an iterable of lists of rows holding the values of `fields` in order."""
+    if format == 'csv':
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(fields)
+        yield buffer.getvalue()
+    elif format == 'anki':
+        yield ANKI_HEADER
+        front, back, mistake = (fields.index(f) for f in ('correction', 'explanation', 'word'))
+    for rows in pages:
+        if format == 'ndjson':
+            yield ''.join(json.dumps(dict(zip(fields, map(plain, row))), ensure_ascii=False) + '\n' for row in rows)
+        elif format == 'csv':
+            buffer.seek(0)
+            buffer.truncate()
+            writer.writerows(map(plain, row) for row in rows)
+            yield buffer.getvalue()
+        else:
+            yield ''.join(f"{tsv_field(row[front])}\t{tsv_field(row[back])}\t{tsv_field(row[mistake])}\n" for row in rows)
+
+
+def records(format, lines):
+    """(line number, dict or None) for each data line of an import; None marks a line that cannot be parsed."""
+    if format == 'ndjson':
+        for number, line in enumerate(lines, 1):
+            if line.strip():
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    record = None
+                yield number, record if isinstance(record, dict) else None
+    elif format == 'csv':
+        reader = csv.DictReader(lines)
+        for record in reader:
+            yield reader.line_num, record
+    else:
+        for number, line in enumerate(lines, 1):
+            if line.startswith('#') or not line.strip():
+                continue
+            columns = line.rstrip('\r\n').split('\t')
+            correction, explanation = columns[0], columns[1] if len(columns) > 1 else ''
+            word = columns[2] if len(columns) > 2 and columns[2] else correction
+            yield number, {'word': word, 'correction': correction, 'explanation': explanation}
+
+
+def vocabulary_row(record):
+    """Vocabulary column values from one import record; raises ValueError when it is unusable."""
+    if record is None:
+        raise ValueError("not a valid record")
+    word, correction = (str(record.get(f) or '').strip() for f in ('word', 'correction'))
+    if not word or not correction:
+        raise ValueError("missing word or correction")
+    if len(word) > MAX_TERM_LENGTH or len(correction) > MAX_TERM_LENGTH:
+        raise ValueError(f"word and correction are limited to {MAX_TERM_LENGTH} characters")
+    row = {'word': word, 'correction': correction, 'explanation': str(record.get('explanation') or '').strip() or None}
+    try:
+        for field in ('timestamp', 'due_at'):
+            if record.get(field):
+                row[field] = datetime.fromisoformat(record[field])
+        for field, kind in (('ease', float), ('interval_days', int), ('reps', int)):
+            if record.get(field) not in (None, ''):
+                row[field] = kind(record[field])
+    except (TypeError, ValueError):
+        raise ValueError("invalid timestamp or review state")
+    return row
+
+
+def read_vocabulary(format, stream):
+    """(line number, Vocabulary column values or an error message) for each record of a binary upload stream."""
+    lines = io.TextIOWrapper(stream, encoding='utf-8-sig', errors='replace', newline='' if format == 'csv' else None)
+    for number, record in records(format, lines):
+        try:
+            yield number, vocabulary_row(record)
+        except ValueError as e:
+            yield number, str(e)
@@ -0,0 +1,60 @@
+"""Database connection profiles.
+
+SQLite starts every connection with rollback-journal locking, a 2 MB page
+cache and no busy timeout. Under the 'production' profile each new
+connection instead gets:
+
+- WAL journaling, so dashboard reads no longer block vocabulary/activity writes.
+- synchronous=NORMAL, which is durable across application crashes under WAL.
+- A memory-mapped file and a larger page cache.
+- A busy timeout, so concurrent writers wait for the lock instead of failing.
+
+Other databases (DATABASE_URL=postgresql://...) only get pool sizing.
+"""
+from sqlalchemy import event
+
+PROFILES = ('production', 'default')
+
+
+def sqlite_pragmas(config):
+    return {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'mmap_size': config['SQLITE_MMAP_SIZE'],
+        'cache_size': -config['SQLITE_CACHE_SIZE_KB'],
+        'busy_timeout': config['SQLITE_BUSY_TIMEOUT_MS'],
+        'temp_store': 'MEMORY',
+    }
+
+
+def engine_options(config):
+    """SQLALCHEMY_ENGINE_OPTIONS for the configured URI: one pool per worker process."""
+    options = {
+        'pool_size': config['DB_POOL_SIZE'],
+        'max_overflow': config['DB_MAX_OVERFLOW'],
+        'pool_timeout': config['DB_POOL_TIMEOUT'],
+    }
+    if config['SQLALCHEMY_DATABASE_URI'].startswith('sqlite'):
+        if ':memory:' in config['SQLALCHEMY_DATABASE_URI'] or config['SQLALCHEMY_DATABASE_URI'] == 'sqlite://':
+            return {}  # a single shared in-memory connection, nothing to size
+        options['connect_args'] = {'timeout': config['SQLITE_BUSY_TIMEOUT_MS'] / 1000}
+    else:
+        options['pool_pre_ping'] = True
+    return options
+
+
+def apply_profile(engine, config):
+    """Install the configured profile's per-connection settings on `engine`."""
+    profile = config['DB_PROFILE']
+    if profile not in PROFILES:
+        raise ValueError(f"Unknown database profile: {profile}")
+    if profile == 'default' or engine.dialect.name != 'sqlite':
+        return
+    pragmas = sqlite_pragmas(config)
+
+    @event.listens_for(engine, 'connect')
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
@@ -0,0 +1,104 @@
+"""Sentence-level incremental re-analysis for /practice/api.
+
+Learners edit long texts and re-check them, so a practice text is split into
+sentences and each sentence's analysis is cached on its own. A re-check sends
+upstream only the sentences that changed, in parallel. It then merges them
+with the cached ones into one response in the usual
+score/vocab_level/analysis_summary/corrections schema.
+
+The first check of a text still goes upstream in one piece. That costs fewer
+tokens than one request per sentence, each carrying the system prompt. Its
+result is then split back over the sentences: each correction goes to the
+sentence containing its `original` text, and every sentence gets the text's
+score, level and summary.
+"""
+import re
+
+from conversation import estimate_tokens
+
+CEFR_LEVELS = ('A1', 'A2', 'B1', 'B2', 'C1', 'C2')
+# Full stops that do not end a sentence
+ABBREVIATIONS = {'z.b', 'd.h', 'u.a', 'usw', 'bzw', 'ca', 'dr', 'nr', 'str', 'vgl', 'evtl', 'etc', 'e.g', 'i.e', 'mr', 'mrs', 'ms', 'vs'}
+SENTENCE_END = re.compile(r'[.!?…]+["»«“”\')]*\s+|\n\s*')
+SUMMARY_SENTENCES = 3
+
+
+def split_sentences(text):
+    """The sentences of text, each stripped; ordinals ("am 3. Mai") and abbreviations do not split."""
+    sentences, start = [], 0
+    for match in SENTENCE_END.finditer(text):
+        words = text[start:match.start()].split()
+        last = words[-1].rstrip('.').lower() if words else ''
+        if match.group().strip() == '.' and (last.isdigit() or last in ABBREVIATIONS):
+            continue
+        sentence = text[start:match.end()].strip()
+        if sentence:
+            sentences.append(sentence)
+        start = match.end()
+    if text[start:].strip():
+        sentences.append(text[start:].strip())
+    return sentences
+
+
+def word_count(text):
+    return max(1, len(text.split()))
+
+
+def merge_analyses(sentences, analyses):
+    """One analysis for the whole text from per-sentence analyses."""
+    weights = [word_count(sentence) for sentence in sentences]
+    score = sum(analysis.get('score', 0) * weight for analysis, weight in zip(analyses, weights)) / sum(weights)
+    levels = [analysis.get('vocab_level') for analysis in analyses if analysis.get('vocab_level') in CEFR_LEVELS]
+    # The summaries of the weakest sentences say the most about the text
+    weakest = sorted(range(len(analyses)), key=lambda i: analyses[i].get('score', 0))[:SUMMARY_SENTENCES]
+    summaries = []
+    for i in sorted(weakest):
+        summary = analyses[i].get('analysis_summary')
+        if summary and summary not in summaries:
+            summaries.append(summary)
+    return {
+        'score': round(score),
+        'vocab_level': max(levels, key=CEFR_LEVELS.index) if levels else analyses[0].get('vocab_level', 'A1'),
+        'analysis_summary': ' '.join(summaries),
+        'corrections': [c for analysis in analyses for c in analysis.get('corrections') or [] if isinstance(c, dict)],
+    }
+
+
+def distribute(sentences, analysis):
+    """Per-sentence analyses from one analysis of the whole text, or None if a correction cannot be placed."""
+    corrections = [[] for _ in sentences]
+    position = 0
+    for c in analysis.get('corrections') or []:
+        original = c.get('original') if isinstance(c, dict) else None
+        if not original:
+            return None
+        found = next((i for i in range(position, len(sentences)) if original in sentences[i]), None)
+        if found is None:
+            return None
+        corrections[found].append(c)
+        position = found
+    shared = {key: analysis.get(key) for key in ('score', 'vocab_level', 'analysis_summary')}
+    return [dict(shared, corrections=sentence_corrections) for sentence_corrections in corrections]
+
+
+class SentencePlan:
+    """The sentences of one practice text and the analyses known for them so far (None while pending)."""
+
+    def __init__(self, sentences, analyses):
+        self.sentences = sentences
+        self.analyses = analyses
+
+    @property
+    def pending(self):
+        return [i for i, analysis in enumerate(self.analyses) if analysis is None]
+
+    def worth_fanning_out(self, system_prompt, text):
+        """Whether sending the pending sentences one by one costs fewer prompt tokens than the whole text once."""
+        pending = self.pending
+        if len(pending) == len(self.sentences):
+            return False
+        prompt = estimate_tokens(system_prompt)
+        return sum(prompt + estimate_tokens(self.sentences[i]) for i in pending) < prompt + estimate_tokens(text)
+
+    def merged(self):
+        return merge_analyses(self.sentences, self.analyses)
@@ -0,0 +1,346 @@
+"""Materialized XP leaderboards with O(log n) rank lookups and top-k pages.
+
+Every learner sits on three boards: global, their target language, and their
+CEFR level. Each board comes in two windows: all-time XP, and XP earned
+since Monday 00:00 UTC ('week'). The weekly boards only hold learners who
+earned XP that week. Each board is a `RankedList` of `board_key`s, ordered
+by XP descending and then by user id, so ties go to the older account.
+Finding a learner's rank and reading a page of k entries cost O(log n + k).
+
+app.py keeps the boards current. Each committed XP change passes the user's
+new total and the points earned this week to `record`. Changes of target
+language or level go to `move`. Signups are not recorded until the learner
+first earns XP or the next reconcile. The boards live in the memory of one
+worker, so changes committed by other workers arrive through `reconcile`.
+It rebuilds every board from the database every `interval` seconds, and
+`drift` counts the learners whose XP it had to correct. A change recorded
+while a rebuild is running is replayed onto the new boards before they
+replace the old ones.
+"""
+import threading
+import time
+from bisect import bisect_left, insort
+from datetime import datetime, timedelta
+
+WINDOWS = ('all', 'week')
+BLOCK_SIZE = 512
+USER_ID_BITS = 32
+
+
+def week_start(moment):
+    """Monday 00:00 of the week `moment` falls in."""
+    day = datetime(moment.year, moment.month, moment.day)
+    return day - timedelta(days=day.weekday())
+
+
+def scopes(language, level):
+    return ('global', f'language:{language}', f'level:{level}')
+
+
+def board_key(xp, user_id):
+    # One int instead of an (-xp, user_id) tuple: a third of the memory, and bisect compares it in C
+    return (-xp << USER_ID_BITS) | user_id
+
+
+def board_entry(key):
+    """(user id, xp) of a board key."""
+    return key & ((1 << USER_ID_BITS) - 1), -(key >> USER_ID_BITS)
+
+
+class RankedList:
+    """A sorted set of unique, comparable keys, with access by position.
+
+    Keys live in sorted blocks of up to 2 * BLOCK_SIZE, found by bisecting the
+    blocks' last keys. A Fenwick tree over the block lengths turns a block
+    number into the position of its first key and back in O(log n), so
+    insert, remove, rank and the start of a slice are O(log n) plus a
+    memmove within one block.
+    """
+
+    def __init__(self):
+        self.blocks = []
+        self.lasts = []  # last key of each block
+        self.tree = [0]  # Fenwick tree over len(block), 1-based
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    @classmethod
+    def from_sorted(cls, keys):
+        """Build the list from unique keys already in ascending order, in O(n)."""
+        ranked = cls()
+        ranked.blocks = [keys[i:i + BLOCK_SIZE] for i in range(0, len(keys), BLOCK_SIZE)]
+        ranked.reindex()
+        return ranked
+
+    def reindex(self):
+        """Recompute the last keys and the Fenwick tree after blocks were split or dropped."""
+        self.lasts = [block[-1] for block in self.blocks]
+        self.tree = [0] + [len(block) for block in self.blocks]
+        for i in range(1, len(self.tree)):
+            parent = i + (i & -i)
+            if parent < len(self.tree):
+                self.tree[parent] += self.tree[i]
+        self.size = sum(len(block) for block in self.blocks)
+
+    def grow(self, block, delta):
+        tree, i = self.tree, block + 1
+        while i < len(tree):
+            tree[i] += delta
+            i += i & -i
+        self.size += delta
+
+    def before(self, block):
+        """How many keys the blocks ahead of `block` hold."""
+        total, i = 0, block
+        while i > 0:
+            total += self.tree[i]
+            i -= i & -i
+        return total
+
+    def locate(self, position):
+        """(block, offset in it) of the key at 0-based `position` < len(self)."""
+        block, step = 0, 1 << (len(self.tree).bit_length() - 1)
+        while step:
+            if block + step < len(self.tree) and self.tree[block + step] <= position:
+                block += step
+                position -= self.tree[block]
+            step >>= 1
+        return block, position
+
+    def insert(self, key):
+        if not self.blocks:
+            self.blocks, self.lasts, self.tree, self.size = [[key]], [key], [0, 1], 1
+            return
+        i = min(bisect_left(self.lasts, key), len(self.blocks) - 1)
+        block = self.blocks[i]
+        insort(block, key)
+        self.lasts[i] = block[-1]
+        if len(block) > 2 * BLOCK_SIZE:
+            self.blocks[i:i + 1] = [block[:BLOCK_SIZE], block[BLOCK_SIZE:]]
+            self.reindex()
+        else:
+            self.grow(i, 1)
+
+    def remove(self, key):
+        i = bisect_left(self.lasts, key)
+        block = self.blocks[i] if i < len(self.blocks) else ()
+        j = bisect_left(block, key)
+        if j == len(block) or block[j] != key:
+            raise KeyError(key)
+        del block[j]
+        if not block:
+            del self.blocks[i]
+            self.reindex()
+        else:
+            self.lasts[i] = block[-1]
+            self.grow(i, -1)
+
+    def rank(self, key):
+        """How many keys are smaller than `key`."""
+        i = bisect_left(self.lasts, key)
+        if i == len(self.blocks):
+            return self.size
+        return self.before(i) + bisect_left(self.blocks[i], key)
+
+    def slice(self, start, count):
+        """Up to `count` keys from position `start` (0-based) on."""
+        if start >= self.size or count <= 0:
+            return []
+        i, offset = self.locate(start)
+        keys = self.blocks[i][offset:offset + count]
+        while len(keys) < count and i + 1 < len(self.blocks):
+            i += 1
+            keys.extend(self.blocks[i][:count - len(keys)])
+        return keys
+
+
+class Leaderboard:
+    """All-time and weekly XP boards, global, per target language and per CEFR level.
+
+    `load()` returns (users, weekly, now): users as (user id, xp, target
+    language, CEFR level) rows, weekly as {user id: XP earned since
+    week_start(now)}.
+    """
+
+    def __init__(self, load, interval=300, logger=None):
+        self.load = load
+        self.interval = interval
+        self.log = logger
+        self.boards = {}
+        self.members = {}  # user id -> [xp, week_xp, language, level]
+        self.week = None
+        self.built_at = None
+        self.replay = None  # changes recorded while a rebuild runs
+        self.counts = {'updates': 0, 'moves': 0, 'reconciles': 0, 'failures': 0, 'drift': 0}
+        self.last_reconcile_seconds = 0.0
+        self.lock = threading.Lock()
+        self.build_lock = threading.Lock()
+        self.thread = None
+
+    def board(self, window, scope):
+        board = self.boards.get((window, scope))
+        if board is None:
+            board = self.boards[(window, scope)] = RankedList()
+        return board
+
+    def place(self, user_id, member):
+        xp, week_xp, language, level = member
+        key, week_key = board_key(xp, user_id), board_key(week_xp, user_id)
+        for scope in scopes(language, level):
+            self.board('all', scope).insert(key)
+            if week_xp > 0:
+                self.board('week', scope).insert(week_key)
+
+    def unplace(self, user_id, member):
+        xp, week_xp, language, level = member
+        for scope in scopes(language, level):
+            self.boards[('all', scope)].remove(board_key(xp, user_id))
+            if week_xp > 0:
+                self.boards[('week', scope)].remove(board_key(week_xp, user_id))
+
+    def roll_week(self, now):
+        """Empty the weekly boards once a new week has begun."""
+        start = week_start(now)
+        if self.week is not None and start > self.week:
+            self.week = start
+            self.boards = {key: board for key, board in self.boards.items() if key[0] != 'week'}
+            for member in self.members.values():
+                member[1] = 0
+
+    def record(self, user_id, xp, week_points, language, level, at):
+        """A committed XP change: the user's new total, and the points of it earned in the week of `at`."""
+        with self.lock:
+            if self.replay is not None:
+                self.replay.append(('record', user_id, xp, week_points, language, level, at))
+            if self.built_at is not None:
+                self.apply_record(user_id, xp, week_points, language, level, at)
+
+    def apply_record(self, user_id, xp, week_points, language, level, at):
+        self.roll_week(at)
+        member = self.members.get(user_id)
+        if member is not None:
+            self.unplace(user_id, member)
+        week_xp = member[1] if member is not None else 0
+        if week_start(at) == self.week:
+            week_xp += week_points
+        member = self.members[user_id] = [xp, week_xp, language, level]
+        self.place(user_id, member)
+        self.counts['updates'] += 1
+
+    def move(self, user_id, language, level):
+        """The user changed target language or CEFR level."""
+        with self.lock:
+            if self.replay is not None:
+                self.replay.append(('move', user_id, language, level))
+            self.apply_move(user_id, language, level)
+
+    def apply_move(self, user_id, language, level):
+        member = self.members.get(user_id)
+        if member is None or (member[2], member[3]) == (language, level):
+            return
+        self.unplace(user_id, member)
+        member[2], member[3] = language, level
+        self.place(user_id, member)
+        self.counts['moves'] += 1
+
+    def ensure_built(self, wait=True):
+        """Build the boards on first use and start the periodic reconciliation.
+
+        With wait=False the first build runs on the reconcile thread, and the
+        boards read as empty until it finishes.
+        """
+        if self.built_at is not None:
+            return
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name='leaderboard-reconcile', daemon=True)
+                self.thread.start()
+        if wait:
+            with self.build_lock:
+                if self.built_at is None:
+                    self.reconcile()
+
+    def run(self):
+        delay = 0
+        while True:
+            time.sleep(delay)
+            try:
+                with self.build_lock:
+                    if delay or self.built_at is None:
+                        self.reconcile()
+            except Exception:
+                self.counts['failures'] += 1
+                if self.log is not None:
+                    self.log.exception('leaderboard_reconcile_failed')
+            if self.interval <= 0:
+                return
+            delay = self.interval
+
+    def reconcile(self):
+        """Rebuild every board from `load()` and swap it in; returns how many learners had drifted."""
+        start = time.perf_counter()
+        with self.lock:
+            self.replay = []
+        try:
+            users, weekly, now = self.load()
+            members = {user_id: [xp or 0, weekly.get(user_id, 0), language, level] for user_id, xp, language, level in users}
+            grouped = {}
+            for user_id, (xp, week_xp, language, level) in members.items():
+                key, week_key = board_key(xp, user_id), board_key(week_xp, user_id)
+                for scope in scopes(language, level):
+                    grouped.setdefault(('all', scope), []).append(key)
+                    if week_xp > 0:
+                        grouped.setdefault(('week', scope), []).append(week_key)
+            boards = {board: RankedList.from_sorted(sorted(keys)) for board, keys in grouped.items()}
+        except Exception:
+            with self.lock:
+                self.replay = None
+            raise
+        with self.lock:
+            replay, self.replay = self.replay, None
+            changed = {change[1] for change in replay}
+            drift = sum(1 for user_id, member in self.members.items() if user_id not in changed
+                        and user_id in members and members[user_id][0] != member[0]) if self.built_at is not None else 0
+            self.boards, self.members, self.week, self.built_at = boards, members, week_start(now), now
+            # Changes committed after `load` read the database, in the order they were recorded
+            for change in replay:
+                if change[0] == 'record':
+                    self.apply_record(*change[1:])
+                else:
+                    self.apply_move(*change[1:])
+            self.counts['reconciles'] += 1
+            self.counts['drift'] += drift
+        self.last_reconcile_seconds = time.perf_counter() - start
+        return drift
+
+    def rank(self, user_id, window='all', scope='global'):
+        """{'rank', 'xp', 'total'} of the user on a board, or None if they are not on it."""
+        with self.lock:
+            self.roll_week(datetime.utcnow())
+            member = self.members.get(user_id)
+            board = self.boards.get((window, scope))
+            if member is None or board is None:
+                return None
+            xp = member[0] if window == 'all' else member[1]
+            if window == 'week' and xp <= 0:
+                return None
+            return {'rank': board.rank(board_key(xp, user_id)) + 1, 'xp': xp, 'total': len(board)}
+
+    def page(self, window='all', scope='global', offset=0, limit=20):
+        """[(rank, user id, xp), ...] starting at 0-based `offset`, and the board's size."""
+        with self.lock:
+            self.roll_week(datetime.utcnow())
+            board = self.boards.get((window, scope))
+            if board is None:
+                return [], 0
+            entries = map(board_entry, board.slice(offset, limit))
+            return [(offset + i + 1, user_id, xp) for i, (user_id, xp) in enumerate(entries)], len(board)
+
+    def stats(self):
+        with self.lock:
+            sizes = {f'{window}:{scope}': len(board) for (window, scope), board in sorted(self.boards.items())}
+            return dict(self.counts, members=len(self.members), built_at=self.built_at.isoformat() if self.built_at else None,
+                        week=self.week.date().isoformat() if self.week else None,
+                        last_reconcile_seconds=round(self.last_reconcile_seconds, 3), boards=sizes)
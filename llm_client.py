@@ -0,0 +1,148 @@
+import json
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    import httpx
+except ImportError:  # only needed for the ASGI serving path (asgi.py)
+    httpx = None
+
+DEFAULT_REFERER = "https://deutchai.tayba.blog"
+
+
+def upstream_headers(api_key, referer=DEFAULT_REFERER):
+    return {
+        "Authorization": f"Bearer {api_key}",
+        "Content-Type": "application/json",
+        "HTTP-Referer": referer,
+        "X-Title": "DeutschAI",
+    }
+
+
+class UpstreamClient:
+    """Keep-alive HTTP client for the OpenRouter chat completions API.
+
+    One instance is shared by every AI endpoint in a worker process so that
+    TCP/TLS connections to the upstream are pooled and reused across turns.
+    """
+
+    def __init__(self, url, api_key, pool_size=10, connect_timeout=5.0, read_timeout=60.0, pooled=True):
+        self.url = url
+        self.api_key = api_key
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.timeout = (connect_timeout, read_timeout)
+        self.pooled = pooled
+        self.session = None
+        if pooled:
+            self.session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+            self.session.mount('https://', adapter)
+            self.session.mount('http://', adapter)
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(
+            url=config['OPENROUTER_API_URL'],
+            api_key=config['OPENROUTER_API_KEY'],
+            pool_size=config['LLM_POOL_SIZE'],
+            connect_timeout=config['LLM_CONNECT_TIMEOUT'],
+            read_timeout=config['LLM_READ_TIMEOUT'],
+        )
+
+    def headers(self, referer=DEFAULT_REFERER):
+        return upstream_headers(self.api_key, referer)
+
+    def timeout_for(self, remaining):
+        """(connect, read) timeouts clipped to the `remaining` seconds of a deadline."""
+        return (min(self.connect_timeout, remaining), min(self.read_timeout, remaining))
+
+    def post(self, payload, referer=DEFAULT_REFERER, **kwargs):
+        sender = self.session if self.pooled else requests
+        return sender.post(
+            url=self.url,
+            headers=self.headers(referer),
+            data=json.dumps(payload),
+            timeout=kwargs.pop('timeout', self.timeout),
+            **kwargs
+        )
+
+    def chat_completion(self, payload, referer=DEFAULT_REFERER, timeout=None):
+        """POST a chat completion request and return the raw `requests.Response`."""
+        return self.post(payload, referer=referer, timeout=timeout or self.timeout)
+
+    def stream_chat_completion(self, payload, referer=DEFAULT_REFERER, timeout=None):
+        """POST a `stream: true` completion request without reading the body.
+
+        Check `status_code` first, then pass the response to `iter_deltas`.
+        """
+        return self.post(dict(payload, stream=True), referer=referer, stream=True, timeout=timeout or self.timeout)
+
+    def close(self):
+        if self.session is not None:
+            self.session.close()
+
+
+class AsyncUpstreamClient:
+    """`UpstreamClient` counterpart built on `httpx.AsyncClient` for the ASGI path.
+
+    In-flight requests hold a socket and a coroutine rather than a worker thread.
+    """
+
+    def __init__(self, url, api_key, pool_size=100, connect_timeout=5.0, read_timeout=60.0):
+        if httpx is None:
+            raise RuntimeError("AsyncUpstreamClient requires the 'httpx' package")
+        self.url = url
+        self.api_key = api_key
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+        )
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(
+            url=config['OPENROUTER_API_URL'],
+            api_key=config['OPENROUTER_API_KEY'],
+            pool_size=config['LLM_ASYNC_POOL_SIZE'],
+            connect_timeout=config['LLM_CONNECT_TIMEOUT'],
+            read_timeout=config['LLM_READ_TIMEOUT'],
+        )
+
+    def headers(self, referer=DEFAULT_REFERER):
+        return upstream_headers(self.api_key, referer)
+
+    def timeout_for(self, remaining):
+        return httpx.Timeout(min(self.read_timeout, remaining), connect=min(self.connect_timeout, remaining))
+
+    async def chat_completion(self, payload, referer=DEFAULT_REFERER, timeout=None):
+        """POST a chat completion request and return the `httpx.Response`."""
+        kwargs = {} if timeout is None else {'timeout': timeout}
+        return await self.client.post(self.url, headers=self.headers(referer), content=json.dumps(payload), **kwargs)
+
+    async def aclose(self):
+        await self.client.aclose()
+
+
+def iter_deltas(response):
+    """Yield the content deltas of an OpenAI-style server-sent event stream."""
+    response.encoding = response.encoding or 'utf-8'
+    try:
+        for line in response.iter_lines(decode_unicode=True):
+            if not line or not line.startswith('data:'):
+                continue
+            data = line[5:].strip()
+            if data == '[DONE]':
+                break
+            try:
+                chunk = json.loads(data)
+            except ValueError:
+                continue
+            for choice in chunk.get('choices', []):
+                delta = choice.get('delta', {}).get('content')
+                if delta:
+                    yield delta
+    finally:
+        response.close()
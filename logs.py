@@ -0,0 +1,80 @@
+"""Structured, level-controlled and sampled logging.
+
+Each record is one JSON object per line on stderr with its fields at the top
+level, so log shippers can index them without parsing.
+
+    log = get_logger('deutschai.ai')
+    log.debug('ai_request', route='/chat/api', authenticated=True)
+
+LOG_LEVEL sets the threshold (WARNING by default). LOG_SAMPLE_RATE keeps that
+fraction of the DEBUG and INFO records, so per-request lines can stay enabled at
+volume. Warnings and errors are always kept. When a record would be dropped, its
+fields are never formatted.
+"""
+import json
+import logging
+import random
+import sys
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'ts': round(record.created, 3),
+            'level': record.levelname.lower(),
+            'logger': record.name,
+            'event': record.getMessage(),
+        }
+        entry.update(getattr(record, 'fields', None) or {})
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class SampledLogger:
+    """Keyword-argument front end to a `logging.Logger` that samples records below WARNING."""
+
+    def __init__(self, logger, sample_rate=1.0):
+        self.logger = logger
+        self.sample_rate = sample_rate
+
+    def enabled(self, level):
+        if not self.logger.isEnabledFor(level):
+            return False
+        return level >= logging.WARNING or self.sample_rate >= 1 or random.random() < self.sample_rate
+
+    def log(self, level, event, exc_info=None, **fields):
+        if self.enabled(level):
+            self.logger.log(level, event, exc_info=exc_info, extra={'fields': fields})
+
+    def debug(self, event, **fields):
+        self.log(logging.DEBUG, event, **fields)
+
+    def info(self, event, **fields):
+        self.log(logging.INFO, event, **fields)
+
+    def warning(self, event, **fields):
+        self.log(logging.WARNING, event, **fields)
+
+    def error(self, event, **fields):
+        self.log(logging.ERROR, event, **fields)
+
+    def exception(self, event, **fields):
+        self.log(logging.ERROR, event, exc_info=True, **fields)
+
+
+def configure_logging(level='WARNING', stream=None):
+    """Send the 'deutschai' loggers to `stream` (stderr) as JSON lines at `level`."""
+    root = logging.getLogger('deutschai')
+    root.setLevel(level.upper() if isinstance(level, str) else level)
+    if not any(getattr(handler, 'deutschai', False) for handler in root.handlers):
+        handler = logging.StreamHandler(stream or sys.stderr)
+        handler.setFormatter(JsonFormatter())
+        handler.deutschai = True
+        root.addHandler(handler)
+    root.propagate = False
+    return root
+
+
+def get_logger(name, sample_rate=1.0):
+    return SampledLogger(logging.getLogger(name), sample_rate)
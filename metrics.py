@@ -0,0 +1,205 @@
+"""Prometheus-style metrics for the /metrics endpoint.
+
+A small, dependency-free subset of the Prometheus client: labelled counters,
+histograms, and gauges read through a callback at scrape time. `render`
+produces the text exposition format (version 0.0.4), which Prometheus,
+VictoriaMetrics and the Grafana agent all scrape.
+
+Metrics are per worker process, like every other in-process counter here. Scrape each
+worker, or run one worker per metrics port.
+"""
+import bisect
+import math
+import threading
+import time
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+# Key of the per-request RequestStats in the WSGI environ
+ENVIRON_KEY = 'deutschai.request_stats'
+
+HTTP_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+UPSTREAM_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2, 4, 8, 15, 30, 60)
+QUERY_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def format_labels(names, values, extra=()):
+    pairs = [f'{name}="{escape(value)}"' for name, value in zip(names, values)] + list(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def value(self, *labels):
+        return self.values.get(labels, 0)
+
+    def samples(self):
+        with self.lock:
+            items = sorted(self.values.items())
+        suffix = '' if self.name.endswith('_total') else '_total'
+        for labels, value in items:
+            yield f"{self.name}{suffix}{format_labels(self.labels, labels)} {format_value(value)}"
+
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=HTTP_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self.series = {}  # labels -> [bucket counts..., +Inf count, sum]
+        self.lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        i = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.series.get(labels)
+            if series is None:
+                series = self.series[labels] = [0] * (len(self.buckets) + 2)
+            series[i] += 1
+            series[-1] += value
+
+    def count(self, *labels):
+        series = self.series.get(labels)
+        return sum(series[:-1]) if series else 0
+
+    def samples(self):
+        with self.lock:
+            items = sorted((labels, list(series)) for labels, series in self.series.items())
+        for labels, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), series):
+                cumulative += count
+                le = f'le="{format_value(bound)}"'
+                yield f"{self.name}_bucket{format_labels(self.labels, labels, (le,))} {cumulative}"
+            yield f"{self.name}_sum{format_labels(self.labels, labels)} {format_value(series[-1])}"
+            yield f"{self.name}_count{format_labels(self.labels, labels)} {cumulative}"
+
+
+class CallbackGauge:
+    """Gauge (or counter, with kind='counter') whose labelled values come from `read() -> {labels tuple: value}` at scrape time."""
+
+    def __init__(self, name, help, read, labels=(), kind='gauge'):
+        self.name = name
+        self.help = help
+        self.read = read
+        self.labels = tuple(labels)
+        self.kind = kind
+
+    def samples(self):
+        for labels, value in sorted(self.read().items()):
+            yield f"{self.name}{format_labels(self.labels, labels)} {format_value(value)}"
+
+
+class Registry:
+    def __init__(self, prefix='deutschai_'):
+        self.prefix = prefix
+        self.metrics = []
+
+    def add(self, metric):
+        metric.name = self.prefix + metric.name
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, labels=()):
+        return self.add(Counter(name, help, labels))
+
+    def histogram(self, name, help, labels=(), buckets=HTTP_BUCKETS):
+        return self.add(Histogram(name, help, labels, buckets))
+
+    def callback(self, name, help, read, labels=(), kind='gauge'):
+        return self.add(CallbackGauge(name, help, read, labels, kind))
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return '\n'.join(lines) + '\n'
+
+
+class RequestStats:
+    """Start time and database work of one request, kept in its WSGI environ."""
+    __slots__ = ('start', 'queries', 'query_seconds')
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.queries = 0
+        self.query_seconds = 0.0
+
+    def query(self, seconds):
+        self.queries += 1
+        self.query_seconds += seconds
+
+
+class AppMetrics:
+    """The metrics the app records, on one registry."""
+
+    def __init__(self, registry=None):
+        self.registry = registry = registry or Registry()
+        self.requests = registry.counter('http_requests_total', 'HTTP requests by route, method and status.', ('route', 'method', 'status'))
+        self.request_seconds = registry.histogram('http_request_duration_seconds', 'Time to the response headers, by route.', ('route',))
+        self.upstream_requests = registry.counter(
+            'upstream_requests_total', 'Upstream completion attempts (retries and hedges included) by endpoint, model and status.',
+            ('endpoint', 'model', 'status'))
+        self.upstream_seconds = registry.histogram(
+            'upstream_request_duration_seconds', 'Latency of each upstream completion attempt.', ('endpoint', 'model'), UPSTREAM_BUCKETS)
+        self.upstream_tokens = registry.counter(
+            'upstream_tokens_total', 'Tokens reported in the usage of upstream completions.', ('endpoint', 'model', 'kind'))
+        self.db_queries = registry.counter('db_queries_total', 'Database statements executed, by route.', ('route',))
+        self.db_query_seconds = registry.histogram('db_query_duration_seconds', 'Duration of each database statement.', ('route',), QUERY_BUCKETS)
+        self.db_queries_per_request = registry.histogram(
+            'db_queries_per_request', 'Database statements executed by one request.', ('route',), COUNT_BUCKETS)
+
+    def observe_request(self, route, method, status, stats):
+        self.requests.inc(route, method, str(status))
+        if stats is not None:
+            self.request_seconds.observe(time.perf_counter() - stats.start, route)
+            self.db_queries_per_request.observe(stats.queries, route)
+
+    def observe_query(self, route, seconds):
+        self.db_queries.inc(route)
+        self.db_query_seconds.observe(seconds, route)
+
+    def observe_upstream(self, endpoint, model, status, seconds):
+        self.upstream_requests.inc(endpoint, model, str(status))
+        self.upstream_seconds.observe(seconds, endpoint, model)
+
+    def observe_usage(self, endpoint, result_data):
+        """Count the prompt/completion tokens of an OpenRouter completion, if it reports usage."""
+        usage = result_data.get('usage') if isinstance(result_data, dict) else None
+        if not isinstance(usage, dict):
+            return
+        model = result_data.get('model') or 'unknown'
+        for kind in ('prompt', 'completion'):
+            tokens = usage.get(f'{kind}_tokens')
+            if isinstance(tokens, int):
+                self.upstream_tokens.inc(endpoint, model, kind, amount=tokens)
+
+    def render(self):
+        return self.registry.render()
@@ -1,30 +1,131 @@
-import sqlite3
-import os
-
-db_path = r"c:\Users\VICTUS 16\OneDrive\Desktop\detch website\flask deutchAI\instance\deutschai.db"
-
-if not os.path.exists(db_path):
-    # Check if instance folder is not used
-    db_path = r"c:\Users\VICTUS 16\OneDrive\Desktop\detch website\flask deutchAI\deutschai.db"
-
-print(f"Targeting database: {db_path}")
-
-try:
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
-    
-    # Check if column exists
-    cursor.execute("PRAGMA table_info(user)")
-    columns = [row[1] for row in cursor.fetchall()]
-    
-    if 'target_language' not in columns:
-        print("Adding target_language column to user table...")
-        cursor.execute("ALTER TABLE user ADD COLUMN target_language VARCHAR(10) NOT NULL DEFAULT 'de'")
-        conn.commit()
-        print("Column added successfully.")
-    else:
-        print("Column 'target_language' already exists.")
-        
-    conn.close()
-except Exception as e:
-    print(f"Error: {e}")
+"""Bring an existing database up to the current schema.
+
+    python migrate_db.py                 # the app's database (DATABASE_URL or instance/deutschai.db)
+    python migrate_db.py sqlite:///path/to/deutschai.db
+
+The caller passes the app's table metadata and stats rebuild helper in, so
+the migrations never import app.py (which would start a second copy of it
+when app.py is the running script).
+
+Migrations run in order and each one is recorded in the `schema_migrations`
+table, so running the script again is a no-op. Every migration also checks
+the live schema first, which keeps it safe on databases that were patched by
+hand or created with `db.create_all()`.
+"""
+import sys
+from datetime import datetime
+from functools import partial
+
+from sqlalchemy import create_engine, inspect, text
+
+
+def columns(conn, table):
+    return {column['name'] for column in inspect(conn).get_columns(table)}
+
+
+def indexes(conn, table):
+    inspector = inspect(conn)
+    names = {index['name'] for index in inspector.get_indexes(table)}
+    names.update(constraint['name'] for constraint in inspector.get_unique_constraints(table) if constraint['name'])
+    return names
+
+
+def add_column(conn, table, name, ddl):
+    if name not in columns(conn, table):
+        print(f"Adding {name} column to {table} table...")
+        conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {name} {ddl}"))
+
+
+def user_language_and_xp_columns(conn):
+    add_column(conn, 'user', 'target_language', "VARCHAR(10) NOT NULL DEFAULT 'de'")
+    add_column(conn, 'user', 'native_language', "VARCHAR(10) DEFAULT 'en'")
+    add_column(conn, 'user', 'xp', "INTEGER DEFAULT 0")
+
+
+def vocabulary_activity_indexes(conn):
+    if 'uq_vocabulary_user_word_correction' not in indexes(conn, 'vocabulary'):
+        removed = conn.execute(text(
+            "DELETE FROM vocabulary WHERE id NOT IN ("
+            "SELECT MIN(id) FROM vocabulary GROUP BY user_id, word, correction)"
+        )).rowcount
+        print(f"Removed {removed} duplicate vocabulary rows.")
+        conn.execute(text(
+            "CREATE UNIQUE INDEX uq_vocabulary_user_word_correction ON vocabulary (user_id, word, correction)"
+        ))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_vocabulary_user_timestamp ON vocabulary (user_id, timestamp)"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_activity_user_timestamp ON activity (user_id, timestamp)"))
+
+
+def user_stats_tables(conn, metadata, rebuild_user_stats):
+    for name in ('user_stats', 'user_activity_total', 'user_daily_activity'):
+        metadata.tables[name].create(conn, checkfirst=True)
+    print(f"Built stats for {rebuild_user_stats(conn)} users.")
+
+
+def vocabulary_search_index(conn):
+    from vocabulary_search import create_search_index
+    if conn.dialect.name == 'sqlite':
+        print(f"Indexed {create_search_index(conn)} vocabulary rows for search.")
+
+
+def vocabulary_review_columns(conn):
+    if conn.dialect.name == 'sqlite':
+        # The old trigger reindexed a row on any update, including every review grade
+        from vocabulary_search import UPDATE_TRIGGER
+        conn.execute(text("DROP TRIGGER IF EXISTS vocabulary_search_update"))
+        conn.execute(text(UPDATE_TRIGGER))
+    add_column(conn, 'vocabulary', 'ease', "FLOAT NOT NULL DEFAULT 2.5")
+    add_column(conn, 'vocabulary', 'interval_days', "INTEGER NOT NULL DEFAULT 0")
+    add_column(conn, 'vocabulary', 'reps', "INTEGER NOT NULL DEFAULT 0")
+    add_column(conn, 'vocabulary', 'due_at', "TIMESTAMP" if conn.dialect.name == 'postgresql' else "DATETIME")
+    due = conn.execute(text("UPDATE vocabulary SET due_at = COALESCE(timestamp, CURRENT_TIMESTAMP) WHERE due_at IS NULL")).rowcount
+    print(f"Scheduled {due} vocabulary rows for review.")
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_vocabulary_user_due ON vocabulary (user_id, due_at)"))
+
+
+def migrations(metadata, rebuild_user_stats):
+    """(id, function of a connection) for every migration, in order."""
+    return [
+        ('0001_user_language_and_xp_columns', user_language_and_xp_columns),
+        ('0002_vocabulary_activity_indexes', vocabulary_activity_indexes),
+        ('0003_user_stats_tables', partial(user_stats_tables, metadata=metadata, rebuild_user_stats=rebuild_user_stats)),
+        ('0004_vocabulary_search_index', vocabulary_search_index),
+        ('0005_vocabulary_review_columns', vocabulary_review_columns),
+    ]
+
+
+def migrate(database_url, metadata, rebuild_user_stats):
+    """Apply the pending migrations; `metadata` and `rebuild_user_stats` come from app.py."""
+    engine = create_engine(database_url)
+    print(f"Targeting database: {engine.url.render_as_string(hide_password=True)}")
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE IF NOT EXISTS schema_migrations (id VARCHAR(100) PRIMARY KEY, applied_at DATETIME NOT NULL)"
+        ))
+        applied = {row[0] for row in conn.execute(text("SELECT id FROM schema_migrations"))}
+
+    tables = set(inspect(engine).get_table_names())
+    for migration_id, migration in migrations(metadata, rebuild_user_stats):
+        if migration_id in applied:
+            continue
+        with engine.begin() as conn:
+            if {'user', 'vocabulary', 'activity'} <= tables:
+                print(f"Applying {migration_id}...")
+                migration(conn)
+            conn.execute(
+                text("INSERT INTO schema_migrations (id, applied_at) VALUES (:id, :applied_at)"),
+                {'id': migration_id, 'applied_at': datetime.utcnow()}
+            )
+    engine.dispose()
+    print("Database is up to date.")
+
+
+def main():
+    from app import app, db, rebuild_user_stats
+    with app.app_context():
+        database_url = sys.argv[1] if len(sys.argv) > 1 else db.engine.url.render_as_string(hide_password=False)
+    migrate(database_url, db.metadata, rebuild_user_stats)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,165 @@
+"""Pick the upstream model for each AI request.
+
+A routing table maps (endpoint, CEFR level, input length) to a latency SLO
+and a fallback chain of models. Every upstream attempt reports its latency
+and outcome. A model whose EWMA latency breaks the route's SLO, or whose
+EWMA error rate is too high, is demoted to the end of the chain. After
+`cooldown` seconds without traffic its history is forgotten and it gets
+another chance.
+
+`FallbackChain.wrap` adapts a per-model `send` for the resilience layer.
+The resilience layer calls it once per attempt or hedge, so each call walks
+one step further down the chain, and a retry lands on the next model.
+"""
+import asyncio
+import json
+import threading
+import time
+
+DEFAULT_ROUTES = [
+    # Short beginner turns on a voice call: latency matters most
+    {'endpoint': 'call', 'levels': ['A1', 'A2'], 'max_chars': 200, 'slo': 1.5,
+     'models': ['meta-llama/llama-3.1-8b-instruct', 'openai/gpt-4o-mini', 'openai/gpt-3.5-turbo']},
+    {'endpoint': 'call', 'slo': 2.0, 'models': ['openai/gpt-4o-mini', 'openai/gpt-3.5-turbo']},
+    {'endpoint': 'chat', 'levels': ['A1', 'A2'], 'max_chars': 300, 'slo': 3.0,
+     'models': ['meta-llama/llama-3.1-8b-instruct', 'openai/gpt-4o-mini', 'openai/gpt-3.5-turbo']},
+    {'endpoint': 'chat', 'slo': 4.0, 'models': ['openai/gpt-4o-mini', 'openai/gpt-3.5-turbo']},
+    # Full grammar analysis needs reliable JSON mode
+    {'endpoint': 'practice', 'slo': 10.0, 'models': ['openai/gpt-3.5-turbo', 'openai/gpt-4o-mini']},
+]
+
+
+class Route:
+    __slots__ = ('endpoint', 'levels', 'max_chars', 'slo', 'models')
+
+    def __init__(self, endpoint, models, slo, levels=None, max_chars=None):
+        self.endpoint = endpoint
+        self.models = list(models)
+        self.slo = slo
+        self.levels = set(levels) if levels else None
+        self.max_chars = max_chars
+
+    def matches(self, endpoint, level, chars):
+        return (endpoint == self.endpoint
+                and (self.levels is None or level in self.levels)
+                and (self.max_chars is None or chars <= self.max_chars))
+
+
+class ModelStats:
+    """EWMA latency and error rate of one model."""
+
+    def __init__(self, alpha=0.2):
+        self.alpha = alpha
+        self.latency = 0.0
+        self.error_rate = 0.0
+        self.samples = 0
+        self.updated_at = 0.0
+
+    def record(self, seconds, ok, now, cooldown):
+        if now - self.updated_at > cooldown:
+            self.samples = 0  # stale history, start over
+        if self.samples == 0:
+            self.latency, self.error_rate = seconds, 0.0 if ok else 1.0
+        else:
+            self.latency += self.alpha * (seconds - self.latency)
+            self.error_rate += self.alpha * ((0.0 if ok else 1.0) - self.error_rate)
+        self.samples += 1
+        self.updated_at = now
+
+
+class ModelRouter:
+    def __init__(self, routes, min_samples=5, max_error_rate=0.3, cooldown=60.0, alpha=0.2, clock=time.monotonic):
+        self.routes = [Route(**route) for route in routes]
+        self.min_samples = min_samples
+        self.max_error_rate = max_error_rate
+        self.cooldown = cooldown
+        self.alpha = alpha
+        self.clock = clock
+        self.stats = {}
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config):
+        routes = DEFAULT_ROUTES
+        if config['LLM_ROUTES_PATH']:
+            with open(config['LLM_ROUTES_PATH'], encoding='utf-8') as f:
+                routes = json.load(f)
+        return cls(routes, max_error_rate=config['LLM_DEMOTE_ERROR_RATE'], cooldown=config['LLM_DEMOTE_COOLDOWN'])
+
+    def route(self, endpoint, level, chars):
+        for route in self.routes:
+            if route.matches(endpoint, level, chars):
+                return route
+        return None
+
+    def healthy(self, model, slo):
+        with self.lock:
+            stats = self.stats.get(model)
+            if stats is None or stats.samples < self.min_samples or self.clock() - stats.updated_at > self.cooldown:
+                return True
+            return stats.latency <= slo and stats.error_rate <= self.max_error_rate
+
+    def chain(self, route):
+        """The route's models, healthy ones first, each group in table order."""
+        healthy = [model for model in route.models if self.healthy(model, route.slo)]
+        return healthy + [model for model in route.models if model not in healthy]
+
+    def record(self, model, seconds, ok):
+        with self.lock:
+            stats = self.stats.setdefault(model, ModelStats(self.alpha))
+            stats.record(seconds, ok, self.clock(), self.cooldown)
+
+    def fallback(self, route):
+        return FallbackChain(self, self.chain(route))
+
+    def snapshot(self):
+        with self.lock:
+            return {model: {
+                'latency_ms': round(stats.latency * 1000, 1),
+                'error_rate': round(stats.error_rate, 3),
+                'samples': stats.samples,
+            } for model, stats in self.stats.items()}
+
+
+class FallbackChain:
+    """Walks one request's model chain: each attempt (or hedge) takes the next model, staying on the last."""
+
+    def __init__(self, router, models):
+        self.router = router
+        self.models = models
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def next_model(self):
+        with self.lock:
+            model = self.models[min(self.calls, len(self.models) - 1)]
+            self.calls += 1
+            return model
+
+    def wrap(self, send):
+        """Turn `send(model, remaining)` into the `send(remaining)` that call_with_resilience expects."""
+        def send_next(remaining):
+            model, start = self.next_model(), self.router.clock()
+            response = None
+            try:
+                response = send(model, remaining)
+                return response
+            finally:
+                self.router.record(model, self.router.clock() - start, response is not None and response.status_code == 200)
+        return send_next
+
+    def awrap(self, send):
+        """`wrap` for acall_with_resilience, where `send` returns an awaitable."""
+        async def send_next(remaining):
+            model, start = self.next_model(), self.router.clock()
+            response = None
+            try:
+                response = await send(model, remaining)
+                return response
+            except asyncio.CancelledError:
+                start = None  # a hedge that lost the race says nothing about the model
+                raise
+            finally:
+                if start is not None:
+                    self.router.record(model, self.router.clock() - start, response is not None and response.status_code == 200)
+        return send_next
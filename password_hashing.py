@@ -0,0 +1,144 @@
+"""Password hashing off the request thread, with admission control.
+
+A bcrypt hash at the default cost takes a few hundred milliseconds of CPU.
+Done on the request thread, a burst of logins takes every core, and /dashboard
+and the AI endpoints queue behind it. `PasswordHasher` runs hashing on a small
+thread pool instead. bcrypt releases the GIL while it hashes, so threads are
+enough and no extra processes are needed. The pool has three limits:
+
+- at most `workers` hashes run at once, so other requests keep some CPU;
+- on Linux the pool threads run at a lower priority (`nice`), so the
+  scheduler picks request threads first when both are runnable;
+- at most `workers + max_queue` jobs are admitted. Past that, and when a job
+  waits longer than `timeout`, the caller gets `HashingBusy` and answers 503
+  with Retry-After.
+
+`check` also upgrades hashes: when the stored hash was made at a different
+cost than BCRYPT_LOG_ROUNDS, the password is hashed again at the configured
+cost in the same job, and the caller stores the new hash.
+
+With `workers=0` hashing runs on the calling thread, as before, with no limits.
+"""
+import math
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+
+class HashingBusy(Exception):
+    """The hashing pool is saturated; retry after `retry_after` seconds."""
+
+    def __init__(self, retry_after):
+        super().__init__(f"Password hashing is busy, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+def hash_cost(pw_hash):
+    """Log rounds of a bcrypt hash ('$2b$12$...' -> 12), or None if it is not one."""
+    parts = pw_hash.split('$')
+    if len(parts) < 4 or not parts[2].isdigit():
+        return None
+    return int(parts[2])
+
+
+def lower_priority(nice):
+    """Make the calling thread `nice` steps less favoured; per-thread on Linux, ignored elsewhere."""
+    try:
+        tid = threading.get_native_id()
+        os.setpriority(os.PRIO_PROCESS, tid, os.getpriority(os.PRIO_PROCESS, tid) + nice)
+    except (AttributeError, OSError):
+        pass
+
+
+class PasswordHasher:
+    """Runs the hash and check calls of a Flask-Bcrypt instance on a bounded thread pool."""
+
+    def __init__(self, bcrypt, rounds=12, workers=1, max_queue=32, timeout=5.0, nice=5):
+        self.bcrypt = bcrypt
+        self.rounds = rounds
+        self.workers = workers
+        self.max_pending = workers + max_queue
+        self.timeout = timeout
+        self.pool = None
+        if workers:
+            self.pool = ThreadPoolExecutor(workers, thread_name_prefix='password-hash',
+                                           initializer=lower_priority if nice else None,
+                                           initargs=(nice,) if nice else ())
+        self.pending = 0
+        self.counts = {'hashes': 0, 'checks': 0, 'rehashes': 0, 'rejected': 0, 'timeouts': 0}
+        self.seconds = 0.0  # EWMA of one job
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, bcrypt, config):
+        return cls(
+            bcrypt,
+            rounds=config['BCRYPT_LOG_ROUNDS'],
+            workers=config['PASSWORD_HASH_WORKERS'],
+            max_queue=config['PASSWORD_HASH_QUEUE'],
+            timeout=config['PASSWORD_HASH_TIMEOUT'],
+            nice=config['PASSWORD_HASH_NICE'],
+        )
+
+    def needs_rehash(self, pw_hash):
+        return hash_cost(pw_hash) != self.rounds
+
+    def hash(self, password):
+        """bcrypt hash of `password` at the configured cost, as text."""
+        return self.run('hashes', lambda: self.bcrypt.generate_password_hash(password, self.rounds).decode('utf-8'))
+
+    def check(self, pw_hash, password):
+        """(matches, new hash or None); the new hash is set when a matching hash had another cost."""
+        def job():
+            if not self.bcrypt.check_password_hash(pw_hash, password):
+                return False, None
+            if not self.needs_rehash(pw_hash):
+                return True, None
+            with self.lock:
+                self.counts['rehashes'] += 1
+            return True, self.bcrypt.generate_password_hash(password, self.rounds).decode('utf-8')
+        return self.run('checks', job)
+
+    def retry_after(self):
+        backlog = max(1, self.pending - self.workers + 1)
+        return max(1, math.ceil(backlog * (self.seconds or 0.25) / max(1, self.workers)))
+
+    def run(self, kind, function):
+        if self.pool is None:
+            with self.lock:
+                self.counts[kind] += 1
+            return self.timed(function)
+        with self.lock:
+            if self.pending >= self.max_pending:
+                self.counts['rejected'] += 1
+                raise HashingBusy(self.retry_after())
+            self.pending += 1
+            self.counts[kind] += 1
+        future = self.pool.submit(self.timed, function)
+        future.add_done_callback(self.release)
+        try:
+            return future.result(self.timeout)
+        except TimeoutError:
+            future.cancel()  # frees the slot now if the job has not started
+            with self.lock:
+                self.counts['timeouts'] += 1
+            raise HashingBusy(self.retry_after()) from None
+
+    def timed(self, function):
+        start = time.perf_counter()
+        try:
+            return function()
+        finally:
+            seconds = time.perf_counter() - start
+            with self.lock:
+                self.seconds = seconds if not self.seconds else 0.8 * self.seconds + 0.2 * seconds
+
+    def release(self, future):
+        with self.lock:
+            self.pending -= 1
+
+    def stats(self):
+        with self.lock:
+            return dict(self.counts, workers=self.workers, pending=self.pending, max_pending=self.max_pending,
+                        rounds=self.rounds, avg_ms=round(self.seconds * 1000, 1))
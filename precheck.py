@@ -0,0 +1,665 @@
+"""Offline spell and grammar pre-check for /practice/api.
+
+Short practice inputs are checked locally against a lexicon
+(lexicon/<language>.txt) before the LLM is asked. Misspellings are looked up
+in a SymSpell-style deletion index, and a few cheap rules run on top:
+sentence-initial and noun capitalization, German article/noun gender, verb
+agreement right after a subject pronoun, and English a/an.
+
+`PreChecker.check` returns an analysis in the same JSON schema the LLM is
+asked for, or None when the input should go to the LLM. That happens when
+the input is longer than `max_words`, or when a word is not in the lexicon
+and has no single obvious correction. An unknown word that looks like an
+inflection or a compound of known words also escalates, so a small lexicon
+makes the fast path answer less often, not answer wrongly.
+
+The rules cannot tell case or word order, so German input the rules find
+nothing wrong with still escalates if it has an article + noun phrase (whose
+case depends on the verb or preposition) or a clause that does not open with
+its subject: "Ich habe ein Hund." and "Gestern ich bin gegangen." go to the
+LLM rather than scoring 100.
+"""
+import os
+import re
+import threading
+
+LEXICON_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'lexicon')
+LEVELS = ('A1', 'A2', 'B1', 'B2', 'C1', 'C2')
+
+TOKEN = re.compile(r"[^\W\d_]+(?:['’-][^\W\d_]+)*|\d+(?:[.,:]\d+)*|[.!?]+|[,;:]")
+
+# Subject pronoun -> paradigm slots it agrees with (de: ich, du, er, wir, ihr; en: I, you, he, we, they)
+PRONOUN_SLOTS = {
+    'de': {'ich': (0,), 'du': (1,), 'er': (2,), 'es': (2,), 'man': (2,), 'wir': (3,), 'ihr': (4,), 'sie': (2, 3)},
+    'en': {'i': (0,), 'you': (1,), 'he': (2,), 'she': (2,), 'it': (2,), 'we': (3,), 'they': (4,)},
+}
+# Words after which a pronoun still starts a main clause, so the next word is its finite verb
+CLAUSE_WORDS = {
+    'de': {'und', 'aber', 'oder', 'denn', 'sondern'},
+    'en': {'and', 'but', 'or', 'so', 'because', 'when', 'if', 'that'},
+}
+
+CASES = ('nom', 'acc', 'dat', 'gen')
+DER_FORMS = {
+    'nom': {'m': 'der', 'f': 'die', 'n': 'das', 'pl': 'die'},
+    'acc': {'m': 'den', 'f': 'die', 'n': 'das', 'pl': 'die'},
+    'dat': {'m': 'dem', 'f': 'der', 'n': 'dem', 'pl': 'den'},
+    'gen': {'m': 'des', 'f': 'der', 'n': 'des', 'pl': 'der'},
+}
+EIN_ENDINGS = {
+    'nom': {'m': '', 'f': 'e', 'n': '', 'pl': 'e'},
+    'acc': {'m': 'en', 'f': 'e', 'n': '', 'pl': 'e'},
+    'dat': {'m': 'em', 'f': 'er', 'n': 'em', 'pl': 'en'},
+    'gen': {'m': 'es', 'f': 'er', 'n': 'es', 'pl': 'er'},
+}
+EIN_STEMS = ('ein', 'kein', 'mein', 'dein', 'sein', 'unser')
+
+UMLAUTS = (('ae', 'ä'), ('oe', 'ö'), ('ue', 'ü'), ('ss', 'ß'))
+SUFFIXES = {
+    'de': ('test', 'ten', 'tet', 'te', 'est', 'st', 'et', 'en', 'er', 'es', 'em', 'e', 'n', 's', 't'),
+    'en': ('ing', 'est', 'ed', 'er', 'es', 'ly', 'd', 's'),
+}
+CONSONANT_SOUND = ('uni', 'use', 'usu', 'uti', 'eu', 'one', 'once', 'ewe')
+VOWEL_SOUND = ('hour', 'honest', 'honor', 'honour', 'heir')
+
+MESSAGES = {
+    'en': {
+        'spelling': 'Spelling: "{correction}".',
+        'noun': 'German nouns are always capitalized.',
+        'proper': '"{correction}" is always capitalized.',
+        'capital': 'Start the sentence with a capital letter.',
+        'article': '"{noun}" is {gender}: {article} {noun}.',
+        'agreement': 'The verb form must match "{pronoun}".',
+        'a_an': 'Use "an" before a vowel sound and "a" before a consonant sound.',
+        'clean': 'Quick check: no mistakes found.',
+        'found': 'Quick check: {count} mistake(s) found.',
+        'm': 'masculine', 'f': 'feminine', 'n': 'neuter',
+    },
+    'ar': {
+        'spelling': 'خطأ إملائي، الصحيح: "{correction}".',
+        'noun': 'الأسماء في اللغة الألمانية تبدأ دائماً بحرف كبير.',
+        'proper': 'تُكتب "{correction}" دائماً بحرف كبير.',
+        'capital': 'ابدأ الجملة بحرف كبير.',
+        'article': 'كلمة "{noun}" {gender}: {article} {noun}.',
+        'agreement': 'يجب أن يتوافق تصريف الفعل مع الضمير "{pronoun}".',
+        'a_an': 'استخدم "an" قبل الكلمات التي تبدأ بصوت متحرك و"a" قبل الكلمات التي تبدأ بصوت ساكن.',
+        'clean': 'فحص سريع: لم يتم العثور على أخطاء.',
+        'found': 'فحص سريع: تم العثور على {count} من الأخطاء.',
+        'm': 'مذكر', 'f': 'مؤنث', 'n': 'محايد',
+    },
+}
+
+
+def edit_distance(a, b, limit):
+    """Optimal string alignment distance between a and b, or limit + 1 once it exceeds limit."""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    # A typo leaves most of the word alone: only the differing middle needs the DP table
+    start = 0
+    while start < len(a) and start < len(b) and a[start] == b[start]:
+        start += 1
+    end_a, end_b = len(a), len(b)
+    while end_a > start and end_b > start and a[end_a - 1] == b[end_b - 1]:
+        end_a -= 1
+        end_b -= 1
+    a, b = a[start:end_a], b[start:end_b]
+    if not a or not b:
+        return len(a) + len(b)
+    previous2, previous = None, list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        row_min = i
+        for j in range(1, len(b) + 1):
+            value = previous[j - 1] + (a[i - 1] != b[j - 1])
+            if previous[j] + 1 < value:
+                value = previous[j] + 1
+            if current[j - 1] + 1 < value:
+                value = current[j - 1] + 1
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1] and previous2[j - 2] + 1 < value:
+                value = previous2[j - 2] + 1
+            current[j] = value
+            if value < row_min:
+                row_min = value
+        if row_min > limit:
+            return limit + 1
+        previous2, previous = previous, current
+    return previous[-1]
+
+
+def deletes(word, distance):
+    """All strings reachable from word by deleting up to `distance` characters, word included."""
+    found, frontier = {word}, {word}
+    for _ in range(distance):
+        frontier = {w[:i] + w[i + 1:] for w in frontier for i in range(len(w))} - found
+        found |= frontier
+    return found
+
+
+def parse_options(fields):
+    options = {}
+    for field in fields:
+        name, _, value = field.partition('=')
+        options[name] = value.split(',') if ',' in value or name in ('pres', 'forms') else value
+    return options
+
+
+class Lexicon:
+    """Word forms of one language with their CEFR level, plus a deletion index for near-miss lookups.
+
+    `words` maps each lowercase form to (rank, level, spellings); the index maps
+    every form's prefix with up to `max_distance` characters deleted to the ids
+    of the forms it came from.
+    """
+
+    def __init__(self, language, max_distance=2, prefix_length=7):
+        self.language = language
+        self.max_distance = max_distance
+        self.prefix_length = prefix_length
+        self.words = {}
+        self.ids = []
+        self.nouns = {}        # lowercase singular noun form -> genders, e.g. 'm' or 'mn'
+        self.plurals = set()   # lowercase plural noun forms
+        self.adjectives = set()
+        self.paradigms = {}    # verb -> {'pres': [5 forms], 'pret': [5 forms]}
+        self.verb_forms = {}   # lowercase finite form -> [(verb, tense, slot)]
+        self.index = {}
+
+    @classmethod
+    def load(cls, path, language, **options):
+        lexicon = cls(language, **options)
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                fields = line.split()
+                if fields and not fields[0].startswith('#'):
+                    lexicon.add_entry(fields[0], fields[1], fields[2], fields[3:])
+        lexicon.build_index()
+        return lexicon
+
+    def add_word(self, spelling, level):
+        key = spelling.lower()
+        entry = self.words.get(key)
+        if entry is None:
+            self.words[key] = (len(self.ids), level, frozenset([spelling]))
+            self.ids.append(key)
+        else:
+            rank, known_level, spellings = entry
+            self.words[key] = (rank, min(known_level, level, key=LEVELS.index), spellings | {spelling})
+
+    def add_entry(self, kind, word, level, fields):
+        options = parse_options(fields[2:] if kind == 'N' and self.language == 'de' else fields)
+        forms = [word] + list(options.get('forms', []))
+        if kind == 'N':
+            forms += self.noun_forms(word, fields)
+        elif kind == 'V':
+            forms += self.verb_forms_of(word, options)
+        elif kind == 'A':
+            forms += self.adjective_forms(word)
+            self.adjectives.update(form.lower() for form in forms)
+        for form in forms:
+            self.add_word(form, level)
+
+    def noun_forms(self, noun, fields):
+        if self.language == 'en':
+            plural = fields[0] if fields and '=' not in fields[0] else None
+            if plural == '-':
+                return []
+            plural = plural or english_plural(noun)
+            self.nouns[noun.lower()] = 'n'
+            self.plurals.add(plural.lower())
+            return [plural]
+        gender, plural = fields[0], fields[1]
+        key = noun.lower()
+        if gender == 'pl':
+            self.plurals.add(key)
+            return [noun + 'n'] if not noun.endswith(('n', 's')) else []
+        singular = [noun]
+        if 'f' not in gender:
+            singular += [noun + 'es', noun + 's'] if not noun.endswith(('s', 'ß', 'x', 'z')) else [noun + 'es']
+        for form in singular:
+            self.nouns[form.lower()] = gender
+        if plural == '-':
+            return singular[1:]
+        plural = noun if plural == '=' else plural
+        plurals = [plural] + ([plural + 'n'] if not plural.endswith(('n', 's')) else [])
+        self.plurals.update(form.lower() for form in plurals)
+        return singular[1:] + plurals
+
+    def verb_forms_of(self, verb, options):
+        if self.language == 'en':
+            paradigms, others = english_paradigms(verb, options)
+        else:
+            paradigms, others = german_paradigms(verb, options)
+        self.paradigms[verb] = paradigms
+        for tense, forms in paradigms.items():
+            for slot, form in enumerate(forms):
+                uses = self.verb_forms.setdefault(form.lower(), [])
+                if (verb, tense, slot) not in uses:
+                    uses.append((verb, tense, slot))
+        return [form for forms in paradigms.values() for form in forms] + others
+
+    def adjective_forms(self, adjective):
+        if self.language == 'en':
+            return []
+        stems = [adjective[:-1]] if adjective.endswith('e') else [adjective]
+        if adjective.endswith(('el', 'er')) and len(adjective) > 4:
+            stems.append(adjective[:-2] + adjective[-1])
+        return [stem + ending for stem in stems for ending in ('e', 'er', 'es', 'en', 'em')]
+
+    def build_index(self):
+        index = self.index
+        for word_id, word in enumerate(self.ids):
+            for key in deletes(word[:self.prefix_length], self.max_distance):
+                bucket = index.get(key)
+                if bucket is None:
+                    index[key] = word_id
+                elif isinstance(bucket, int):
+                    index[key] = [bucket, word_id]
+                else:
+                    bucket.append(word_id)
+
+    def lookup(self, word, max_distance=None, closest=False):
+        """Lowercase forms within `max_distance` edits of word, as (distance, rank, form), closest first.
+
+        With `closest`, only the forms at the smallest distance found are
+        returned, which lets the search tighten its bound as it goes.
+        """
+        word = word.lower()
+        limit = self.max_distance if max_distance is None else min(max_distance, self.max_distance)
+        if word in self.words:
+            return [(0, self.words[word][0], word)]
+        prefix = word[:self.prefix_length]
+        found = {}
+        # Fewest deletions first: a form at distance d shares a key with word at most d deletions away
+        for key in sorted(deletes(prefix, limit), key=len, reverse=True):
+            if len(prefix) - len(key) > limit:
+                break
+            bucket = self.index.get(key)
+            if bucket is None:
+                continue
+            for word_id in (bucket,) if isinstance(bucket, int) else bucket:
+                candidate = self.ids[word_id]
+                if candidate in found or abs(len(candidate) - len(word)) > limit:
+                    continue
+                distance = found[candidate] = edit_distance(word, candidate, limit)
+                if closest and distance < limit:
+                    limit = distance
+        return sorted((distance, self.words[candidate][0], candidate)
+                      for candidate, distance in found.items() if distance <= limit)
+
+    def plausible(self, word):
+        """Whether an unknown word looks like an inflection or compound of known words, so it is not a typo."""
+        word = word.lower()
+        stems = [word[:-len(suffix)] for suffix in SUFFIXES[self.language]
+                 if word.endswith(suffix) and len(word) - len(suffix) >= 3]
+        if self.language == 'de':
+            if word.startswith('ge'):
+                stems += [word[2:-len(suffix)] for suffix in ('t', 'et', 'en') if word.endswith(suffix)]
+            stems += [stem.replace('ä', 'a').replace('ö', 'o').replace('ü', 'u') for stem in stems]
+            stems += [stem + 'en' for stem in stems] + [stem + 'n' for stem in stems]
+        else:
+            stems += [word[:-3] + 'y' for suffix in ('ies', 'ied') if word.endswith(suffix)]
+            stems += [stem + 'e' for stem in stems]
+        if any(stem in self.words for stem in stems):
+            return True
+        # Compounds such as Hausaufgabe = Haus + Aufgabe, with an optional linking s
+        for i in range(3, len(word) - 2):
+            left, right = word[:i], word[i:]
+            if (left in self.words or left.endswith('s') and left[:-1] in self.words) and \
+                    (right in self.words or self.plausible_part(right)):
+                return True
+        return False
+
+    def plausible_part(self, word):
+        return any(word.endswith(suffix) and word[:-len(suffix)] in self.words for suffix in SUFFIXES[self.language])
+
+    def transliterated(self, word):
+        """The known form of a German word typed with ae/oe/ue/ss for ä/ö/ü/ß, if exactly one exists."""
+        if self.language != 'de':
+            return None
+        variants = {word.lower()}
+        for plain, umlaut in UMLAUTS:
+            variants |= {variant.replace(plain, umlaut) for variant in variants}
+        known = [variant for variant in variants if variant in self.words]
+        return known[0] if len(known) == 1 else None
+
+    def memory_entries(self):
+        return {'forms': len(self.words), 'index_keys': len(self.index)}
+
+
+def english_plural(noun):
+    if noun.endswith(('s', 'x', 'z', 'ch', 'sh')):
+        return noun + 'es'
+    if noun.endswith('y') and noun[-2:-1] not in 'aeiou':
+        return noun[:-1] + 'ies'
+    return noun + 's'
+
+
+def english_paradigms(verb, options):
+    third = options.get('3sg') or english_plural(verb)
+    present = options.get('pres') or [verb, verb, third, verb, verb]
+    past = options.get('pret')
+    if past is None:
+        if verb.endswith('e'):
+            past = verb + 'd'
+        elif verb.endswith('y') and verb[-2:-1] not in 'aeiou':
+            past = verb[:-1] + 'ied'
+        else:
+            past = verb + 'ed'
+    past = past if isinstance(past, list) else [past] * 5
+    if 'ing' in options:
+        ing = options['ing']
+    elif verb.endswith('ie'):
+        ing = verb[:-2] + 'ying'
+    elif verb.endswith('e') and not verb.endswith('ee') and len(verb) > 2:
+        ing = verb[:-1] + 'ing'
+    else:
+        ing = verb + 'ing'
+    return {'pres': present, 'pret': past}, [options.get('pp') or past[0], ing]
+
+
+def german_paradigms(verb, options):
+    stem = verb[:-1] if verb.endswith(('eln', 'ern')) else verb[:-2]
+    e = 'e' if stem.endswith(('t', 'd')) else ''
+    present = options.get('pres') or [
+        stem + 'e',
+        stem + ('t' if stem.endswith(('s', 'ß', 'z', 'x')) else e + 'st'),
+        stem + e + 't',
+        verb,
+        stem + e + 't',
+    ]
+    past = options.get('pret') or stem + e + 'te'
+    if past.endswith('e'):
+        preterite = [past, past + 'st', past, past + 'n', past + 't']
+    else:
+        preterite = [
+            past,
+            past + ('est' if past.endswith(('s', 'ß', 'z')) else 'st'),
+            past,
+            past + 'en',
+            past + ('et' if past.endswith(('t', 'd')) else 't'),
+        ]
+    prefix = '' if verb.endswith('ieren') or verb.startswith(('be', 'ver', 'er', 'ent', 'zer', 'ge', 'emp', 'miss')) else 'ge'
+    participle = options.get('pp') or prefix + stem + e + 't'
+    imperative = [stem] if verb.endswith('en') else []
+    return {'pres': present, 'pret': preterite}, [participle] + imperative
+
+
+def determiner_cases(word):
+    """(case, gender) pairs a German determiner can mark, with a function giving the form for another pair."""
+    word = word.lower()
+    pairs = [(case, gender) for case in CASES for gender, form in DER_FORMS[case].items() if form == word]
+    if pairs:
+        return pairs, lambda case, gender: DER_FORMS[case][gender]
+    for stem in EIN_STEMS:
+        if word.startswith(stem):
+            ending = word[len(stem):]
+            pairs = [(case, gender) for case in CASES for gender, value in EIN_ENDINGS[case].items()
+                     if value == ending and not (stem == 'ein' and gender == 'pl')]
+            if pairs:
+                return pairs, lambda case, gender, stem=stem: stem + EIN_ENDINGS[case][gender]
+    return None, None
+
+
+def match_case(form, like):
+    return form[0].upper() + form[1:] if like[:1].isupper() else form
+
+
+class Token:
+    __slots__ = ('text', 'start', 'end', 'fixed', 'sentence_start', 'clause_start', 'after_comma')
+
+    def __init__(self, match, sentence_start, clause_start, after_comma):
+        self.text = match.group()
+        self.start, self.end = match.span()
+        self.fixed = self.text
+        self.sentence_start = sentence_start
+        self.clause_start = clause_start
+        self.after_comma = after_comma
+
+
+class PreChecker:
+    """Answers short practice inputs from the lexicon, loading each language's lexicon on first use."""
+
+    def __init__(self, lexicon_dir=LEXICON_DIR, max_words=6):
+        self.lexicon_dir = lexicon_dir
+        self.max_words = max_words
+        self.lexicons = {}
+        self.answered = 0
+        self.escalated = 0
+        self.lock = threading.Lock()
+
+    def lexicon(self, language):
+        with self.lock:
+            if language not in self.lexicons:
+                path = os.path.join(self.lexicon_dir, f'{language}.txt')
+                self.lexicons[language] = Lexicon.load(path, language) if os.path.exists(path) else None
+            return self.lexicons[language]
+
+    def check(self, text, language, native_language='en'):
+        """Analysis dict for `text` in the practice JSON schema, or None to ask the LLM."""
+        lexicon = self.lexicon(language) if language in PRONOUN_SLOTS and isinstance(text, str) else None
+        result = self.analyse(lexicon, text, MESSAGES.get(native_language, MESSAGES['en'])) if lexicon else None
+        with self.lock:
+            if result is None:
+                self.escalated += 1
+            else:
+                self.answered += 1
+        return result
+
+    def stats(self):
+        checks = self.answered + self.escalated
+        return {
+            'answered': self.answered,
+            'escalated': self.escalated,
+            'answer_rate': round(self.answered / checks, 4) if checks else 0.0,
+            'lexicons': {language: lexicon.memory_entries() for language, lexicon in self.lexicons.items() if lexicon},
+        }
+
+    def analyse(self, lexicon, text, messages):
+        words = tokenize(text, lexicon.language)
+        if not words or len(words) > self.max_words:
+            return None
+        fixes = []
+        for token in words:
+            reason = self.resolve(lexicon, token)
+            if reason is False:
+                return None
+            if reason:
+                fixes.append((token, token, correction(token.text, token.fixed, reason, messages, correction=token.fixed)))
+        if lexicon.language == 'de':
+            phrases = article_corrections(lexicon, text, words, messages)
+            if phrases is None:
+                return None
+        else:
+            phrases = a_an_corrections(text, words, messages)
+        phrases += agreement_corrections(lexicon, text, words, messages)
+        # A phrase correction already carries the fixes of the words inside it
+        corrections = [fix for token, _, fix in fixes
+                       if not any(first.start <= token.start and token.end <= last.end for first, last, _ in phrases)]
+        corrections += [fix for _, _, fix in phrases]
+        if not corrections and lexicon.language == 'de' and needs_context(lexicon, words):
+            return None
+
+        levels = [lexicon.words[token.fixed.lower()][1] for token in words if token.fixed.lower() in lexicon.words]
+        errors = len(corrections)
+        return {
+            'score': round(100 * max(0, len(words) - errors) / len(words)),
+            'vocab_level': max(levels, key=LEVELS.index) if levels else 'A1',
+            'analysis_summary': messages['found'].format(count=errors) if errors else messages['clean'],
+            'corrections': corrections,
+        }
+
+    def resolve(self, lexicon, token):
+        """Set token.fixed; returns the correction reason, None if the word is fine, or False to escalate."""
+        word = token.text.replace('’', "'")
+        if word[0].isdigit():
+            return None
+        key = word.lower()
+        if key not in lexicon.words and lexicon.language == 'en' and key.endswith("'s") and key[:-2] in lexicon.words:
+            key, word = key[:-2], word[:-2]
+        reason = None
+        if key in lexicon.words:
+            spellings = lexicon.words[key][2]
+            if word not in spellings and all(spelling[0].isupper() for spelling in spellings) and word[0].islower():
+                token.fixed = min(spellings) + token.text[len(word):]
+                reason = 'noun' if lexicon.language == 'de' else 'proper'
+        else:
+            fixed = lexicon.transliterated(key) or self.suggest(lexicon, token, key)
+            if fixed is None:
+                return False
+            spellings = lexicon.words[fixed][2]
+            token.fixed = next((s for s in spellings if s.islower()), min(spellings))
+            reason = 'spelling'
+        if token.sentence_start and token.fixed[0].islower():
+            token.fixed = token.fixed[0].upper() + token.fixed[1:]
+            reason = reason or 'capital'
+        return reason
+
+    def suggest(self, lexicon, token, key):
+        if lexicon.plausible(key):
+            return None
+        max_distance = 0 if len(key) <= 3 else 1 if len(key) <= 5 else 2
+        candidates = lexicon.lookup(key, max_distance, closest=True) if max_distance else []
+        if not candidates:
+            return None
+        best = [form for distance, rank, form in candidates if distance == candidates[0][0]]
+        if token.text[0].isupper() and not token.sentence_start:
+            best = [form for form in best if any(s[0].isupper() for s in lexicon.words[form][2])]
+        return best[0] if len(best) == 1 else None
+
+
+def tokenize(text, language):
+    """Word tokens of text with their sentence and clause position; punctuation only sets positions."""
+    words = []
+    sentence_start = clause_start = True
+    after_comma = False
+    clause_words = CLAUSE_WORDS[language]
+    for match in TOKEN.finditer(text):
+        value = match.group()
+        if value[0] in '.!?':
+            sentence_start = clause_start = True
+            after_comma = False
+        elif value in ',;:':
+            clause_start = after_comma = True
+        else:
+            words.append(Token(match, sentence_start, clause_start, after_comma))
+            sentence_start = after_comma = False
+            clause_start = value.lower() in clause_words
+    return words
+
+
+def correction(original, fixed, reason, messages, **values):
+    return {
+        'original': original,
+        'correction': fixed,
+        'explanation': messages[reason].format(**values),
+        'type': 'grammar' if reason in ('article', 'agreement', 'a_an') else 'spelling',
+    }
+
+
+def span(text, first, last, replacements):
+    """Text from token first to token last, with some tokens replaced: (original, corrected)."""
+    original = text[first.start:last.end]
+    corrected, offset = original, first.start
+    for token, value in sorted(replacements, key=lambda item: -item[0].start):
+        corrected = corrected[:token.start - offset] + value + corrected[token.end - offset:]
+    return original, corrected
+
+
+def phrase_noun(lexicon, words, i):
+    """Index of the noun that the determiner at words[i] introduces, past up to two adjectives, or None."""
+    j = i + 1
+    while j < len(words) and j <= i + 2 and words[j].fixed.lower() in lexicon.adjectives:
+        j += 1
+    if j >= len(words) or not words[j].fixed[:1].isupper():
+        return None
+    noun = words[j].fixed.lower()
+    return j if noun in lexicon.nouns or noun in lexicon.plurals else None
+
+
+def article_corrections(lexicon, text, words, messages):
+    """(first token, last token, correction) for each article that does not fit its noun's gender."""
+    corrections = []
+    for i, determiner in enumerate(words):
+        pairs, form_for = determiner_cases(determiner.fixed)
+        if pairs is None or determiner.after_comma and determiner.fixed.lower() in DER_FORMS['nom'].values():
+            continue  # after a comma, der/die/das is usually a relative pronoun
+        j = phrase_noun(lexicon, words, i)
+        if j is None or words[j].fixed.lower() not in lexicon.nouns:
+            continue
+        noun = words[j].fixed.lower()
+        genders = set(lexicon.nouns[noun]) | ({'pl'} if noun in lexicon.plurals else set())
+        if genders & {gender for case, gender in pairs}:
+            continue
+        gender = lexicon.nouns[noun][0]
+        cases = [case for case, _ in pairs]
+        if determiner.sentence_start and 'nom' in cases:
+            cases = ['nom']  # most likely the subject
+        forms = {form_for(case, gender) for case in cases}
+        if len(forms) > 1:
+            return None  # the right article depends on the case, which needs the LLM
+        fixed = match_case(forms.pop(), determiner.fixed)
+        original, corrected = span(text, determiner, words[j], [(determiner, fixed)] +
+                                   [(token, token.fixed) for token in words[i + 1:j + 1]])
+        fix = correction(original, corrected, 'article', messages, noun=words[j].fixed,
+                         gender=messages[gender], article=DER_FORMS['nom'][gender])
+        corrections.append((determiner, words[j], fix))
+    return corrections
+
+
+def needs_context(lexicon, words):
+    """Whether German words hold a case or word-order question the rules cannot settle."""
+    pronouns = PRONOUN_SLOTS['de']
+    for i, token in enumerate(words):
+        pairs, _ = determiner_cases(token.fixed)
+        if pairs and phrase_noun(lexicon, words, i) is not None:
+            return True  # the article's case depends on the verb or preposition
+        key = token.fixed.lower()
+        if not token.clause_start or key in CLAUSE_WORDS['de']:
+            continue
+        subject = key in pronouns or key in lexicon.nouns or key in lexicon.plurals or \
+            pairs is not None and any(case == 'nom' for case, _ in pairs)
+        if subject:
+            continue
+        clause = [token]
+        for following in words[i + 1:]:
+            if following.clause_start:
+                break
+            clause.append(following)
+        if any(word.fixed.lower() in lexicon.verb_forms and (word.sentence_start or word.fixed[0].islower())
+               for word in clause):
+            return True  # the clause opens with something other than its subject, so the verb must come next
+    return False
+
+
+def agreement_corrections(lexicon, text, words, messages):
+    corrections = []
+    pronouns = PRONOUN_SLOTS[lexicon.language]
+    for pronoun, verb in zip(words, words[1:]):
+        slots = pronouns.get(pronoun.fixed.lower())
+        uses = lexicon.verb_forms.get(verb.fixed.lower())
+        if not (slots and uses and pronoun.clause_start) or any(slot in slots for _, _, slot in uses):
+            continue
+        if lexicon.language == 'de' and verb.text[0].isupper():
+            continue  # a noun, as in "Ihr Essen"
+        if len(slots) > 1 and pronoun.fixed == 'Sie' and not pronoun.sentence_start:
+            slots = slots[::-1]  # formal Sie
+        lemma, tense, _ = uses[0]
+        fixed = match_case(lexicon.paradigms[lemma][tense][slots[0]], verb.fixed)
+        original, corrected = span(text, pronoun, verb, [(pronoun, pronoun.fixed), (verb, fixed)])
+        corrections.append((pronoun, verb, correction(original, corrected, 'agreement', messages, pronoun=pronoun.fixed)))
+    return corrections
+
+
+def a_an_corrections(text, words, messages):
+    corrections = []
+    for article, word in zip(words, words[1:]):
+        if article.fixed.lower() not in ('a', 'an') or not word.fixed[0].isalpha() or word.fixed.isupper():
+            continue
+        following = word.fixed.lower()
+        vowel = following[0] in 'aeiou' and not following.startswith(CONSONANT_SOUND) or following.startswith(VOWEL_SOUND)
+        expected = 'an' if vowel else 'a'
+        if article.fixed.lower() != expected:
+            original, corrected = span(text, article, word, [(article, match_case(expected, article.fixed)),
+                                                             (word, word.fixed)])
+            corrections.append((article, word, correction(original, corrected, 'a_an', messages)))
+    return corrections
@@ -0,0 +1,264 @@
+"""Opt-in per-request profiling, SQL traces and a slowest-endpoints report.
+
+A request is profiled when it carries `X-Profile: <PROFILE_TOKEN>`, or when
+it is picked at random at PROFILE_SAMPLE_RATE. For a profiled request the
+app's before_request hook starts a `RequestProfile`, and its teardown hook
+writes three files to PROFILE_DIR, named after the id returned in the
+`X-Profile-Id` response header:
+
+    <id>.prof       cProfile stats: python -m pstats, snakeviz, gprof2dot
+    <id>.collapsed  sampled stacks in collapsed format: flamegraph.pl, speedscope, inferno
+    <id>.json       summary: time in load_user / inject_user / templates / ORM flush / upstream,
+                    the slowest functions, and the SQL trace with repeated statements flagged
+
+A statement that runs PROFILE_REPEAT_THRESHOLD times or more in one request is
+flagged. It is a 'duplicate' when the parameters are the same every time (the
+result could be reused), and 'n+1' when they differ (a loop issuing one query
+per row).
+
+Every request, profiled or not, feeds `EndpointStats`: latency and query
+counts per route over a sliding window, behind the slowest-endpoints report
+at /debug/profile.
+
+A profile ends at teardown, so it does not include the body of a streamed
+response. Under asgi.py only the prepare phase of an AI request runs with
+before_request hooks, so the upstream await is not part of the profile either.
+"""
+import cProfile
+import hmac
+import json
+import os
+import pstats
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, deque
+
+# Key of the active RequestProfile in the WSGI environ
+PROFILE_KEY = 'deutschai.profile'
+PROFILE_HEADER = 'X-Profile'
+# Named phases of a request: (path suffix of the module, function name)
+PHASES = {
+    'load_user': (('app.py', 'load_user'),),
+    'inject_user': (('app.py', 'inject_user'),),
+    'render_template': (('flask/templating.py', 'render_template'),),
+    'orm_flush': (('sqlalchemy/orm/session.py', 'flush'),),
+    'commit': (('sqlalchemy/orm/session.py', 'commit'),),
+    'upstream': (('app.py', 'upstream_call'),),
+}
+TOP_FUNCTIONS = 15
+STATEMENT_CHARS = 500
+
+
+def frame_label(code):
+    return f"{code.co_name} ({short_path(code.co_filename)}:{code.co_firstlineno})"
+
+
+def short_path(path):
+    """Path relative to site-packages or the working directory, to keep stacks readable."""
+    marker = 'site-packages' + os.sep
+    if marker in path:
+        return path.split(marker, 1)[1]
+    cwd = os.getcwd() + os.sep
+    return path[len(cwd):] if path.startswith(cwd) else path
+
+
+class StackSampler(threading.Thread):
+    """Samples one thread's Python stack every `interval` seconds into collapsed-stack counts."""
+
+    def __init__(self, thread_id, interval):
+        super().__init__(name='request-profiler', daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(frame_label(frame.f_code))
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+    def collapsed(self):
+        return ''.join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+def repeated_queries(queries, threshold):
+    """Statements run at least `threshold` times, most expensive first."""
+    by_statement = {}
+    for statement, parameters, seconds in queries:
+        entry = by_statement.setdefault(statement, {'count': 0, 'parameters': set(), 'seconds': 0.0})
+        entry['count'] += 1
+        entry['parameters'].add(repr(parameters))
+        entry['seconds'] += seconds
+    repeated = [{
+        'statement': statement[:STATEMENT_CHARS],
+        'count': entry['count'],
+        'distinct_parameters': len(entry['parameters']),
+        'kind': 'duplicate' if len(entry['parameters']) == 1 else 'n+1',
+        'total_ms': round(entry['seconds'] * 1000, 2),
+    } for statement, entry in by_statement.items() if entry['count'] >= threshold]
+    return sorted(repeated, key=lambda entry: entry['total_ms'], reverse=True)
+
+
+class RequestProfile:
+    """cProfile, a stack sampler and a SQL trace for one request on the current thread."""
+
+    def __init__(self, method, path, interval):
+        self.id = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        self.method = method
+        self.path = path
+        self.status = None
+        self.queries = []
+        self.start = time.perf_counter()
+        self.profiler = cProfile.Profile()
+        try:
+            self.profiler.enable()
+        except ValueError:  # another profiler is already active on this thread
+            self.profiler = None
+        self.sampler = StackSampler(threading.get_ident(), interval)
+        self.sampler.start()
+
+    def query(self, statement, parameters, seconds):
+        self.queries.append((statement, parameters, seconds))
+
+    def stop(self):
+        if self.profiler is not None:
+            self.profiler.disable()
+        self.sampler.stop()
+        self.seconds = time.perf_counter() - self.start
+
+    def phases(self, stats):
+        """Cumulative milliseconds spent in each of PHASES."""
+        totals = dict.fromkeys(PHASES, 0.0)
+        for (filename, _, function), (_, _, _, cumulative, _) in stats.items():
+            path = filename.replace(os.sep, '/')
+            for phase, functions in PHASES.items():
+                if any(function == name and path.endswith(suffix) for suffix, name in functions):
+                    totals[phase] += cumulative
+        return {phase: round(seconds * 1000, 2) for phase, seconds in totals.items()}
+
+    def summary(self, route, repeat_threshold):
+        stats = pstats.Stats(self.profiler).stats if self.profiler is not None else {}
+        top = sorted(stats.items(), key=lambda item: item[1][2], reverse=True)[:TOP_FUNCTIONS]
+        return {
+            'id': self.id,
+            'method': self.method,
+            'path': self.path,
+            'route': route,
+            'status': self.status,
+            'duration_ms': round(self.seconds * 1000, 2),
+            'phases_ms': self.phases(stats),
+            'top_functions': [{
+                'function': f"{function} ({short_path(filename)}:{line})",
+                'calls': calls,
+                'self_ms': round(own * 1000, 2),
+                'cumulative_ms': round(cumulative * 1000, 2),
+            } for (filename, line, function), (_, calls, own, cumulative, _) in top],
+            'samples': sum(self.sampler.stacks.values()),
+            'queries': len(self.queries),
+            'query_ms': round(sum(seconds for _, _, seconds in self.queries) * 1000, 2),
+            'repeated_queries': repeated_queries(self.queries, repeat_threshold),
+            'sql_trace': [{'statement': statement[:STATEMENT_CHARS], 'ms': round(seconds * 1000, 3)}
+                          for statement, _, seconds in self.queries],
+        }
+
+
+class EndpointStats:
+    """Latency and database work per route over the last `window` requests of each."""
+
+    def __init__(self, window=500):
+        self.window = window
+        self.routes = {}
+        self.lock = threading.Lock()
+
+    def observe(self, route, seconds, queries, query_seconds):
+        with self.lock:
+            entry = self.routes.get(route)
+            if entry is None:
+                entry = self.routes[route] = {'count': 0, 'recent': deque(maxlen=self.window)}
+            entry['count'] += 1
+            entry['recent'].append((seconds, queries, query_seconds))
+
+    def slowest(self, limit=10):
+        """Routes by p95 latency over their window, slowest first."""
+        with self.lock:
+            items = [(route, entry['count'], list(entry['recent'])) for route, entry in self.routes.items()]
+        report = []
+        for route, count, recent in items:
+            latencies = sorted(seconds for seconds, _, _ in recent)
+            n = len(latencies)
+            report.append({
+                'route': route,
+                'requests': count,
+                'p50_ms': round(latencies[n // 2] * 1000, 2),
+                'p95_ms': round(latencies[min(n - 1, int(n * 0.95))] * 1000, 2),
+                'max_ms': round(latencies[-1] * 1000, 2),
+                'queries_per_request': round(sum(queries for _, queries, _ in recent) / n, 2),
+                'db_ms_per_request': round(sum(db for _, _, db in recent) / n * 1000, 2),
+            })
+        return sorted(report, key=lambda entry: entry['p95_ms'], reverse=True)[:limit]
+
+
+class Profiler:
+    def __init__(self, directory, token='', sample_rate=0.0, interval=0.005, repeat_threshold=3, keep=50):
+        self.directory = directory
+        self.token = token
+        self.sample_rate = sample_rate
+        self.interval = interval
+        self.repeat_threshold = repeat_threshold
+        self.recent = deque(maxlen=keep)
+        self.endpoints = EndpointStats()
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(
+            config['PROFILE_DIR'],
+            token=config['PROFILE_TOKEN'],
+            sample_rate=config['PROFILE_SAMPLE_RATE'],
+            interval=config['PROFILE_INTERVAL_MS'] / 1000,
+            repeat_threshold=config['PROFILE_REPEAT_THRESHOLD'],
+        )
+
+    def authorized(self, header):
+        return bool(self.token and header) and hmac.compare_digest(header.encode(), self.token.encode())
+
+    def wants(self, header):
+        """Whether to profile a request carrying this X-Profile header value (or None)."""
+        return self.authorized(header) or (self.sample_rate > 0 and random.random() < self.sample_rate)
+
+    def start(self, method, path):
+        return RequestProfile(method, path, self.interval)
+
+    def finish(self, profile, route):
+        """Stop `profile`, write its files and keep its summary for the report."""
+        profile.stop()
+        summary = profile.summary(route, self.repeat_threshold)
+        os.makedirs(self.directory, exist_ok=True)
+        base = os.path.join(self.directory, profile.id)
+        if profile.profiler is not None:
+            profile.profiler.dump_stats(base + '.prof')
+        with open(base + '.collapsed', 'w') as f:
+            f.write(profile.sampler.collapsed())
+        with open(base + '.json', 'w') as f:
+            json.dump(summary, f, ensure_ascii=False, indent=1)
+        self.recent.append({key: summary[key] for key in (
+            'id', 'method', 'path', 'status', 'duration_ms', 'phases_ms', 'queries', 'query_ms', 'repeated_queries')})
+        return summary
+
+    def report(self, limit=10):
+        return {
+            'slowest_endpoints': self.endpoints.slowest(limit),
+            'recent_profiles': list(reversed(self.recent)),
+            'directory': self.directory,
+        }
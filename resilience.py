@@ -0,0 +1,338 @@
+"""Deadlines, retries, hedging and a circuit breaker for upstream LLM calls.
+
+`call_with_resilience` (requests, WSGI path) and `acall_with_resilience`
+(httpx, ASGI path) wrap a `send(remaining_seconds)` callable that performs a
+single upstream attempt:
+
+- Each endpoint has an overall deadline; every attempt's read timeout is
+  clipped to the time remaining.
+- 429/5xx responses and connection errors are retried with full-jitter
+  exponential backoff, or after the upstream's Retry-After when it sends one,
+  as long as the wait still fits in the deadline.
+- With hedging on, a duplicate request is sent once the first has been
+  outstanding for the endpoint's recent p95 latency; the first usable answer
+  wins.
+- Consecutive failed calls open a per-endpoint circuit breaker, which then
+  fails fast with `CircuitOpenError` until a trial call succeeds.
+"""
+import asyncio
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from email.utils import parsedate_to_datetime
+
+import requests
+
+try:
+    import httpx
+except ImportError:  # only needed for the ASGI serving path (asgi.py)
+    httpx = None
+
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+
+class CircuitOpenError(Exception):
+    def __init__(self, endpoint, retry_after):
+        super().__init__(f"Circuit for {endpoint} is open; retry in {retry_after:.0f}s")
+        self.endpoint = endpoint
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """Opens after `failure_threshold` consecutive failures, then lets one trial call through every `reset_timeout`."""
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.failures = 0
+        self.opened_at = None
+        self.trial = False
+        self.lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        return 'half-open' if self.trial or self.retry_after() == 0 else 'open'
+
+    def allow(self):
+        with self.lock:
+            if self.opened_at is None:
+                return True
+            if not self.trial and self.clock() - self.opened_at >= self.reset_timeout:
+                self.trial = True
+                return True
+            return False
+
+    def retry_after(self):
+        if self.opened_at is None:
+            return 0
+        return max(0.0, self.opened_at + self.reset_timeout - self.clock())
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.trial or self.failures >= self.failure_threshold:
+                self.opened_at = self.clock()
+                self.trial = False
+
+
+class LatencyTracker:
+    """Sliding window of successful call latencies."""
+
+    def __init__(self, window=200):
+        self.samples = deque(maxlen=window)
+        self.lock = threading.Lock()
+
+    def record(self, seconds):
+        with self.lock:
+            self.samples.append(seconds)
+
+    def quantile(self, q, min_samples=1):
+        with self.lock:
+            if len(self.samples) < min_samples:
+                return None
+            ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def parse_retry_after(value):
+    """Seconds to wait from a Retry-After header (delta-seconds or HTTP-date), or None."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class ResiliencePolicy:
+    """Per-endpoint deadlines, retry/hedge settings, breakers and latency windows."""
+
+    def __init__(self, deadlines, max_attempts=3, base_delay=0.25, max_delay=4.0, hedge=False,
+                 hedge_quantile=0.95, hedge_min_samples=20, breaker_failures=5, breaker_reset=30.0, hedge_workers=32):
+        self.deadlines = deadlines
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.hedge = hedge
+        self.hedge_quantile = hedge_quantile
+        self.hedge_min_samples = hedge_min_samples
+        self.breaker_failures = breaker_failures
+        self.breaker_reset = breaker_reset
+        self.hedge_workers = hedge_workers
+        self.breakers = {}
+        self.latencies = {}
+        self.executor = None
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(
+            deadlines=config['LLM_DEADLINES'],
+            max_attempts=config['LLM_MAX_ATTEMPTS'],
+            base_delay=config['LLM_RETRY_BASE_DELAY'],
+            max_delay=config['LLM_RETRY_MAX_DELAY'],
+            hedge=config['LLM_HEDGE'],
+            hedge_quantile=config['LLM_HEDGE_QUANTILE'],
+            breaker_failures=config['LLM_BREAKER_FAILURES'],
+            breaker_reset=config['LLM_BREAKER_RESET'],
+        )
+
+    def breaker(self, endpoint):
+        with self.lock:
+            if endpoint not in self.breakers:
+                self.breakers[endpoint] = CircuitBreaker(self.breaker_failures, self.breaker_reset)
+            return self.breakers[endpoint]
+
+    def latency(self, endpoint):
+        with self.lock:
+            if endpoint not in self.latencies:
+                self.latencies[endpoint] = LatencyTracker()
+            return self.latencies[endpoint]
+
+    def hedge_delay(self, endpoint):
+        """Seconds to wait before sending a duplicate request, or None to not hedge."""
+        if not self.hedge:
+            return None
+        return self.latency(endpoint).quantile(self.hedge_quantile, self.hedge_min_samples)
+
+    def backoff(self, attempt, retry_after=None):
+        if retry_after is not None:
+            return retry_after
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def hedge_executor(self):
+        with self.lock:
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(self.hedge_workers, thread_name_prefix='llm-hedge')
+            return self.executor
+
+    def stats(self):
+        return {endpoint: {
+            'circuit': breaker.state,
+            'consecutive_failures': breaker.failures,
+            'p95_ms': round((self.latency(endpoint).quantile(0.95) or 0) * 1000, 1),
+        } for endpoint, breaker in list(self.breakers.items())}
+
+
+def close_quietly(response):
+    try:
+        response.close()
+    except Exception:
+        pass
+
+
+def call_with_resilience(policy, endpoint, send, hedge=True):
+    """Run `send(remaining_seconds) -> requests.Response` under `policy`.
+
+    Returns the first non-retryable response, or the last retryable one once
+    attempts or time run out. Raises `CircuitOpenError`, or the last
+    `requests` exception when no attempt produced a response.
+    """
+    breaker = policy.breaker(endpoint)
+    if not breaker.allow():
+        raise CircuitOpenError(endpoint, breaker.retry_after())
+    deadline = time.monotonic() + policy.deadlines[endpoint]
+    response = error = None
+    for attempt in range(policy.max_attempts):
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        start = time.monotonic()
+        hedge_delay = policy.hedge_delay(endpoint) if hedge else None
+        if hedge_delay is not None and hedge_delay < remaining:
+            response, error = hedged_send(policy.hedge_executor(), send, remaining, hedge_delay)
+        else:
+            try:
+                response, error = send(remaining), None
+            except requests.exceptions.RequestException as e:
+                response, error = None, e
+        if response is not None and response.status_code not in RETRYABLE_STATUS:
+            if response.status_code == 200:
+                policy.latency(endpoint).record(time.monotonic() - start)
+            # Other 4xx errors are about the request, not upstream health
+            breaker.record_success()
+            return response
+        retry_after = parse_retry_after(response.headers.get('Retry-After')) if response is not None else None
+        delay = policy.backoff(attempt, retry_after)
+        if attempt + 1 == policy.max_attempts or time.monotonic() + delay >= deadline:
+            break
+        if response is not None:
+            response.close()
+        time.sleep(delay)
+    breaker.record_failure()
+    if response is not None:
+        return response
+    raise error or requests.exceptions.Timeout(f"{endpoint} deadline exceeded")
+
+
+def hedged_send(executor, send, remaining, hedge_delay):
+    """Send, then send a duplicate after `hedge_delay`; returns (response, error) of the first usable answer."""
+    deadline = time.monotonic() + remaining
+    pending = {executor.submit(send, remaining)}
+    done, _ = wait(pending, timeout=hedge_delay)
+    if not done:
+        pending.add(executor.submit(send, remaining - hedge_delay))
+    response = error = None
+    while pending:
+        done, pending = wait(pending, timeout=max(0, deadline - time.monotonic()), return_when=FIRST_COMPLETED)
+        if not done:
+            break
+        for future in done:
+            try:
+                result = future.result()
+            except requests.exceptions.RequestException as e:
+                error = e
+                continue
+            if response is not None:
+                close_quietly(response)
+            response = result
+        if response is not None and (response.status_code not in RETRYABLE_STATUS or not pending):
+            break
+    for future in pending:
+        future.add_done_callback(lambda f: f.exception() is None and close_quietly(f.result()))
+    if response is None and error is None:
+        error = requests.exceptions.Timeout("deadline exceeded while hedging")
+    return response, (None if response is not None else error)
+
+
+async def acall_with_resilience(policy, endpoint, send, hedge=True):
+    """`call_with_resilience` for the ASGI path: `send(remaining_seconds)` returns an awaitable `httpx.Response`."""
+    breaker = policy.breaker(endpoint)
+    if not breaker.allow():
+        raise CircuitOpenError(endpoint, breaker.retry_after())
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + policy.deadlines[endpoint]
+    response = error = None
+    for attempt in range(policy.max_attempts):
+        remaining = deadline - loop.time()
+        if remaining <= 0:
+            break
+        start = loop.time()
+        hedge_delay = policy.hedge_delay(endpoint) if hedge else None
+        try:
+            if hedge_delay is not None and hedge_delay < remaining:
+                response, error = await ahedged_send(send, remaining, hedge_delay), None
+            else:
+                response, error = await asyncio.wait_for(send(remaining), remaining), None
+        except (httpx.HTTPError, asyncio.TimeoutError) as e:
+            response, error = None, e
+        if response is not None and response.status_code not in RETRYABLE_STATUS:
+            if response.status_code == 200:
+                policy.latency(endpoint).record(loop.time() - start)
+            breaker.record_success()
+            return response
+        retry_after = parse_retry_after(response.headers.get('Retry-After')) if response is not None else None
+        delay = policy.backoff(attempt, retry_after)
+        if attempt + 1 == policy.max_attempts or loop.time() + delay >= deadline:
+            break
+        await asyncio.sleep(delay)
+    breaker.record_failure()
+    if response is not None:
+        return response
+    if isinstance(error, httpx.HTTPError):
+        raise error
+    raise httpx.TimeoutException(f"{endpoint} deadline exceeded")
+
+
+async def ahedged_send(send, remaining, hedge_delay):
+    """Async `hedged_send`: the losing request is cancelled rather than left to finish."""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + remaining
+    pending = {asyncio.ensure_future(send(remaining))}
+    done, _ = await asyncio.wait(pending, timeout=hedge_delay)
+    if not done:
+        pending.add(asyncio.ensure_future(send(remaining - hedge_delay)))
+    response = error = None
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, timeout=max(0, deadline - loop.time()), return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                break
+            for task in done:
+                if task.exception() is not None:
+                    error = task.exception()
+                    continue
+                response = task.result()
+            if response is not None and (response.status_code not in RETRYABLE_STATUS or not pending):
+                return response
+    finally:
+        for task in pending:
+            task.cancel()
+    if response is not None:
+        return response
+    raise error or httpx.TimeoutException("deadline exceeded while hedging")
@@ -0,0 +1,170 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+
+def normalize_text(text):
+    """Canonical form of learner input for cache keys.
+
+    Only Unicode normalization and whitespace are folded: case and punctuation
+    are exactly what a grammar check is about, so they stay significant.
+    """
+    return ' '.join(unicodedata.normalize('NFC', text).split())
+
+
+def cache_key(*parts):
+    return hashlib.sha256(json.dumps(parts, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+class MemoryBackend:
+    """In-process LRU dictionary with per-entry expiry."""
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at < time.time():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self.lock:
+            self.entries[key] = (value, time.time() + ttl)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class SQLiteBackend:
+    """LRU cache in a SQLite file, shared by every worker process on the host."""
+
+    def __init__(self, path, max_entries=10000):
+        self.path = path
+        self.max_entries = max_entries
+        self.local = threading.local()
+        with self.connection() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS response_cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL, last_used REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_response_cache_last_used ON response_cache (last_used)")
+
+    def connection(self):
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self.local.conn = conn
+        return conn
+
+    def get(self, key):
+        now = time.time()
+        conn = self.connection()
+        row = conn.execute("SELECT value, expires_at FROM response_cache WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        with conn:
+            if row[1] < now:
+                conn.execute("DELETE FROM response_cache WHERE key = ?", (key,))
+                return None
+            conn.execute("UPDATE response_cache SET last_used = ? WHERE key = ?", (now, key))
+        return json.loads(row[0])
+
+    def set(self, key, value, ttl):
+        now = time.time()
+        with self.connection() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO response_cache (key, value, expires_at, last_used) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value), now + ttl, now),
+            )
+            conn.execute(
+                "DELETE FROM response_cache WHERE key IN ("
+                "SELECT key FROM response_cache ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+
+    def delete(self, key):
+        with self.connection() as conn:
+            conn.execute("DELETE FROM response_cache WHERE key = ?", (key,))
+
+    def __len__(self):
+        return self.connection().execute("SELECT COUNT(*) FROM response_cache").fetchone()[0]
+
+
+def create_backend(backend, max_entries, path=None, kind='cache'):
+    """Storage for a `*_BACKEND` config value: 'memory' (per worker) or 'sqlite' (shared file)."""
+    if backend == 'sqlite':
+        return SQLiteBackend(path, max_entries)
+    if backend == 'memory':
+        return MemoryBackend(max_entries)
+    raise ValueError(f"Unknown {kind} backend: {backend}")
+
+
+class CountingCache:
+    """A backend with a TTL and hit/miss counters, reported by `stats()`."""
+
+    def __init__(self, backend, ttl):
+        self.backend = backend
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def lookup(self, key):
+        value = self.backend.get(key)
+        with self.lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'backend': type(self.backend).__name__,
+            'entries': len(self.backend),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+class ResponseCache(CountingCache):
+    """TTL/LRU cache of upstream responses with hit/miss counters."""
+
+    def __init__(self, backend, ttl=86400):
+        super().__init__(backend, ttl)
+
+    def get(self, key):
+        return self.lookup(key)
+
+    def set(self, key, value):
+        self.backend.set(key, value, self.ttl)
+
+
+def create_cache(backend, ttl, max_entries, path=None):
+    """Build a `ResponseCache` from config values; returns None when backend is 'none'."""
+    if backend == 'none':
+        return None
+    return ResponseCache(create_backend(backend, max_entries, path), ttl)
@@ -0,0 +1,102 @@
+"""Request coalescing for identical in-flight upstream calls.
+
+In a classroom many learners submit the same exercise sentence to
+/practice/api within a few seconds, and clients that retry eagerly
+double-submit to /chat/api. While one upstream call for a request body is in
+flight, identical requests wait for it and share its result, instead of each
+making its own call. Only the upstream call is shared: every request still
+stores its own result and logs its own XP.
+
+Keys are the canonical JSON of the upstream request (see `request_key`), so
+two requests coalesce only when the model would see exactly the same input.
+Streaming responses are never shared.
+"""
+import asyncio
+import hashlib
+import json
+import threading
+
+
+def request_key(endpoint, payload, models=None):
+    """Key of an upstream request: endpoint, payload with sorted keys, and the model chain if routed."""
+    canonical = json.dumps([endpoint, payload, list(models or ())], sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+class Flight:
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Runs at most one call per key at a time; callers arriving meanwhile get the same result or exception.
+
+    `do` serves worker threads and `ado` coroutines on the ASGI event loop; the
+    two keep separate in-flight tables, so a sync and an async request never
+    share a call.
+    """
+
+    def __init__(self):
+        self.flights = {}
+        self.tasks = {}
+        self.leaders = 0
+        self.coalesced = 0
+        self.lock = threading.Lock()
+
+    def do(self, key, function):
+        with self.lock:
+            flight = self.flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self.flights[key] = Flight()
+                self.leaders += 1
+            else:
+                self.coalesced += 1
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+        try:
+            flight.result = function()
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.flights[key]
+            flight.done.set()
+        return flight.result
+
+    async def ado(self, key, function):
+        """`do` for a coroutine function; the shared call runs as its own task, so one caller going away does not cancel it for the rest."""
+        with self.lock:
+            task = self.tasks.get(key)
+            if task is None:
+                task = self.tasks[key] = asyncio.ensure_future(function())
+                task.add_done_callback(lambda done: self.forget(key, done))
+                self.leaders += 1
+            else:
+                self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def forget(self, key, task):
+        with self.lock:
+            if self.tasks.get(key) is task:
+                del self.tasks[key]
+        if not task.cancelled():
+            task.exception()  # retrieved, so an unawaited failure is not logged as "never retrieved"
+
+    def stats(self):
+        with self.lock:
+            calls = self.leaders + self.coalesced
+            return {
+                'in_flight': len(self.flights) + len(self.tasks),
+                'upstream_calls': self.leaders,
+                'coalesced': self.coalesced,
+                'coalesced_rate': round(self.coalesced / calls, 3) if calls else 0.0,
+            }
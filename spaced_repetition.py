@@ -0,0 +1,36 @@
+"""SM-2 scheduling for reviewing saved vocabulary.
+
+Every vocabulary item carries its review state: an ease factor, the current
+interval in days, the number of successful reviews in a row, and the time it
+is next due. New items are due right away. A review is graded from 0 (no
+idea) to 5 (perfect recall):
+
+    grade >= 3  the interval grows: 1 day, 6 days, then interval * ease
+    grade < 3   the item starts over with a 1 day interval
+
+The ease then moves up or down with the grade, never below MIN_EASE, so items
+the learner keeps getting wrong come back more often.
+"""
+from datetime import timedelta
+
+START_EASE = 2.5
+MIN_EASE = 1.3
+PASSING_GRADE = 3
+MAX_GRADE = 5
+
+
+def schedule(ease, interval_days, reps, grade, now):
+    """The state after a review graded `grade` at `now`: (ease, interval_days, reps, due_at)."""
+    if grade >= PASSING_GRADE:
+        interval_days = 1 if reps == 0 else 6 if reps == 1 else max(1, round(interval_days * ease))
+        reps += 1
+    else:
+        interval_days, reps = 1, 0
+    miss = MAX_GRADE - grade
+    ease = max(MIN_EASE, round(ease + 0.1 - miss * (0.08 + miss * 0.02), 4))
+    return ease, interval_days, reps, now + timedelta(days=interval_days)
+
+
+def review_points(grades):
+    """XP for a batch of reviews: one point per item, two when it was recalled."""
+    return sum(2 if grade >= PASSING_GRADE else 1 for grade in grades)
@@ -0,0 +1,101 @@
+"""Speculative /call/api completions started from interim speech transcripts.
+
+SpeechRecognition delivers its final result only after the learner has been
+silent for a while. The call page therefore posts each interim transcript
+that has stayed unchanged for a short time to /call/api/interim, and the
+server starts the completion for it right away. When the final utterance
+arrives and would send the model exactly the same request, the reply is
+taken from the speculation, which by then is finished or partly done.
+Otherwise the speculation is dropped and the turn runs as usual.
+
+A session has at most one speculation at a time: a newer interim text
+replaces the older one, and at most `max_per_turn` are started between two
+final utterances. A speculation dropped before its upstream call began costs
+nothing. One dropped after that is counted as wasted, because an upstream
+call cannot be taken back once it is sent. Speculations never touch the
+conversation history or XP. Only the final utterance is recorded and
+awarded, like any other turn.
+
+Speculations live in the memory of one worker. A final utterance served by
+another worker misses and runs as usual.
+"""
+import threading
+import time
+
+
+class Speculation:
+    __slots__ = ('key', 'future', 'started')
+
+    def __init__(self, key, future):
+        self.key = key
+        self.future = future
+        self.started = time.monotonic()
+
+
+class SpeculationStore:
+    """The in-flight speculation of each call session, keyed by (user id, session id)."""
+
+    def __init__(self, ttl=30, max_per_turn=3):
+        self.ttl = ttl
+        self.max_per_turn = max_per_turn
+        self.entries = {}
+        self.turns = {}  # owner -> speculations started since the last final utterance
+        self.counts = {'started': 0, 'hits': 0, 'misses': 0, 'replaced': 0, 'expired': 0, 'limited': 0, 'wasted': 0}
+        self.lock = threading.Lock()
+
+    def start(self, owner, key, submit):
+        """Speculate on the request `key` for `owner`; `submit()` starts the call and returns its future.
+
+        Returns 'started', 'running' when the same request is already in flight,
+        or 'limited' when the session has used up its speculations for this turn.
+        """
+        with self.lock:
+            self.expire()
+            current = self.entries.get(owner)
+            if current is not None and current.key == key:
+                return 'running'
+            if self.turns.get(owner, 0) >= self.max_per_turn:
+                self.counts['limited'] += 1
+                return 'limited'
+            if current is not None:
+                self.drop(current, 'replaced')
+            self.entries[owner] = Speculation(key, submit())
+            self.turns[owner] = self.turns.get(owner, 0) + 1
+            self.counts['started'] += 1
+            return 'started'
+
+    def claim(self, owner, key):
+        """The future of `owner`'s speculation if it was made for the request `key`, else None.
+
+        Either way the turn is over: the speculation is removed and the per-turn limit resets.
+        """
+        with self.lock:
+            self.turns.pop(owner, None)
+            current = self.entries.pop(owner, None)
+            if current is None:
+                return None
+            if current.key != key or time.monotonic() - current.started > self.ttl:
+                self.drop(current, 'misses')
+                return None
+            self.counts['hits'] += 1
+            return current.future
+
+    def expire(self):
+        now = time.monotonic()
+        for owner, speculation in list(self.entries.items()):
+            if now - speculation.started > self.ttl:
+                del self.entries[owner]
+                self.turns.pop(owner, None)
+                self.drop(speculation, 'expired')
+
+    def drop(self, speculation, reason):
+        self.counts[reason] += 1
+        if not speculation.future.cancel():
+            self.counts['wasted'] += 1
+
+    def stats(self):
+        with self.lock:
+            counts = dict(self.counts)
+            active = len(self.entries)
+        decided = counts['hits'] + counts['misses']
+        return dict(counts, active=active, hit_rate=round(counts['hits'] / decided, 3) if decided else None)
@@ -0,0 +1,82 @@
+"""Cache of the logged-in user for Flask-Login's `user_loader`.
+
+Requests read the user through `current_user` (prompt building, templates,
+ownership checks), but almost never write it. So `load_user` serves a
+read-only `UserSnapshot` from this cache instead of querying the user table
+on every request. Code that changes a user row must update or invalidate its
+entry. With the per-worker 'memory' backend, other workers can serve a stale
+snapshot for up to the TTL; use the 'sqlite' backend to share invalidations.
+"""
+from response_cache import CountingCache, cache_key, create_backend
+
+
+class UserSnapshot:
+    """Immutable copy of the User columns that requests read, usable as `current_user`."""
+
+    __slots__ = ('id', 'first_name', 'last_name', 'email', 'german_level', 'target_language', 'native_language',
+                 'progress', 'xp')
+
+    is_authenticated = True
+    is_active = True
+    is_anonymous = False
+
+    def __init__(self, **values):
+        for name in self.__slots__:
+            object.__setattr__(self, name, values.get(name))
+
+    @classmethod
+    def from_user(cls, user):
+        return cls(**{name: getattr(user, name) for name in cls.__slots__})
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"UserSnapshot is read-only; update the User row and invalidate the cache ({name})")
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def get_id(self):
+        return str(self.id)
+
+    def __eq__(self, other):
+        return isinstance(other, UserSnapshot) and self.to_dict() == other.to_dict()
+
+    def __repr__(self):
+        return f"<UserSnapshot {self.id}>"
+
+
+class UserCache(CountingCache):
+    """TTL/LRU cache of `UserSnapshot`s keyed by user id, with hit/miss counters."""
+
+    def __init__(self, backend, ttl=60):
+        super().__init__(backend, ttl)
+
+    def key(self, user_id):
+        return cache_key('user', user_id)
+
+    def get(self, user_id, load):
+        """Return the snapshot for `user_id`, calling `load(user_id)` for the User row on a miss."""
+        values = self.lookup(self.key(user_id))
+        if values is not None:
+            return UserSnapshot(**values)
+        user = load(user_id)
+        if user is None:
+            return None
+        snapshot = UserSnapshot.from_user(user)
+        self.backend.set(self.key(user_id), snapshot.to_dict(), self.ttl)
+        return snapshot
+
+    def update(self, user_id, values):
+        """Overwrite some fields of a cached snapshot; does nothing if the user is not cached."""
+        current = self.backend.get(self.key(user_id))
+        if current is not None:
+            self.backend.set(self.key(user_id), dict(current, **values), self.ttl)
+
+    def invalidate(self, user_id):
+        self.backend.delete(self.key(user_id))
+
+
+def create_user_cache(backend, ttl, max_entries, path=None):
+    """Build a `UserCache` from config values; returns None when backend is 'none'."""
+    if backend == 'none':
+        return None
+    return UserCache(create_backend(backend, max_entries, path, 'user cache'), ttl)
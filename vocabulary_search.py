@@ -0,0 +1,193 @@
+"""Server-side search over a user's vocabulary, backed by SQLite FTS5.
+
+Two FTS5 tables shadow the `vocabulary` table. They share its rowid and are
+kept in sync by triggers, so every write path stays covered: the single and
+batch add endpoints, the corrections saved by /practice/api, deletes, and
+edits made outside the app.
+
+    vocabulary_fts      owner, word, correction, explanation
+                        unicode61 tokens with case and diacritics folded,
+                        prefix indexes: word and prefix search, bm25 ranking
+    vocabulary_trigram  owner, terms (word + correction)
+                        trigram tokens: candidates for typo-tolerant matching
+
+The tokenizer folds case and strips diacritics (ä -> a), but it leaves ß
+alone, so the triggers store ß as "ss" and `fold` does the same to queries.
+A search first runs the word/prefix query. bm25 has to score every match, so
+a term found in thousands of rows ("plural" in the explanations) is ranked
+within its newest `RANK_WINDOW` matches only. If the query finds nothing, the
+trigram table proposes rows sharing three-letter sequences with it, using only
+its rarest trigrams (looked up in vocabulary_trigram_terms) so that a common
+one like "sch" does not pull in half the table. Candidates are kept when their
+word or correction is similar enough (trigram Jaccard similarity,
+`min_similarity`).
+
+The tables are created with `vocabulary` by `db.create_all()`. Existing
+databases get them, backfilled, from migration 0004 in migrate_db.py. Other
+databases than SQLite have no index, and app.py falls back to a LIKE scan.
+"""
+import re
+import unicodedata
+
+from sqlalchemy import DDL, bindparam, event, text
+
+TOKEN = re.compile(r'\w+')
+FTS_WEIGHTS = (0.0, 10.0, 6.0, 1.0)  # bm25 weights of owner, word, correction, explanation
+MAX_QUERY_TOKENS = 8
+RANK_WINDOW = 1000
+
+
+def fold_sql(column):
+    return f"replace(replace({column}, 'ß', 'ss'), 'ẞ', 'ss')"
+
+
+TERMS = "word || ' ' || correction"
+NEW_TERMS = "new.word || ' ' || new.correction"
+# Only edits to indexed columns: review grading updates rows constantly and must not reindex them
+UPDATE_TRIGGER = f"""CREATE TRIGGER IF NOT EXISTS vocabulary_search_update
+    AFTER UPDATE OF user_id, word, correction, explanation ON vocabulary BEGIN
+        DELETE FROM vocabulary_fts WHERE rowid = old.id;
+        DELETE FROM vocabulary_trigram WHERE rowid = old.id;
+        INSERT INTO vocabulary_fts (rowid, owner, word, correction, explanation)
+        VALUES (new.id, 'u' || new.user_id, {fold_sql('new.word')}, {fold_sql('new.correction')}, {fold_sql('new.explanation')});
+        INSERT INTO vocabulary_trigram (rowid, owner, terms)
+        VALUES (new.id, '<' || new.user_id || '>', {fold_sql(NEW_TERMS)});
+    END"""
+INDEX_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS vocabulary_fts USING fts5("
+    "owner, word, correction, explanation, tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+    "CREATE VIRTUAL TABLE IF NOT EXISTS vocabulary_trigram USING fts5(owner, terms, tokenize='trigram')",
+    "CREATE VIRTUAL TABLE IF NOT EXISTS vocabulary_trigram_terms USING fts5vocab(vocabulary_trigram, row)",
+    f"""CREATE TRIGGER IF NOT EXISTS vocabulary_search_insert AFTER INSERT ON vocabulary BEGIN
+        INSERT INTO vocabulary_fts (rowid, owner, word, correction, explanation)
+        VALUES (new.id, 'u' || new.user_id, {fold_sql('new.word')}, {fold_sql('new.correction')}, {fold_sql('new.explanation')});
+        INSERT INTO vocabulary_trigram (rowid, owner, terms)
+        VALUES (new.id, '<' || new.user_id || '>', {fold_sql(NEW_TERMS)});
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS vocabulary_search_delete AFTER DELETE ON vocabulary BEGIN
+        DELETE FROM vocabulary_fts WHERE rowid = old.id;
+        DELETE FROM vocabulary_trigram WHERE rowid = old.id;
+    END""",
+    UPDATE_TRIGGER,
+]
+BACKFILL = [
+    "DELETE FROM vocabulary_fts",
+    "DELETE FROM vocabulary_trigram",
+    f"INSERT INTO vocabulary_fts (rowid, owner, word, correction, explanation) SELECT id, 'u' || user_id, "
+    f"{fold_sql('word')}, {fold_sql('correction')}, {fold_sql('explanation')} FROM vocabulary",
+    f"INSERT INTO vocabulary_trigram (rowid, owner, terms) SELECT id, '<' || user_id || '>', "
+    f"{fold_sql(TERMS)} FROM vocabulary",
+]
+
+
+def install_search_index(table):
+    """Create the search tables and triggers whenever `table` (vocabulary) is created on SQLite."""
+    for statement in INDEX_DDL:
+        event.listen(table, 'after_create', DDL(statement).execute_if(dialect='sqlite'))
+
+
+def create_search_index(conn):
+    """Create the search tables and triggers on an existing database and index every row; returns the row count."""
+    for statement in INDEX_DDL:
+        conn.execute(text(statement))
+    for statement in BACKFILL:
+        conn.execute(text(statement))
+    return conn.execute(text("SELECT count(*) FROM vocabulary_fts")).scalar()
+
+
+def fold(value):
+    """Case-folded text without diacritics: 'Straße' -> 'strasse', 'Mädchen' -> 'madchen'."""
+    decomposed = unicodedata.normalize('NFKD', value.casefold())
+    return ''.join(c for c in decomposed if not unicodedata.combining(c))
+
+
+def trigrams(value):
+    padded = f"  {value} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def similarity(a, b):
+    """Jaccard similarity of the padded trigrams of two folded strings."""
+    x, y = trigrams(a), trigrams(b)
+    return len(x & y) / len(x | y) if x and y else 0.0
+
+
+def quote(value):
+    return '"' + value.replace('"', '""') + '"'
+
+
+def fts_query(user_id, query):
+    """MATCH expression for the words of `query` as prefixes, within one user's rows; None if it has no words."""
+    tokens = TOKEN.findall(fold(query))[:MAX_QUERY_TOKENS]
+    if not tokens:
+        return None
+    words = ' AND '.join(quote(token) + '*' for token in tokens)
+    return f'owner:"u{user_id}" AND {{word correction explanation}}: ({words})'
+
+
+def query_trigrams(query):
+    """Trigrams of the words of `query`, with and without its umlauts."""
+    return {gram for form in (query.casefold(), fold(query)) for word in TOKEN.findall(form) if len(word) >= 3
+            for gram in (word[i:i + 3] for i in range(len(word) - 2))}
+
+
+def trigram_query(user_id, grams):
+    """MATCH expression for one user's rows sharing any of `grams`; None if there are none."""
+    if not grams:
+        return None
+    return f'owner:"<{user_id}>" AND terms: ({" OR ".join(quote(gram) for gram in sorted(grams))})'
+
+
+class VocabularySearch:
+    def __init__(self, min_similarity=0.3, fuzzy_candidates=200, fuzzy_postings=3000):
+        self.min_similarity = min_similarity
+        self.fuzzy_candidates = fuzzy_candidates
+        self.fuzzy_postings = fuzzy_postings
+
+    def search(self, session, user_id, query, limit):
+        """[(vocabulary id, 'fts' | 'fuzzy'), ...] best first, at most `limit`."""
+        match = fts_query(user_id, query)
+        if match is None:
+            return []
+        newest = session.execute(text(
+            "SELECT rowid FROM vocabulary_fts WHERE vocabulary_fts MATCH :match ORDER BY rowid DESC LIMIT :window"
+        ), {'match': match, 'window': RANK_WINDOW}).scalars().all()
+        if not newest:
+            return [(id, 'fuzzy') for id in self.fuzzy(session, user_id, query, limit)]
+        rows = session.execute(text(
+            f"SELECT rowid FROM vocabulary_fts WHERE vocabulary_fts MATCH :match AND rowid >= :floor "
+            f"ORDER BY bm25(vocabulary_fts, {', '.join(map(str, FTS_WEIGHTS))}), rowid DESC LIMIT :limit"
+        ), {'match': match, 'floor': newest[-1], 'limit': limit}).scalars().all()
+        return [(id, 'fts') for id in rows]
+
+    def rare_trigrams(self, session, grams):
+        """The rarest of `grams`, as many as fit in `fuzzy_postings` indexed rows, and at least one."""
+        if not grams:
+            return set()
+        counts = dict(session.execute(
+            text("SELECT term, doc FROM vocabulary_trigram_terms WHERE term IN :grams").bindparams(bindparam('grams', expanding=True)),
+            {'grams': sorted(grams)}).all())
+        chosen, total = set(), 0
+        for gram in sorted((gram for gram in grams if gram in counts), key=counts.get):
+            if chosen and total + counts[gram] > self.fuzzy_postings:
+                break
+            chosen.add(gram)
+            total += counts[gram]
+        return chosen
+
+    def fuzzy(self, session, user_id, query, limit):
+        """Ids of rows whose word or correction is similar to `query`, most similar first."""
+        match = trigram_query(user_id, self.rare_trigrams(session, query_trigrams(query)))
+        if match is None:
+            return []
+        candidates = session.execute(text(
+            "SELECT rowid, terms FROM vocabulary_trigram WHERE vocabulary_trigram MATCH :match ORDER BY rank LIMIT :limit"
+        ), {'match': match, 'limit': self.fuzzy_candidates}).all()
+        wanted = fold(query)
+        scored = []
+        for id, terms in candidates:
+            score = max([similarity(wanted, fold(terms))] + [similarity(wanted, fold(word)) for word in terms.split()])
+            if score >= self.min_similarity:
+                scored.append((score, id))
+        scored.sort(key=lambda item: (-item[0], -item[1]))
+        return [id for _, id in scored[:limit]]
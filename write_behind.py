@@ -0,0 +1,213 @@
+import atexit
+import glob
+import json
+import os
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows: journals of crashed workers are only replayed by the same pid
+    fcntl = None
+
+
+class WriteBehindQueue:
+    """In-process write-behind buffer with an append-only journal.
+
+    `put` appends the record to this worker's journal file and to an in-memory
+    queue, then returns immediately. A background thread hands batches to
+    `flush(records, replayed)` every `interval` seconds, or as soon as
+    `max_batch` records are waiting. After each successful flush the journal
+    is compacted to the records still queued: truncated when none are, else
+    rewritten to a temporary file that replaces it, so it stays bounded by the
+    queue under sustained load.
+
+    On start, journals left behind by workers that died are replayed with
+    `replayed=True`: every record after the last checkpoint is flushed again.
+    Delivery is therefore at-least-once, and `flush` should skip records it
+    has already applied when `replayed` is set. Journal writes are flushed to
+    the OS, which survives a process crash; pass `fsync=True` to also survive
+    power loss.
+
+    Failed flushes and replays are reported to `logger(event, **fields)`,
+    e.g. the `error` method of a logs.SampledLogger.
+    """
+
+    def __init__(self, flush, journal_dir, logger, interval=0.05, max_batch=200, fsync=False):
+        self.flush = flush
+        self.journal_dir = journal_dir
+        self.interval = interval
+        self.max_batch = max_batch
+        self.fsync = fsync
+        self.log = logger
+        self.queue = []
+        self.seq = 0
+        self.lock = threading.Lock()
+        self.wakeup = threading.Condition(self.lock)
+        self.closed = False
+        self.thread = None
+        self.journal = None
+        self.journal_path = None
+        self.flushed = 0
+        self.flushes = 0
+        self.failures = 0
+        self.replayed = 0
+        self.last_flush_seconds = 0.0
+        self.max_flush_seconds = 0.0
+        self.total_flush_seconds = 0.0
+
+    def start(self):
+        os.makedirs(self.journal_dir, exist_ok=True)
+        self.journal_path = os.path.join(self.journal_dir, f"activity-{os.getpid()}.log")
+        self.journal = open(self.journal_path, 'a+', encoding='utf-8')
+        if fcntl is not None:
+            try:
+                fcntl.flock(self.journal, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                self.journal.close()
+                raise RuntimeError(
+                    f"Activity journal {self.journal.name} is locked by another write-behind queue with pid {os.getpid()}: "
+                    f"either the app was started twice in this process, or another container with the same pid shares "
+                    f"this directory. Give every worker its own ACTIVITY_JOURNAL_DIR.") from None
+        self.replay_orphans()
+        self.thread = threading.Thread(target=self.run, name='activity-write-behind', daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+        return self
+
+    def put(self, record):
+        with self.lock:
+            if self.closed:
+                raise RuntimeError("write-behind queue is closed")
+            self.seq += 1
+            self.journal.write(journal_line(self.seq, record))
+            self.journal.flush()
+            if self.fsync:
+                os.fsync(self.journal.fileno())
+            self.queue.append((self.seq, record))
+            if len(self.queue) >= self.max_batch:
+                self.wakeup.notify()
+
+    def run(self):
+        while True:
+            with self.lock:
+                if not self.closed and len(self.queue) < self.max_batch:
+                    self.wakeup.wait(self.interval)
+                if self.closed and not self.queue:
+                    return
+            if not self.drain_once():
+                if self.closed:
+                    return  # left in the journal for the next start to replay
+                time.sleep(self.interval)
+
+    def drain_once(self):
+        """Flush up to `max_batch` queued records; returns False if the flush failed."""
+        with self.lock:
+            batch = self.queue[:self.max_batch]
+        if not batch:
+            return True
+        start = time.perf_counter()
+        try:
+            self.flush([record for _, record in batch], False)
+        except Exception as e:
+            self.failures += 1
+            self.log('activity_flush_failed', count=len(batch), error=str(e))
+            return False
+        elapsed = time.perf_counter() - start
+        with self.lock:
+            del self.queue[:len(batch)]
+            self.compact()
+            self.flushed += len(batch)
+            self.flushes += 1
+            self.last_flush_seconds = elapsed
+            self.max_flush_seconds = max(self.max_flush_seconds, elapsed)
+            self.total_flush_seconds += elapsed
+        return True
+
+    def compact(self):
+        """Drop flushed records from the journal; called with the lock held, after a flush."""
+        if not self.queue:
+            self.journal.truncate(0)
+            self.journal.seek(0)
+            return
+        # Written aside and renamed over the journal, so a crash midway leaves one of the two whole
+        compacted = open(self.journal_path + '.tmp', 'w', encoding='utf-8')
+        if fcntl is not None:
+            fcntl.flock(compacted, fcntl.LOCK_EX)
+        compacted.writelines(journal_line(seq, record) for seq, record in self.queue)
+        compacted.flush()
+        if self.fsync:
+            os.fsync(compacted.fileno())
+        os.replace(compacted.name, self.journal_path)
+        self.journal.close()
+        self.journal = compacted
+
+    def replay_orphans(self):
+        own = os.path.realpath(self.journal_path)
+        for path in sorted(glob.glob(os.path.join(self.journal_dir, 'activity-*.log'))):
+            if os.path.realpath(path) == own:
+                continue
+            with open(path, 'r+', encoding='utf-8') as journal:
+                if fcntl is not None:
+                    try:
+                        fcntl.flock(journal, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    except OSError:
+                        continue  # owned by a live worker
+                records = pending_records(journal)
+                try:
+                    for i in range(0, len(records), self.max_batch):
+                        self.flush(records[i:i + self.max_batch], True)
+                except Exception as e:
+                    self.log('activity_replay_failed', journal=os.path.basename(path), error=str(e), hint='will retry on next start')
+                    continue
+            os.remove(path)
+            self.replayed += len(records)
+            if records:
+                self.log('activity_journal_replayed', journal=os.path.basename(path), count=len(records))
+
+    def close(self):
+        """Stop accepting records, drain the queue and release the journal."""
+        with self.lock:
+            if self.closed:
+                return
+            self.closed = True
+            self.wakeup.notify()
+        if self.thread is not None:
+            self.thread.join(timeout=10)
+        if self.journal is not None:
+            empty = not self.queue
+            self.journal.close()
+            if empty:
+                os.remove(self.journal_path)
+
+    def metrics(self):
+        return {
+            'depth': len(self.queue),
+            'flushed': self.flushed,
+            'flushes': self.flushes,
+            'failures': self.failures,
+            'replayed': self.replayed,
+            'last_flush_ms': round(self.last_flush_seconds * 1000, 3),
+            'max_flush_ms': round(self.max_flush_seconds * 1000, 3),
+            'avg_flush_ms': round(self.total_flush_seconds / self.flushes * 1000, 3) if self.flushes else 0.0,
+        }
+
+
+def journal_line(seq, record):
+    return json.dumps({'seq': seq, 'record': record}) + '\n'
+
+
+def pending_records(journal):
+    """Records in a journal file that come after its last checkpoint."""
+    journal.seek(0)
+    entries, checkpoint = [], 0
+    for line in journal:
+        try:
+            entry = json.loads(line)
+        except ValueError:
+            break  # torn final write
+        if 'checkpoint' in entry:
+            checkpoint = entry['checkpoint']
+        else:
+            entries.append(entry)
+    return [entry['record'] for entry in entries if entry['seq'] > checkpoint]